@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import depends_dag
+import depends_node
+import depends_engine
+import depends_chunk_policy
+import depends_data_packet
+
+
+"""
+Measures the cost of starting a task per chunk of frames.  A node making a
+sequence of frames with a trivial command per frame is executed with the
+Parallel Output Recipe, with its frames split into chunks of each of a
+range of sizes (see depends_chunk_policy.FixedChunkPolicy).  The command is
+timed both as the bash builtin 'true', so a chunk's frames run in the one
+process of its task, and as '/bin/true', so each frame still starts a
+process of its own.  The best of a few runs of each is reported.
+
+Exits with status 1 if any command failed.
+"""
+
+
+###############################################################################
+###############################################################################
+class DagNodeTrivialFrames(depends_node.DagNode):
+    """
+    A node running a given command once for each frame of its output.
+    """
+
+    def _defineInputs(self):
+        return []
+
+    def _defineOutputs(self):
+        return [depends_node.DagNodeOutput('File', depends_data_packet.DataPacketTextFile)]
+
+    def _defineAttributes(self):
+        return []
+
+    def isEmbarrassinglyParallel(self):
+        return True
+
+    def executeList(self, dataPacketDict, splitOperations=False):
+        frameList = self.outputFramespec('File', 'filename').frames()
+        if not splitOperations:
+            return ["for", "f", "in", " ".join(frameList), ";", "do", self.command, ";", "done"]
+        return [[self.command] for x in frameList]
+
+
+###############################################################################
+## Utility
+###############################################################################
+def trivialDag(command, frameCount, directory):
+    """
+    Return a DAG holding a single node running the given command for each
+    of the given number of frames, and the node.
+    """
+    dag = depends_dag.DAG()
+    dagNode = DagNodeTrivialFrames(name="trivial")
+    dagNode.command = command
+    dag.addNode(dagNode)
+    dagNode.setOutputValue('File', 'filename', os.path.join(directory, "trivial.####.txt"))
+    dagNode.setOutputRange('File', ('1', str(frameCount)))
+    return (dag, dagNode)
+
+
+def bestSeconds(command, frameCount, chunkSize, runCount):
+    """
+    Return the best wall time, out of the given number of runs, of executing
+    the frames of a trivial node in chunks of the given size, and whether
+    every run succeeded.
+    """
+    directory = tempfile.mkdtemp(prefix="benchChunking_")
+    (dag, dagNode) = trivialDag(command, frameCount, directory)
+    plan = depends_engine.executionPlan(dag, [dagNode], splitFrames=True,
+                                        chunkPolicy=depends_chunk_policy.FixedChunkPolicy(chunkSize))
+    best = None
+    succeeded = True
+    oldStdout = sys.stdout
+    try:
+        for i in range(runCount):
+            recipe = depends_engine.outputRecipeNamed("Parallel Output Recipe")
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                startTime = time.time()
+                recipe.generatePlan(plan, directory, executeImmediately=True)
+                seconds = time.time() - startTime
+            finally:
+                sys.stdout.close()
+                sys.stdout = oldStdout
+            succeeded = succeeded and not recipe.executionFailed
+            best = seconds if best is None else min(best, seconds)
+    finally:
+        shutil.rmtree(directory)
+    return (best, succeeded)
+
+
+###############################################################################
+## Main starts here...
+###############################################################################
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('--frames', action='store', type='int', dest='frames', help='The number of frames to execute', default=512)
+    parser.add_option('--workers', action='store', type='int', dest='workers', help='The number of commands to run at once', default=8)
+    parser.add_option('--runs', action='store', type='int', dest='runs', help='The number of times to time each', default=3)
+    parser.add_option('--sizes', action='store', type='string', dest='sizes', help='The chunk sizes to time, separated by commas', default="1,2,4,8,16,32,64")
+    (options, args) = parser.parse_args()
+
+    depends_engine.setupStartupVariables()
+    depends_engine.loadPlugins(includeFileDialogs=False)
+    depends_node.registerNodeType(DagNodeTrivialFrames)
+    os.environ['DEPENDS_PARALLEL_WORKERS'] = str(options.workers)
+
+    sizeList = [int(x) for x in options.sizes.split(",")]
+    print "Spawn overhead for %d frames of a trivial command, parallel recipe with %d workers (best of %d):" % (options.frames, options.workers, options.runs)
+    print
+    print "  %-11s" % "chunk size" + "".join("%6d" % x for x in sizeList)
+    allSucceeded = True
+    for (label, command) in [("true (bash)", "true"), ("/bin/true", "/bin/true")]:
+        secondsList = list()
+        for chunkSize in sizeList:
+            (seconds, succeeded) = bestSeconds(command, options.frames, chunkSize, options.runs)
+            secondsList.append(seconds)
+            allSucceeded = allSucceeded and succeeded
+        print "  %-11s" % label + "".join("%6.2f" % x for x in secondsList) + " s"
+    sys.exit(0 if allSucceeded else 1)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import re
+import sys
+import random
+import timeit
+import optparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import depends_util
+
+
+"""
+Compares depends_util.framespec's frame template substitution with the
+replaceFrameSymbols() it replaced (kept below as legacyReplaceFrameSymbols),
+which searched the filename again after every substitution.  The two are
+first checked to give the same filenames for random strings of frame
+symbols, escapes, and literal characters, and then timed expanding long
+sequences: the old frames(), the new frames(), iterFrames(), and frame(i)
+for every frame.  The best of a few runs is reported.
+
+Exits with status 1 if the two ever disagree.
+"""
+
+
+###############################################################################
+## Utility
+###############################################################################
+def legacyReplaceFrameSymbols(replaceString, frameNumber):
+    """
+    framespec.replaceFrameSymbols() as it was.
+    """
+    matchObj = re.finditer(r'((?<!\\)\#+)', replaceString)
+    i = next(matchObj, None)
+    while i:
+        padString = "%s" % str(frameNumber).zfill(len(i.group(0)))
+        replaceString = replaceString[:i.start()] + padString + replaceString[i.end():]
+        matchObj = re.finditer(r'((?<!\\)\#+)', replaceString)
+        i = next(matchObj, None)
+    replaceString = replaceString.replace('\#', '#')
+    return replaceString
+
+
+def legacyFrames(fileSpec):
+    """
+    framespec.frames() as it was.
+    """
+    if fileSpec.startFrame is None or fileSpec.endFrame is None:
+        return [fileSpec.filename]
+    return [legacyReplaceFrameSymbols(fileSpec.filename, i) for i in range(fileSpec.startFrame, fileSpec.endFrame+1)]
+
+
+def mismatches(stringCount, seed):
+    """
+    Return a list of the (string, frame) pairs, out of the given number of
+    random ones, for which the two substitutions disagree.
+    """
+    rand = random.Random(seed)
+    alphabet = ['#', '#', '\\', 'a', '%', '.', '/', 'x', '%d', '\\#']
+    mismatchList = list()
+    for i in range(stringCount):
+        fileString = "".join(rand.choice(alphabet) for j in range(rand.randrange(12)))
+        frameNumber = rand.randrange(-200, 200000)
+        if legacyReplaceFrameSymbols(fileString, frameNumber) != depends_util.framespec.replaceFrameSymbols(fileString, frameNumber):
+            mismatchList.append((fileString, frameNumber))
+        fileSpec = depends_util.framespec(fileString, (1, 1 + rand.randrange(20)))
+        if legacyFrames(fileSpec) != fileSpec.frames():
+            mismatchList.append((fileString, None))
+    return mismatchList
+
+
+def bestMilliseconds(function, runCount):
+    """
+    Return the fewest milliseconds calling the given function took in the
+    given number of runs.
+    """
+    return min(timeit.repeat(function, number=1, repeat=runCount)) * 1000.0
+
+
+###############################################################################
+## Main starts here...
+###############################################################################
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('--frames', action='store', type='int', dest='frames', help='The number of frames in each timed sequence', default=200000)
+    parser.add_option('--runs', action='store', type='int', dest='runs', help='The number of times to time each', default=3)
+    parser.add_option('--strings', action='store', type='int', dest='strings', help='The number of random strings to compare on', default=20000)
+    (options, args) = parser.parse_args()
+
+    mismatchList = mismatches(options.strings, 0)
+    for (fileString, frameNumber) in mismatchList[:20]:
+        print "Mismatch:", repr(fileString), frameNumber
+    print "%d random strings compared, %d mismatches." % (options.strings, len(mismatchList))
+
+    frameCount = options.frames
+    for fileString in ["/render/shot010/beauty.####.exr", "/render/s##/v###/l.####.exr"]:
+        fileSpec = depends_util.framespec(fileString, (1, frameCount))
+        print "%s, %d frames:" % (fileString, frameCount)
+        print "  old frames()       %6.0f ms" % bestMilliseconds(lambda: legacyFrames(fileSpec), options.runs)
+        print "  new frames()       %6.0f ms" % bestMilliseconds(lambda: fileSpec.frames(), options.runs)
+        print "  iterFrames()       %6.0f ms" % bestMilliseconds(lambda: sum(1 for x in fileSpec.iterFrames()), options.runs)
+        print "  frame(i) for all   %6.0f ms" % bestMilliseconds(lambda: [fileSpec.frame(i) for i in xrange(frameCount)], options.runs)
+    sys.exit(1 if mismatchList else 0)
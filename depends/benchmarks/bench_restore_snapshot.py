@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import sys
+import time
+import uuid
+import optparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import depends_dag
+import depends_engine
+
+
+"""
+Times DAG.restoreSnapshot() on generated workflows of increasing size, to
+show that loading scales linearly with the number of nodes.  Each workflow
+is made of chains of ten nodes (an Ls node feeding nine Awk nodes), with
+every chain in a group.  The best of a few runs is reported for each size,
+along with the time per node; linear scaling keeps the time per node flat.
+"""
+
+
+###############################################################################
+## Utility
+###############################################################################
+def workflowSnapshot(nodeCount):
+    """
+    Return a snapshot dict (see DAG.snapshot) of a workflow with the given
+    number of nodes.
+    """
+    nodeList = list()
+    edgeList = list()
+    groupList = list()
+    for i in range(nodeCount):
+        nodeId = str(uuid.uuid4())
+        if i % 10 == 0:
+            nodeList.append({"NAME": "ls%d" % i, "TYPE": "DagNodeLs", "UUID": nodeId, "STALE": "False",
+                             "INPUTS": [],
+                             "OUTPUTS": [{"NAME": "File", "VALUE": {"filename": "/tmp/f%d.txt" % i}, "RANGE": None}],
+                             "ATTRIBUTES": [{"NAME": "listPath", "VALUE": "/", "RANGE": None}]})
+            groupList.append({"NAME": "chain%d" % i, "NODES": [nodeId]})
+        else:
+            previousId = nodeList[-1]["UUID"]
+            nodeList.append({"NAME": "awk%d" % i, "TYPE": "DagNodeAwk", "UUID": nodeId, "STALE": "False",
+                             "INPUTS": [{"NAME": "File", "VALUE": "::%s:File" % previousId, "RANGE": None}],
+                             "OUTPUTS": [{"NAME": "File", "VALUE": {"filename": "/tmp/f%d.txt" % i}, "RANGE": None}],
+                             "ATTRIBUTES": [{"NAME": "command", "VALUE": "{print}", "RANGE": None}]})
+            edgeList.append({"FROM": previousId, "TO": nodeId})
+            groupList[-1]["NODES"].append(nodeId)
+    return {"NODES": nodeList, "EDGES": edgeList, "GROUPS": groupList}
+
+
+def restoreSeconds(snapshotDict, runCount):
+    """
+    Return the fewest seconds restoring the given snapshot into a new DAG
+    took in the given number of runs.
+    """
+    bestSeconds = None
+    for run in range(runCount):
+        dag = depends_dag.DAG()
+        startTime = time.time()
+        dag.restoreSnapshot(snapshotDict)
+        seconds = time.time() - startTime
+        if bestSeconds is None or seconds < bestSeconds:
+            bestSeconds = seconds
+        del dag
+    return bestSeconds
+
+
+###############################################################################
+## Main starts here...
+###############################################################################
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] [NODECOUNT ...]")
+    parser.add_option('--runs', action='store', type='int', dest='runs', help='The number of times to restore each workflow', default=3)
+    (options, args) = parser.parse_args()
+    nodeCounts = [int(x) for x in args] if args else [1000, 2000, 4000, 8000, 16000]
+
+    depends_engine.setupStartupVariables()
+    depends_engine.loadPlugins(includeFileDialogs=False)
+
+    perNodeList = list()
+    for nodeCount in nodeCounts:
+        seconds = restoreSeconds(workflowSnapshot(nodeCount), options.runs)
+        perNodeList.append(seconds / nodeCount)
+        print "%6d nodes: %7.3fs (%4.0f us/node)" % (nodeCount, seconds, seconds / nodeCount * 1e6)
+    if len(perNodeList) > 1:
+        print "Time per node at %d nodes is %.2fx that at %d nodes." % (nodeCounts[-1], perNodeList[-1] / perNodeList[0], nodeCounts[0])
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import optparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import depends_dag
+import depends_node
+import depends_engine
+import depends_file_cache
+import depends_data_packet
+
+
+"""
+Compares DAG.orderedNodeDependenciesAt() with the implementation it replaced
+(a reversed breadth-first collection of data packets, kept below as
+legacyOrderedNodeDependenciesAt) on random DAGs of nodes with one or two
+inputs and some outputs already on disk, over every combination of the
+function's flags.  The two must find the same nodes, and the order the
+current one returns must put every provider before its consumers.  The old
+order is allowed to differ (it broke that rule in diamond-shaped graphs),
+so how often the orders match is only reported.  Finally both are timed on
+a long chain of nodes.
+
+Exits with status 1 if any query found different nodes or an order that
+breaks a dependency.
+"""
+
+
+###############################################################################
+###############################################################################
+class DagNodeJoin(depends_node.DagNode):
+    """
+    A node joining one or two text files, for making DAGs with diamonds.
+    """
+
+    def _defineInputs(self):
+        return [depends_node.DagNodeInput('A', depends_data_packet.DataPacketTextFile, True),
+                depends_node.DagNodeInput('B', depends_data_packet.DataPacketTextFile, False)]
+
+    def _defineOutputs(self):
+        return [depends_node.DagNodeOutput('File', depends_data_packet.DataPacketTextFile)]
+
+    def _defineAttributes(self):
+        return []
+
+    def executeList(self, dataPacketDict, splitOperations=False):
+        return ["cat", self.inputValue('A'), self.inputValue('B'), ">", self.outputValue('File', 'filename')]
+
+
+###############################################################################
+## Utility
+###############################################################################
+def legacyNodeOrderedDataPackets(dag, dagNode, onlyUnfulfilled=False, onlyFulfilled=False):
+    """
+    DAG.nodeOrderedDataPackets() as it was, building the node's whole upstream
+    scenegraph for each call.
+    """
+    validDataPackets = list()
+    orderedDataPackets = dag.buildSceneGraph(dagNode)
+    scenegraphInputAndConnectedNode = [(i, dag.nodeInputComesFromNode(dagNode, i)[0]) for i in dagNode.inputs()]
+    for dataPacket in orderedDataPackets:
+        if dataPacket.sourceNode is dagNode:
+            continue
+        if dataPacket.sourceNode not in [i[1] for i in scenegraphInputAndConnectedNode]:
+            continue
+        if onlyFulfilled and not dataPacket.dataPresent():
+            continue
+        if onlyUnfulfilled and dataPacket.dataPresent():
+            continue
+        input = None
+        for i in scenegraphInputAndConnectedNode:
+            if i[1] == dataPacket.sourceNode:
+                input = i[0]
+        validDataPackets.append((input, dataPacket))
+    return validDataPackets
+
+
+def legacyOrderedNodeDependenciesAt(dag, dagNode, includeGivenNode=True, onlyUnfulfilled=True, recursion=True):
+    """
+    DAG.orderedNodeDependenciesAt() as it was.
+    """
+    requiredDataPackets = [x[1] for x in legacyNodeOrderedDataPackets(dag, dagNode, onlyUnfulfilled=onlyUnfulfilled)]
+    i = 0
+    while i < len(requiredDataPackets):
+        packet = requiredDataPackets[i]
+        packetRdp = [x[1] for x in legacyNodeOrderedDataPackets(dag, packet.sourceNode, onlyUnfulfilled=onlyUnfulfilled)]
+        for p in packetRdp:
+            if p.sourceNode in [dp.sourceNode for dp in requiredDataPackets]:
+                continue
+            if recursion:
+                requiredDataPackets.append(p)
+        i += 1
+    inOrderNodes = [dp.sourceNode for dp in reversed(requiredDataPackets)]
+    if includeGivenNode:
+        inOrderNodes.append(dagNode)
+    return inOrderNodes
+
+
+def outputLocation(dagNode, outputName):
+    """
+    The input value connecting an input to the given output of the given node.
+    """
+    return "::%s:%s" % (dagNode.uuid, outputName)
+
+
+def randomDag(nodeCount, seed, directory, presentFraction):
+    """
+    Return a random DAG of the given number of nodes (and a list of them) whose
+    output files are in the given directory, the given fraction of which
+    exist.  Most nodes join the outputs of one or two earlier nodes.
+    """
+    rand = random.Random(seed)
+    dag = depends_dag.DAG()
+    nodeList = list()
+    for i in range(nodeCount):
+        if i == 0 or rand.random() < 0.15:
+            dagNode = depends_node.DagNodeLs(name="n%d" % i)
+        else:
+            dagNode = DagNodeJoin(name="n%d" % i)
+        fileName = os.path.join(directory, "f%d.txt" % i)
+        dagNode.setOutputValue('File', 'filename', fileName)
+        if rand.random() < presentFraction:
+            open(fileName, 'w').close()
+        dag.addNode(dagNode)
+        if isinstance(dagNode, DagNodeJoin):
+            for inputName in ['A', 'B']:
+                if inputName == 'B' and rand.random() < 0.4:
+                    continue
+                sourceNode = nodeList[rand.randrange(len(nodeList))]
+                if sourceNode not in dag.nodeConnectionsIn(dagNode):
+                    dag.connectNodes(sourceNode, dagNode)
+                dagNode.setInputValue(inputName, outputLocation(sourceNode, 'File'))
+        nodeList.append(dagNode)
+    return (dag, nodeList)
+
+
+def breaksDependency(dag, nodeOrder):
+    """
+    Return whether a node in the given order comes before a node providing it
+    with data.
+    """
+    positionDict = dict((n, i) for (i, n) in enumerate(nodeOrder))
+    for dagNode in nodeOrder:
+        for (input, dataPacket) in dag.nodeOrderedDataPackets(dagNode):
+            if positionDict.get(dataPacket.sourceNode, -1) > positionDict[dagNode]:
+                return True
+    return False
+
+
+def compareRandomDags(dagCount, nodeCount, presentFraction, seed):
+    """
+    Compare the two implementations on every node of the given number of
+    random DAGs, printing each mismatch.  Returns a dict of counts.
+    """
+    counts = dict(queries=0, sameNodes=0, sameOrder=0, legacyBroken=0, currentBroken=0)
+    for dagIndex in range(dagCount):
+        directory = tempfile.mkdtemp(prefix="depends_compare_planner_")
+        try:
+            (dag, nodeList) = randomDag(nodeCount, seed + dagIndex, directory, presentFraction)
+            depends_file_cache.invalidate()
+            for dagNode in nodeList:
+                for onlyUnfulfilled in (True, False):
+                    for recursion in (True, False):
+                        for includeGivenNode in (True, False):
+                            legacy = legacyOrderedNodeDependenciesAt(dag, dagNode, includeGivenNode, onlyUnfulfilled, recursion)
+                            current = dag.orderedNodeDependenciesAt(dagNode, includeGivenNode, onlyUnfulfilled, recursion)
+                            counts['queries'] += 1
+                            if set(legacy) == set(current) and len(current) == len(set(current)):
+                                counts['sameNodes'] += 1
+                            else:
+                                print "Different nodes at %s (seed %d, onlyUnfulfilled=%s, recursion=%s, includeGivenNode=%s): %s / %s" % (
+                                    dagNode.name, seed + dagIndex, onlyUnfulfilled, recursion, includeGivenNode,
+                                    [x.name for x in legacy], [x.name for x in current])
+                            if legacy == current:
+                                counts['sameOrder'] += 1
+                            if breaksDependency(dag, legacy):
+                                counts['legacyBroken'] += 1
+                            if breaksDependency(dag, current):
+                                counts['currentBroken'] += 1
+                                print "Order breaks a dependency at %s (seed %d, onlyUnfulfilled=%s, recursion=%s): %s" % (
+                                    dagNode.name, seed + dagIndex, onlyUnfulfilled, recursion, [x.name for x in current])
+        finally:
+            shutil.rmtree(directory)
+    return counts
+
+
+def timeChain(chainLength):
+    """
+    Return the seconds each implementation takes to plan the last node of a
+    chain of the given length, and whether they agree.
+    """
+    directory = tempfile.mkdtemp(prefix="depends_compare_planner_")
+    try:
+        dag = depends_dag.DAG()
+        previousNode = None
+        for i in range(chainLength):
+            dagNode = depends_node.DagNodeAwk(name="c%d" % i) if previousNode else depends_node.DagNodeLs(name="c%d" % i)
+            dagNode.setOutputValue('File', 'filename', os.path.join(directory, "c%d.txt" % i))
+            dag.addNode(dagNode)
+            if previousNode:
+                dag.connectNodes(previousNode, dagNode)
+                dagNode.setInputValue('File', outputLocation(previousNode, 'File'))
+            previousNode = dagNode
+        depends_file_cache.invalidate()
+        startTime = time.time()
+        legacy = legacyOrderedNodeDependenciesAt(dag, previousNode)
+        legacySeconds = time.time() - startTime
+        depends_file_cache.invalidate()
+        startTime = time.time()
+        current = dag.orderedNodeDependenciesAt(previousNode)
+        currentSeconds = time.time() - startTime
+    finally:
+        shutil.rmtree(directory)
+    return (legacySeconds, currentSeconds, legacy == current)
+
+
+###############################################################################
+## Main starts here...
+###############################################################################
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('--dags', action='store', type='int', dest='dags', help='The number of random DAGs to compare on', default=60)
+    parser.add_option('--nodes', action='store', type='int', dest='nodes', help='The number of nodes in each random DAG', default=40)
+    parser.add_option('--present', action='store', type='float', dest='present', help='The fraction of outputs already on disk', default=0.3)
+    parser.add_option('--seed', action='store', type='int', dest='seed', help='The seed of the first random DAG', default=0)
+    parser.add_option('--chain', action='store', type='int', dest='chain', help='The length of the chain to time both on', default=300)
+    (options, args) = parser.parse_args()
+
+    depends_engine.setupStartupVariables()
+    depends_engine.loadPlugins(includeFileDialogs=False)
+    depends_node.registerNodeType(DagNodeJoin)
+
+    counts = compareRandomDags(options.dags, options.nodes, options.present, options.seed)
+    print "%d queries: %d found the same nodes, %d the same order." % (counts['queries'], counts['sameNodes'], counts['sameOrder'])
+    print "Orders breaking a dependency: %d legacy, %d current." % (counts['legacyBroken'], counts['currentBroken'])
+    if options.chain:
+        (legacySeconds, currentSeconds, same) = timeChain(options.chain)
+        print "%d-node chain: legacy %.3fs, current %.4fs (%s)." % (options.chain, legacySeconds, currentSeconds, "same order" if same else "different order")
+    sys.exit(1 if counts['sameNodes'] != counts['queries'] or counts['currentBroken'] else 0)
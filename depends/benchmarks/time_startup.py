@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import optparse
+import subprocess
+
+
+"""
+Times executing a node from the commandline, from starting Python to the
+node's command having run, two ways: with "depends --nogui", which only
+loads what execution needs, and the way --nogui used to work, by building
+the Qt MainWindow and calling its dagExecuteNode().  The workflow executed
+is a single Ls node, so the time is almost all startup.  The median of a
+few runs of each is reported.
+
+The MainWindow path needs PySide and a display (xvfb-run will do), and is
+reported as unavailable without them.
+"""
+
+
+###############################################################################
+###############################################################################
+# The directory the depends script and modules are in
+DEPENDS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# A program executing a node through the MainWindow, as --nogui used to
+MAIN_WINDOW_PROGRAM = """
+import sys
+from PySide import QtGui
+import depends_main_window
+app = QtGui.QApplication(sys.argv[:1])
+mainWindow = depends_main_window.MainWindow(startFile=sys.argv[1])
+mainWindow.dagExecuteNode(mainWindow.dag.node(name=sys.argv[2]), sys.argv[3], executeImmediately=True)
+mainWindow.executionThreadPool.waitForDone()
+"""
+
+
+###############################################################################
+## Utility
+###############################################################################
+def writeWorkflow(directory):
+    """
+    Write a workflow of one Ls node, named "lister", listing the given
+    directory into it, and return the workflow's filename.
+    """
+    nodeId = "926618bf-1078-4f8d-91f7-c1f284eed505"
+    node = {"NAME": "lister", "TYPE": "DagNodeLs", "UUID": nodeId, "STALE": "False",
+            "INPUTS": [],
+            "OUTPUTS": [{"NAME": "File", "VALUE": {"filename": os.path.join(directory, "listing.txt")}, "RANGE": None}],
+            "ATTRIBUTES": [{"NAME": "listPath", "VALUE": directory, "RANGE": None},
+                           {"NAME": "long", "VALUE": "True", "RANGE": None}]}
+    snapshot = {"DAG": {"NODES": [node], "EDGES": [], "GROUPS": [], "VARIABLE_SUBSTITIONS": [],
+                        "NODE_META": {nodeId: {"locationX": "0", "locationY": "0"}}, "CONNECTION_META": {}}}
+    filename = os.path.join(directory, "workflow.json")
+    with open(filename, 'w') as fp:
+        fp.write(json.dumps(snapshot, sort_keys=True, indent=4))
+    return filename
+
+
+def medianSeconds(argList, runCount):
+    """
+    Run the given command the given number of times from the depends
+    directory, returning the median of the seconds each took, or None and
+    the end of its output if a run failed.
+    """
+    secondsList = list()
+    for run in range(runCount):
+        startTime = time.time()
+        process = subprocess.Popen(argList, cwd=DEPENDS_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        secondsList.append(time.time() - startTime)
+        if process.returncode:
+            return (None, output.strip().splitlines()[-1] if output.strip() else "exit status %d" % process.returncode)
+    secondsList.sort()
+    return (secondsList[len(secondsList)/2], None)
+
+
+###############################################################################
+## Main starts here...
+###############################################################################
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option('--runs', action='store', type='int', dest='runs', help='The number of times to run each way', default=7)
+    (options, args) = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="depends_time_startup_")
+    try:
+        workflowFilename = writeWorkflow(directory)
+        commandDict = {"depends --nogui": [sys.executable, os.path.join(DEPENDS_DIR, "depends"), "--nogui",
+                                           "--workflow", workflowFilename, "--node", "lister", "--evalpath", directory],
+                       "MainWindow.dagExecuteNode": [sys.executable, "-c", MAIN_WINDOW_PROGRAM,
+                                                     workflowFilename, "lister", directory]}
+        for name in ["depends --nogui", "MainWindow.dagExecuteNode"]:
+            (seconds, failure) = medianSeconds(commandDict[name], options.runs)
+            if seconds is None:
+                print "%-28s unavailable (%s)" % (name, failure)
+            else:
+                print "%-28s %.3fs (median of %d)" % (name, seconds, options.runs)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,263 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import json
+import time
+import errno
+import shutil
+import sqlite3
+import tempfile
+
+
+"""
+An optional store of the files nodes have written, keyed by the nodes'
+location independent fingerprints (see depends_fingerprint).  When a node
+is about to execute and the store already holds the outputs of an identical
+node (with identical inputs), perhaps from an earlier version of the
+workflow, the stored files are linked into place instead.
+
+Files are copied into the store, and linked (or copied) back out according
+to LINK_MODE.  Linked outputs share the stored file's contents, and many
+programs (and shell redirections) rewrite their outputs in place, so outputs
+that are links are replaced with private copies (see unshareOutputs) before
+their nodes execute again.  Symlinks to entries that are later evicted are
+left dangling, which simply makes the outputs missing again.  Links keep the
+stored files' sizes and modification times, so nodes downstream of
+materialized outputs get the same fingerprints as before and can be found
+in the store as well.
+
+The store holds at most a given number of bytes, evicting the least recently
+used entries to make room.  An SQLite index in the store's directory tracks
+each entry's size, when it was last used, and which output file each stored
+file belongs to.
+"""
+
+
+###############################################################################
+###############################################################################
+# How materialized files are made: "hardlink", "symlink", or "copy".  Links
+# that can't be made (across filesystems, for example) fall back to copies.
+LINK_MODE = "hardlink"
+
+# The default size limit of a store (in bytes)
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024 * 1024
+
+
+###############################################################################
+###############################################################################
+class ArtifactStore(object):
+    """
+    A directory of stored node outputs with a size-bounded least recently
+    used eviction policy and hit/miss statistics.
+    """
+
+    def __init__(self, rootDir, maxBytes=DEFAULT_MAX_BYTES):
+        """
+        """
+        self.rootDir = rootDir
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(rootDir):
+            os.makedirs(rootDir)
+        self.connection = sqlite3.connect(os.path.join(rootDir, "index.sqlite"))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS artifacts "
+                                "(key TEXT PRIMARY KEY, size INTEGER NOT NULL, lastUsed REAL NOT NULL, manifest TEXT NOT NULL)")
+        self.connection.commit()
+
+
+    def _entryDir(self, key):
+        """
+        The directory the files of a given entry are stored in.
+        """
+        return os.path.join(self.rootDir, key[:2], key)
+
+
+    def contains(self, key):
+        """
+        Return whether the store holds an entry with the given key.
+        """
+        return self.connection.execute("SELECT 1 FROM artifacts WHERE key = ?", (key,)).fetchone() is not None
+
+
+    def materialize(self, key, dag, dagNode):
+        """
+        Put the stored files of the entry with the given key in place as the
+        outputs of the given node.  Returns whether the entry was found (and
+        counts a hit or a miss accordingly).
+        """
+        row = self.connection.execute("SELECT manifest FROM artifacts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False
+        dataPacketDict = dict((dp.sourceOutputName, dp) for dp in _outputDataPackets(dag, dagNode))
+        manifest = json.loads(row[0])
+        for (outputName, descriptorName, frameIndex, storedName) in manifest:
+            if outputName not in dataPacketDict or descriptorName not in dataPacketDict[outputName].filenames:
+                self.misses += 1
+                return False
+        for (outputName, descriptorName, frameIndex, storedName) in manifest:
+            destination = dataPacketDict[outputName].fileDescriptorNamed(descriptorName).frame(frameIndex)
+            _linkFile(os.path.join(self._entryDir(key), storedName), destination)
+        self.connection.execute("UPDATE artifacts SET lastUsed = ? WHERE key = ?", (time.time(), key))
+        self.connection.commit()
+        self.hits += 1
+        return True
+
+
+    def store(self, key, dag, dagNode):
+        """
+        Copy the output files of the given node into the store under the given
+        key, then evict old entries if the store has grown too large.  Nodes
+        with no output files on disk are not stored.  Returns whether an entry
+        was added.
+        """
+        if self.contains(key):
+            return False
+        manifest = list()
+        sourceFiles = list()
+        for dataPacket in _outputDataPackets(dag, dagNode):
+            for descriptorName in sorted(dataPacket.filenames):
+                if not dataPacket.filenames[descriptorName]:
+                    continue
+                for (frameIndex, filename) in enumerate(dataPacket.fileDescriptorNamed(descriptorName).iterFrames()):
+                    if not os.path.isfile(filename):
+                        continue
+                    storedName = "%d_%s" % (len(manifest), os.path.basename(filename))
+                    manifest.append((dataPacket.sourceOutputName, descriptorName, frameIndex, storedName))
+                    sourceFiles.append(filename)
+        if not manifest:
+            return False
+
+        # Files are copied somewhere private and moved into place in one step
+        parentDir = os.path.dirname(self._entryDir(key))
+        if not os.path.isdir(parentDir):
+            os.makedirs(parentDir)
+        stagingDir = tempfile.mkdtemp(prefix="staging_", dir=parentDir)
+        size = 0
+        for (entry, filename) in zip(manifest, sourceFiles):
+            shutil.copy2(filename, os.path.join(stagingDir, entry[3]))
+            size += os.path.getsize(filename)
+        if os.path.isdir(self._entryDir(key)) and not self.contains(key):
+            # Left behind by an interrupted store or eviction
+            shutil.rmtree(self._entryDir(key), ignore_errors=True)
+        try:
+            os.rename(stagingDir, self._entryDir(key))
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(stagingDir, ignore_errors=True)
+            return False
+        self.connection.execute("INSERT OR REPLACE INTO artifacts (key, size, lastUsed, manifest) VALUES (?, ?, ?, ?)",
+                                (key, size, time.time(), json.dumps(manifest)))
+        self.connection.commit()
+        self.evict()
+        return True
+
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the store fits in its
+        size limit.
+        """
+        totalBytes = self.totalBytes()
+        if totalBytes <= self.maxBytes:
+            return
+        for (key, size) in self.connection.execute("SELECT key, size FROM artifacts ORDER BY lastUsed ASC").fetchall():
+            if totalBytes <= self.maxBytes:
+                break
+            self.connection.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+            shutil.rmtree(self._entryDir(key), ignore_errors=True)
+            totalBytes -= size
+        self.connection.commit()
+
+
+    def totalBytes(self):
+        """
+        Return the number of bytes held in the store.
+        """
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+
+    def statistics(self):
+        """
+        Return a tuple containing the number of hits and misses this session,
+        the number of entries in the store, and the number of bytes they hold.
+        """
+        entryCount = self.connection.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        return (self.hits, self.misses, entryCount, self.totalBytes())
+
+
+    def close(self):
+        """
+        """
+        self.connection.close()
+
+
+###############################################################################
+## Utility
+###############################################################################
+def unshareOutputs(dag, dagNodes):
+    """
+    Replace each output file of the given nodes that is a symlink or has
+    other hardlinks with a private copy, so executing the nodes can't change
+    the files they are linked to.
+    """
+    for dagNode in dagNodes:
+        for dataPacket in _outputDataPackets(dag, dagNode):
+            for descriptorName in dataPacket.filenames:
+                if not dataPacket.filenames[descriptorName]:
+                    continue
+                for filename in dataPacket.fileDescriptorNamed(descriptorName).iterFrames():
+                    if not os.path.islink(filename) and (not os.path.isfile(filename) or os.stat(filename).st_nlink < 2):
+                        continue
+                    (fileDescriptor, privateFilename) = tempfile.mkstemp(prefix=".unshare_", dir=os.path.dirname(filename) or os.curdir)
+                    os.close(fileDescriptor)
+                    if os.path.exists(filename):
+                        shutil.copy2(filename, privateFilename)
+                        os.rename(privateFilename, filename)
+                    else:
+                        os.remove(privateFilename)
+                        os.remove(filename)
+
+
+def _outputDataPackets(dag, dagNode):
+    """
+    The data packets coming out of each of a node's outputs, once each.
+    """
+    dataPacketDict = dict()
+    for output in dagNode.outputs():
+        dataPacket = dag.nodeOutputDataPacket(dagNode, output)
+        dataPacketDict[dataPacket.sourceOutputName] = dataPacket
+    return [dataPacketDict[k] for k in sorted(dataPacketDict)]
+
+
+def _linkFile(source, destination):
+    """
+    Replace the destination file with a link to (or copy of) the source file,
+    according to LINK_MODE.
+    """
+    destinationDir = os.path.dirname(destination)
+    if destinationDir and not os.path.isdir(destinationDir):
+        os.makedirs(destinationDir)
+    try:
+        os.remove(destination)
+    except OSError, err:
+        if err.errno != errno.ENOENT:
+            raise
+    if LINK_MODE == "hardlink":
+        try:
+            os.link(source, destination)
+            return
+        except (OSError, AttributeError):
+            pass
+    elif LINK_MODE == "symlink":
+        try:
+            os.symlink(os.path.abspath(source), destination)
+            return
+        except (OSError, AttributeError):
+            pass
+    shutil.copy2(source, destination)
@@ -0,0 +1,217 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import math
+
+import depends_output_recipe
+
+
+"""
+Policies deciding how many frames each task executes when the frames of a
+node are executed as separate tasks (see depends_engine.executionPlan).
+One frame per task gives the most parallelism, but every task costs a
+process or two to start and a trip through the recipe's scheduler, which
+dominates when each frame is quick to make.  A policy gives the number of
+frames per chunk for each node: a fixed number, enough frames to run for
+roughly a target duration, or enough to give each worker a target number
+of chunks.
+
+Nodes that can make a range of frames in one command return True from
+DagNode.executesFrameChunks() and are asked for one command per chunk (see
+DagNode.chunkFrameRange()).  The per-frame commands of other nodes are run
+one after another within their chunk's task.
+"""
+
+
+###############################################################################
+###############################################################################
+# The policy used when none is given, as a string (see chunkPolicyFromString).
+# None runs one frame per task, and the DEPENDS_CHUNK_POLICY environment
+# variable overrides both.
+CHUNK_POLICY = None
+
+# The seconds a frame is taken to need by duration policies, for node types
+# they have no estimate for
+DEFAULT_FRAME_SECONDS = 1.0
+
+
+###############################################################################
+###############################################################################
+class ChunkPolicy(object):
+    """
+    The base policy, executing one frame per task.
+    """
+
+    def __init__(self):
+        """
+        """
+        pass
+
+
+    def chunkSize(self, dagNode, frameCount):
+        """
+        Return the number of frames each task of the given node executes, when
+        it has the given number of frames to execute.
+        """
+        return 1
+
+
+    def __repr__(self):
+        """
+        """
+        return "%s()" % type(self).__name__
+
+
+###############################################################################
+###############################################################################
+class FixedChunkPolicy(ChunkPolicy):
+    """
+    Execute a fixed number of frames per task.
+    """
+
+    def __init__(self, size):
+        """
+        """
+        ChunkPolicy.__init__(self)
+        if size < 1:
+            raise RuntimeError("Chunks must hold at least one frame (not %d)." % size)
+        self.size = size
+
+
+    def chunkSize(self, dagNode, frameCount):
+        """
+        """
+        return self.size
+
+
+    def __repr__(self):
+        """
+        """
+        return "FixedChunkPolicy(%d)" % self.size
+
+
+###############################################################################
+###############################################################################
+class DurationChunkPolicy(ChunkPolicy):
+    """
+    Execute as many frames per task as fit in a target number of seconds,
+    given an estimate of the seconds each frame of a node takes.  Estimates
+    are kept per node type name in frameSecondsDict, and node types without
+    one are taken to need DEFAULT_FRAME_SECONDS.  Executing a node fills in
+    the estimates from the frames the last execution's journal measured
+    (see depends_journal.ExecutionJournal.frameSecondsDict).
+    """
+
+    def __init__(self, targetSeconds, frameSecondsDict=None):
+        """
+        """
+        ChunkPolicy.__init__(self)
+        if targetSeconds <= 0:
+            raise RuntimeError("Chunks must have a positive target duration (not %g)." % targetSeconds)
+        self.targetSeconds = targetSeconds
+        self.frameSecondsDict = dict(frameSecondsDict) if frameSecondsDict else dict()
+
+
+    def frameSeconds(self, dagNode):
+        """
+        Return the estimated seconds a frame of the given node takes.
+        """
+        return self.frameSecondsDict.get(type(dagNode).__name__, DEFAULT_FRAME_SECONDS)
+
+
+    def chunkSize(self, dagNode, frameCount):
+        """
+        """
+        frameSeconds = self.frameSeconds(dagNode)
+        if frameSeconds <= 0:
+            return max(1, frameCount)
+        return max(1, int(self.targetSeconds / frameSeconds))
+
+
+    def __repr__(self):
+        """
+        """
+        return "DurationChunkPolicy(%g)" % self.targetSeconds
+
+
+###############################################################################
+###############################################################################
+class WorkerChunkPolicy(ChunkPolicy):
+    """
+    Split each node's frames into a target number of chunks per worker, so
+    there is just enough work to go around (with a few spare chunks to even
+    out frames taking different times).  The worker count defaults to the
+    one recipes use (see depends_output_recipe.workerCount).
+    """
+
+    def __init__(self, chunksPerWorker=1, workerCount=None):
+        """
+        """
+        ChunkPolicy.__init__(self)
+        if chunksPerWorker < 1:
+            raise RuntimeError("Each worker must be given at least one chunk (not %d)." % chunksPerWorker)
+        self.chunksPerWorker = chunksPerWorker
+        self.workerCount = workerCount
+
+
+    def chunkSize(self, dagNode, frameCount):
+        """
+        """
+        workerCount = self.workerCount if self.workerCount else depends_output_recipe.workerCount()
+        return max(1, int(math.ceil(float(frameCount) / (workerCount * self.chunksPerWorker))))
+
+
+    def __repr__(self):
+        """
+        """
+        return "WorkerChunkPolicy(%d)" % self.chunksPerWorker
+
+
+###############################################################################
+## Utility
+###############################################################################
+def chunkPolicyFromString(policyString):
+    """
+    Return the policy described by a string of the form "size:N" (N frames
+    per task), "duration:S" (tasks of about S seconds), or "workers:N" (N
+    tasks per worker), or None for an empty string.
+    """
+    if not policyString:
+        return None
+    (kind, separator, value) = policyString.partition(':')
+    try:
+        if kind == "size":
+            return FixedChunkPolicy(int(value))
+        if kind == "duration":
+            return DurationChunkPolicy(float(value))
+        if kind == "workers":
+            return WorkerChunkPolicy(int(value) if value else 1)
+    except ValueError:
+        pass
+    raise RuntimeError("Unknown frame chunk policy '%s' (expected size:N, duration:SECONDS, or workers:N)." % policyString)
+
+
+def chunkPolicyFromEnvironment():
+    """
+    Return the policy named by the DEPENDS_CHUNK_POLICY environment variable,
+    or by CHUNK_POLICY, or None if neither is set.
+    """
+    return chunkPolicyFromString(os.environ.get('DEPENDS_CHUNK_POLICY') or CHUNK_POLICY)
+
+
+def frameChunks(frameList, chunkSize):
+    """
+    Split a sorted list of frame numbers into lists of at most the given
+    number of consecutive frames.  Gaps in the frames always end a chunk.
+    """
+    chunkList = list()
+    for frame in frameList:
+        if chunkList and len(chunkList[-1]) < chunkSize and chunkList[-1][-1] == frame-1:
+            chunkList[-1].append(frame)
+        else:
+            chunkList.append([frame])
+    return chunkList
@@ -4,6 +4,7 @@
 # BSD license (LICENSE.txt for details).
 #
 
+import gc
 import re
 import uuid
 import copy
@@ -11,7 +12,7 @@ import copy
 import networkx
 
 import depends_node
-import depends_util
+import depends_fingerprint
 import depends_data_packet
 
 
@@ -44,19 +45,60 @@ class DAG:
         # A list of node group sets
         self.nodeGroupDict = dict()
 
+        # Lookup tables keeping name and UUID queries from scanning the network
+        self.nodeNameDict = dict()
+        self.nodeUUIDDict = dict()
+
+        # Which inputs consume each output, keyed by (output node UUID, output 
+        # name) and containing a set of (node, input name) tuples.  The input
+        # dict remembers where each (node, input name) is registered.
+        self.outputConsumerDict = dict()
+        self.inputProviderDict = dict()
+
+        # Resolved output types keyed by (node, output name), along with 
+        # counters reporting how useful the cache is
+        self.outputTypeCache = dict()
+        self.outputTypeCacheHits = 0
+        self.outputTypeCacheMisses = 0
+
+        # The sets of nodes upstream of nodes in the network, keyed by node,
+        # which are forgotten whenever an edge is added or removed
+        self.upstreamNodeCache = dict()
+
+        # A list of the changes made to the DAG and its nodes since 
+        # beginChangeRecord() was called, or None when nothing is recording
+        self.changeRecord = None
+
+        # The fingerprints of nodes as they last executed (see depends_fingerprint),
+        # or None if this DAG's workflow doesn't keep them
+        self.fingerprintStore = None
+
 
     def node(self, name=None, nUUID=None):
         """
         Return a node with the given name or UUID.
         """
-        for dagNode in self.network:
-            if name and dagNode.name == name:
-                return dagNode
-            if nUUID and dagNode.uuid == nUUID:
-                return dagNode
+        if name and name in self.nodeNameDict:
+            return self.nodeNameDict[name]
+        if nUUID and nUUID in self.nodeUUIDDict:
+            return self.nodeUUIDDict[nUUID]
         return None
 
 
+    def lookupNodes(self, names=None, nUUIDs=None):
+        """
+        Return a list of nodes matching each of the given names, followed by
+        each of the given UUIDs.  Entries that do not exist in the DAG are 
+        returned as None so the result lines up with the request.
+        """
+        foundNodes = list()
+        for name in (names or list()):
+            foundNodes.append(self.nodeNameDict.get(name))
+        for nUUID in (nUUIDs or list()):
+            foundNodes.append(self.nodeUUIDDict.get(nUUID))
+        return foundNodes
+
+
     def nodes(self, nodeType=None):
         """
         Return a list of all nodes, nodes of a certain type, or nodes that have 
@@ -102,6 +144,16 @@ class DAG:
             raise RuntimeError('Cannot add node named %s, as it already exists.' % dagNode.name)
         self.network.add_node(dagNode)
         self.staleNodeDict[dagNode] = stale
+        self._recordChange("ADD_NODE", dagNode, stale)
+        self.nodeNameDict[dagNode.name] = dagNode
+        self.nodeUUIDDict[dagNode.uuid] = dagNode
+        dagNode.dag = self
+        for input in dagNode.inputs():
+            self.nodeInputValueChanged(dagNode, input.name)
+
+        # Inputs that were pointing at this node before it existed have 
+        # resolved their types without it.
+        self._invalidateOutputTypes(self._linkedConsumerNodes(dagNode))
 
 
     def removeNode(self, dagNode=None, name=None):
@@ -110,8 +162,86 @@ class DAG:
         """
         if not dagNode:
             dagNode = self.node(name=name)
+        if self.changeRecord is not None:
+            # The network drops the node's edges silently, so note them first
+            for providerNode in self.nodeConnectionsIn(dagNode):
+                self._recordChange("DISCONNECT", providerNode, dagNode)
+            for consumerNode in self.nodeConnectionsOut(dagNode):
+                self._recordChange("DISCONNECT", dagNode, consumerNode)
+            self._recordChange("REMOVE_NODE", dagNode, self.staleNodeDict.get(dagNode, False))
+        self._invalidateOutputTypes([dagNode])
         self.network.remove_node(dagNode)
+        self.upstreamNodeCache.clear()
         self.staleNodeDict.pop(dagNode, None)
+        if self.nodeNameDict.get(dagNode.name) is dagNode:
+            del self.nodeNameDict[dagNode.name]
+        if self.nodeUUIDDict.get(dagNode.uuid) is dagNode:
+            del self.nodeUUIDDict[dagNode.uuid]
+        for input in dagNode.inputs():
+            self._unregisterInputLink(dagNode, input.name)
+        dagNode.dag = None
+
+
+    def nodeRenamed(self, dagNode, oldName):
+        """
+        Keep the name lookup table current when a node in the DAG changes its
+        name.  Called by the node itself (see DagNode.setName).
+        """
+        if self.nodeNameDict.get(oldName) is dagNode:
+            del self.nodeNameDict[oldName]
+        self.nodeNameDict[dagNode.name] = dagNode
+        self.nodePropertyChanged(dagNode, "setName", (), oldName, dagNode.name)
+
+
+    def nodePropertyChanged(self, dagNode, setterName, setterArgs, oldValue, newValue):
+        """
+        Record a property of a node in the DAG being set.  The change is 
+        described by the name of the DagNode setter used, the arguments it was
+        given before the value, and the old and new values.  Called by the node
+        itself (see DagNode.setInputValue and friends).
+        """
+        if oldValue != newValue:
+            self._recordChange("PROPERTY", dagNode, setterName, setterArgs, oldValue, newValue)
+
+
+    def nodeInputValueChanged(self, dagNode, inputName):
+        """
+        Keep the output consumer lookup table current when an input in the 
+        DAG changes which output it points to.  Called by the node itself
+        (see DagNode.setInputValue).
+        """
+        self._invalidateOutputTypes([dagNode])
+        self._unregisterInputLink(dagNode, inputName)
+        linkKey = depends_data_packet.uuidAndOutputNameFromScenegraphLocationString(dagNode.inputValue(inputName))
+        if linkKey[0] is None:
+            return
+        self.outputConsumerDict.setdefault(linkKey, set()).add((dagNode, inputName))
+        self.inputProviderDict[(dagNode, inputName)] = linkKey
+
+
+    def _unregisterInputLink(self, dagNode, inputName):
+        """
+        Remove the given input from the output consumer lookup table.
+        """
+        linkKey = self.inputProviderDict.pop((dagNode, inputName), None)
+        if linkKey is None:
+            return
+        consumers = self.outputConsumerDict[linkKey]
+        consumers.discard((dagNode, inputName))
+        if not consumers:
+            del self.outputConsumerDict[linkKey]
+
+
+    def _linkedConsumerNodes(self, dagNode):
+        """
+        Return a set of the nodes with inputs pointing at any of the given
+        node's outputs, whether or not they are connected in the network.
+        """
+        consumerNodes = set()
+        for output in dagNode.outputs():
+            for (consumerNode, inputName) in self.outputConsumerDict.get((dagNode.uuid, output.name), list()):
+                consumerNodes.add(consumerNode)
+        return consumerNodes
 
 
     def connectNodes(self, startNode, endNode):
@@ -123,11 +253,85 @@ class DAG:
             raise RuntimeError('Node %s does not exist in DAG.' % startNode.name)
         if endNode not in self.network:
             raise RuntimeError('Node %s does not exist in DAG.' % endNode.name)
-        if startNode in self.nodeConnectionsIn(endNode):
+        if self.network.has_edge(endNode, startNode):
             raise RuntimeError("Attempting to duplicate outgoing connection.")
+        # The new edge closes a cycle only if the end node already feeds the 
+        # start node.
+        if self._feeds(endNode, startNode):
+            raise RuntimeError('Connecting %s to %s would make the directed graph cyclic!' % (startNode.name, endNode.name))
+        self._invalidateOutputTypes([endNode])
         self.network.add_edge(endNode, startNode)
+        self.upstreamNodeCache.clear()
+        self._recordChange("CONNECT", startNode, endNode)
+
+
+    def connectMany(self, connectionList):
+        """
+        Connects a list of (startNode, endNode) tuples in the DAG, checking 
+        the graph remains acyclic once for the whole batch rather than once
+        per connection.  Raises an exception, leaving the DAG untouched, if
+        there is an issue with any of them.  Each connection made is recorded
+        as a CONNECT change (see beginChangeRecord), as connectNodes records
+        its own, so a batch is undone and redone like single connections.
+        """
+        newEdges = list()
+        newEdgeSet = set()
+        for (startNode, endNode) in connectionList:
+            if startNode not in self.network:
+                raise RuntimeError('Node %s does not exist in DAG.' % startNode.name)
+            if endNode not in self.network:
+                raise RuntimeError('Node %s does not exist in DAG.' % endNode.name)
+            if self.network.has_edge(endNode, startNode) or (endNode, startNode) in newEdgeSet:
+                raise RuntimeError("Attempting to duplicate outgoing connection.")
+            newEdges.append((endNode, startNode))
+            newEdgeSet.add((endNode, startNode))
+        self.network.add_edges_from(newEdges)
+        self.upstreamNodeCache.clear()
         if not networkx.is_directed_acyclic_graph(self.network):
+            self.network.remove_edges_from(newEdges)
             raise RuntimeError('The directed graph is nolonger acyclic!')
+        self._invalidateOutputTypes([edge[0] for edge in newEdges])
+        # Only connections that were kept are recorded, in the order given
+        for (endNode, startNode) in newEdges:
+            self._recordChange("CONNECT", startNode, endNode)
+
+
+    def _feeds(self, providerNode, consumerNode):
+        """
+        Return whether the given provider node is upstream of the given
+        consumer node (or is the same node).  The search grows from both
+        ends, always widening the side with fewer edges to follow, and stops
+        as soon as either side runs out.  Appending a node to a long chain
+        therefore only looks at the new node's consumers rather than at the
+        chain's whole upstream.
+        """
+        if providerNode is consumerNode:
+            return True
+        # Network edges point from consumers to their providers
+        upstreamSeen = set([consumerNode])
+        upstreamFrontier = [consumerNode]
+        downstreamSeen = set([providerNode])
+        downstreamFrontier = [providerNode]
+        while upstreamFrontier and downstreamFrontier:
+            upstreamCost = sum(self.network.out_degree(x) for x in upstreamFrontier)
+            downstreamCost = sum(self.network.in_degree(x) for x in downstreamFrontier)
+            if upstreamCost <= downstreamCost:
+                (frontier, neighbors, seen, otherSeen) = (upstreamFrontier, self.network.successors, upstreamSeen, downstreamSeen)
+            else:
+                (frontier, neighbors, seen, otherSeen) = (downstreamFrontier, self.network.predecessors, downstreamSeen, upstreamSeen)
+            nextFrontier = list()
+            for dagNode in frontier:
+                for neighbor in neighbors(dagNode):
+                    if neighbor in otherSeen:
+                        return True
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        nextFrontier.append(neighbor)
+            if frontier is upstreamFrontier:
+                upstreamFrontier = nextFrontier
+            else:
+                downstreamFrontier = nextFrontier
+        return False
 
 
     def disconnectNodes(self, startNode, endNode):
@@ -139,14 +343,20 @@ class DAG:
             raise RuntimeError('Node %s does not exist in DAG.' % startNode.name)           
         if endNode not in self.network:
             raise RuntimeError('Node %s does not exist in DAG.' % endNode.name)
+        self._invalidateOutputTypes([endNode])
         self.network.remove_edge(endNode, startNode)
+        self.upstreamNodeCache.clear()
+        self._recordChange("DISCONNECT", startNode, endNode)
 
 
     def setNodeStale(self, dagNode, newState):
         """
         Set a node's stale state.
         """
+        oldState = self.staleNodeDict.get(dagNode)
         self.staleNodeDict[dagNode] = newState
+        if oldState != newState:
+            self._recordChange("STALE", dagNode, oldState, newState)
         
         
     def nodeStaleState(self, dagNode):
@@ -156,6 +366,39 @@ class DAG:
         return self.staleNodeDict[dagNode]
     
 
+    def beginChangeRecord(self):
+        """
+        Start recording every change made to the DAG and the nodes in it.
+        The changes are tuples starting with a change type string:
+            ("ADD_NODE", node, stale)
+            ("REMOVE_NODE", node, stale)
+            ("CONNECT", startNode, endNode)
+            ("DISCONNECT", startNode, endNode)
+            ("STALE", node, oldState, newState)
+            ("PROPERTY", node, setterName, setterArgs, oldValue, newValue)
+        Together they are enough to undo or redo an edit in place.
+        """
+        self.changeRecord = list()
+
+
+    def endChangeRecord(self):
+        """
+        Stop recording and return the list of changes, in the order they were
+        made, since beginChangeRecord() was called.
+        """
+        changeRecord = self.changeRecord
+        self.changeRecord = None
+        return changeRecord if changeRecord is not None else list()
+
+
+    def _recordChange(self, *change):
+        """
+        Append a change to the current record, if one is being made.
+        """
+        if self.changeRecord is not None:
+            self.changeRecord.append(change)
+
+
     def buildSceneGraph(self, atNode):
         """
         Evaluate the DAG in a postorder fashion to create a list of the data 
@@ -178,65 +421,96 @@ class DAG:
         Returns a list of tuples containing (Input, DataPacket).
         """
         validDataPackets = list()
-        orderedDataPackets = self.buildSceneGraph(dagNode)
-        scenegraphInputAndConnectedNode = [(i, self.nodeInputComesFromNode(dagNode, i)[0]) for i in dagNode.inputs()]
-
-        # Loop over the data packets in order, picking out the input associated with it (TODO: functionize)
-        for dataPacket in orderedDataPackets:
-            if dataPacket.sourceNode is dagNode:
+        for input in dagNode.inputs():
+            (sourceNode, sourceOutput) = self.nodeInputComesFromNode(dagNode, input)
+            if sourceNode is None or sourceNode is dagNode:
                 continue
-            if dataPacket.sourceNode not in [i[1] for i in scenegraphInputAndConnectedNode]:
+            # Only nodes upstream of this one in the DAG can provide its data
+            if not self._isUpstream(sourceNode, dagNode):
                 continue
+            dataPacket = self.nodeOutputDataPacket(sourceNode, sourceOutput)
             if onlyFulfilled and not dataPacket.dataPresent():
                 continue
             if onlyUnfulfilled and dataPacket.dataPresent():
                 continue
-            
-            # Recover the input that matches the current datapacket
-            input = None
-            for i in scenegraphInputAndConnectedNode:
-                if i[1] == dataPacket.sourceNode:
-                    input = i[0]
-            
             validDataPackets.append((input, dataPacket))
         return validDataPackets
 
 
+    def executionPlanAt(self, dagNode, onlyUnfulfilled=True, recursion=True):
+        """
+        Walks the DAG upstream of the given node once, collecting the nodes 
+        that must execute before it.  Returns a tuple containing the in-order
+        list of nodes (ending with the given node), a list of the data packets
+        encountered that are already on disk, and a list of those that aren't.
+        """
+        return self._dependencyWalk(dagNode, onlyUnfulfilled, recursion, checkPresence=True)
+
+
     def orderedNodeDependenciesAt(self, dagNode, includeGivenNode=True, onlyUnfulfilled=True, recursion=True):
         """
         Builds the evaluation order tree at the given node.
         Checks all requirements on each node (using the per-node input filters).
         """
-        # Get a list of data packets *this* node needs that aren't already on disk.
-        requiredDataPackets = [x[1] for x in self.nodeOrderedDataPackets(dagNode, onlyUnfulfilled=onlyUnfulfilled)]
-
-        # If there are any unfulfilled datapackets in the chain, their owning
-        # node must be executed, but it's possible they have dependencies not
-        # yet covered in the lists collected so far.  Add these dependencies
-        # in their proper locations.
-        #
-        # Append missing dependencies' required datapackets, maintaining execution order
-        # This is effectively recursion in a while loop.
-        i = 0
-        while i < len(requiredDataPackets):
-            packet = requiredDataPackets[i]
-            packetRdp = [x[1] for x in self.nodeOrderedDataPackets(packet.sourceNode, onlyUnfulfilled=onlyUnfulfilled)]
-            for p in packetRdp:
-                if p.sourceNode in [dp.sourceNode for dp in requiredDataPackets]:
-                    continue
-                if recursion:
-                    requiredDataPackets.append(p)
-            i += 1  
-        
-        # Return a list of in-order nodes, including the given node.
-        inOrderNodes = list()
-        for dp in reversed(requiredDataPackets):
-            inOrderNodes.append(dp.sourceNode)
-        if includeGivenNode:
-            inOrderNodes.append(dagNode)
+        # The disk only needs to be consulted if it can prune the walk
+        inOrderNodes = self._dependencyWalk(dagNode, onlyUnfulfilled, recursion, checkPresence=onlyUnfulfilled)[0]
+        if not includeGivenNode:
+            inOrderNodes.pop()
         return inOrderNodes
 
 
+    def _dependencyWalk(self, dagNode, onlyUnfulfilled, recursion, checkPresence):
+        """
+        A depth-first, postorder walk over the data each node requires from
+        its inputs.  Every node is visited at most once and the presence of
+        each data packet on disk is checked at most once.  Nodes providing 
+        data that is already present (and whose fingerprint has not changed
+        since they made it) are not walked into when onlyUnfulfilled is set.
+        Without recursion, only the given node's direct providers are
+        returned (the walk still goes deeper so they come back ordered
+        properly amongst themselves).  See executionPlanAt() for what is 
+        returned.
+        """
+        inOrderNodes = list()
+        fulfilledDataPackets = list()
+        unfulfilledDataPackets = list()
+        packetPresence = dict()
+        fingerprintCache = dict()
+        visited = set([dagNode])
+        walkedProviders = set()
+
+        # An explicit stack stands in for recursion, as long chains of nodes
+        # would otherwise exceed Python's recursion limit.
+        stack = [(dagNode, iter(self.nodeOrderedDataPackets(dagNode)))]
+        while stack:
+            (currentNode, packetIterator) = stack[-1]
+            for (input, dataPacket) in packetIterator:
+                if checkPresence:
+                    packetKey = (dataPacket.sourceNode, dataPacket.sourceOutputName)
+                    if packetKey not in packetPresence:
+                        packetPresence[packetKey] = dataPacket.dataPresent() and self.nodeFingerprintUnchanged(dataPacket.sourceNode, fingerprintCache)
+                        if packetPresence[packetKey]:
+                            fulfilledDataPackets.append(dataPacket)
+                        else:
+                            unfulfilledDataPackets.append(dataPacket)
+                    if onlyUnfulfilled and packetPresence[packetKey]:
+                        continue
+                if currentNode is dagNode:
+                    walkedProviders.add(dataPacket.sourceNode)
+                if dataPacket.sourceNode in visited:
+                    continue
+                visited.add(dataPacket.sourceNode)
+                stack.append((dataPacket.sourceNode, iter(self.nodeOrderedDataPackets(dataPacket.sourceNode))))
+                break
+            else:
+                stack.pop()
+                inOrderNodes.append(currentNode)
+
+        if not recursion:
+            inOrderNodes = [n for n in inOrderNodes if n is dagNode or n in walkedProviders]
+        return (inOrderNodes, fulfilledDataPackets, unfulfilledDataPackets)
+
+
     def allNodesBefore(self, dagNode):
         """
         Return a list of all nodes "before" the given node in the DAG.
@@ -259,34 +533,93 @@ class DAG:
         output.  Can be nicely used to set a "dirty" flag on downstream nodes.
         """
         # All the nodes that rely on this node, indirectly or directly
-        directlyNeedyNodeList = list()
-        for dagNode in self.allNodesAfter(dependingOnNode):
-            depends = self.orderedNodeDependenciesAt(dagNode, includeGivenNode=False, onlyUnfulfilled=False, recursion=recursion)
-            if dependingOnNode in depends:
-                directlyNeedyNodeList.append(dagNode)
-        return directlyNeedyNodeList
+        needyNodeList = list()
+        visited = set([dependingOnNode])
+        work = [dependingOnNode]
+        while work:
+            dagNode = work.pop(0)
+            for output in dagNode.outputs():
+                for (consumerNode, input) in self.nodeOutputGoesTo(dagNode, output):
+                    if consumerNode in visited:
+                        continue
+                    visited.add(consumerNode)
+                    needyNodeList.append(consumerNode)
+                    if recursion:
+                        work.append(consumerNode)
+        return needyNodeList
         
 
     def nodeOutputType(self, dagNode, output):
         """
         Nodes can output different inherited data packet types based on their inputs
         and parameters.  This function reports exactly which data packet type is coming
-        out of a given node.
+        out of a given node.  Results are cached until something upstream changes.
+        """
+        # Walk upstream until a type is known, remembering each output passed 
+        # on the way since they all resolve to the same type.
+        outputChain = list()
+        outputType = None
+        while outputType is None:
+            cacheKey = (dagNode, output.name)
+            if cacheKey in self.outputTypeCache:
+                outputType = self.outputTypeCache[cacheKey]
+                break
+            if cacheKey in outputChain:
+                raise RuntimeError('Output types of node %s depend on themselves.' % dagNode.name)
+            outputChain.append(cacheKey)
+            
+            # If your output has only one potential type, you've gotta' be what you are.
+            if len(output.allPossibleOutputTypes()) == 1:
+                outputType = output.dataPacketType
+                break
+            
+            # Which input is associated with this output?
+            input = dagNode.inputAffectingOutput(output)
+            if not input:
+                outputType = output.dataPacketType
+                break
+            
+            # The type of the found input is returned since the output is going to match.
+            (inputNode, inputNodeOutput) = self.nodeInputComesFromNode(dagNode, input)
+            if not inputNode:
+                outputType = output.dataPacketType
+                break
+            (dagNode, output) = (inputNode, inputNodeOutput)
+
+        if outputChain:
+            self.outputTypeCacheMisses += 1
+        else:
+            self.outputTypeCacheHits += 1
+        for cacheKey in outputChain:
+            self.outputTypeCache[cacheKey] = outputType
+        return outputType
+
+
+    def outputTypeCacheStatistics(self):
         """
-        # If your output has only one potential type, you've gotta' be what you are.
-        if len(output.allPossibleOutputTypes()) == 1:
-            return output.dataPacketType
-        
-        # Which input is associated with this output?
-        input = dagNode.inputAffectingOutput(output)
-        if not input:
-            return output.dataPacketType
-        
-        # Return the type of the found input since the output is going to match.
-        (inputNode, inputNodeOutput) = self.nodeInputComesFromNode(dagNode, input)
-        if not inputNode:
-            return output.dataPacketType
-        return self.nodeOutputType(inputNode, inputNodeOutput)
+        Returns a tuple containing the number of nodeOutputType() calls that
+        were answered by the cache, the number that were not, and how many 
+        outputs currently have a cached type.
+        """
+        return (self.outputTypeCacheHits, self.outputTypeCacheMisses, len(self.outputTypeCache))
+
+
+    def _invalidateOutputTypes(self, dagNodes):
+        """
+        Forget the cached output types of the given nodes and everything 
+        downstream whose type was resolved through them.  A node without
+        cached types cannot have lent its type to anything downstream, so
+        the walk stops there.
+        """
+        work = list(dagNodes)
+        while work and self.outputTypeCache:
+            dagNode = work.pop()
+            forgotten = False
+            for output in dagNode.outputs():
+                if self.outputTypeCache.pop((dagNode, output.name), None) is not None:
+                    forgotten = True
+            if forgotten:
+                work.extend(self._linkedConsumerNodes(dagNode))
         
 
     def nodeInputComesFromNode(self, dagNode, input):
@@ -305,16 +638,34 @@ class DAG:
         which dagNode and corresponding input is connected to the output.
         """
         connectedTuples = list()
-        dependentNodes = self.allNodesDependingOnNode(dagNode, recursion=False)
-        for dNode in dependentNodes:
-            for input in dNode.inputs():
-                (outNode, nodeOutput) = self.nodeInputComesFromNode(dNode, input)
-                if nodeOutput is output:
-                    connectedTuples.append((dNode, input))
-                    continue
+        consumers = self.outputConsumerDict.get((dagNode.uuid, output.name), list())
+        for (consumerNode, inputName) in sorted(consumers, key=lambda x: (x[0].name, str(x[0].uuid), x[1])):
+            if consumerNode is dagNode:
+                continue
+            # Only nodes downstream of this one in the DAG can consume its data
+            if not self._isUpstream(dagNode, consumerNode):
+                continue
+            connectedTuples.append((consumerNode, consumerNode.inputNamed(inputName)))
         return connectedTuples
 
 
+    def _isUpstream(self, providerNode, consumerNode):
+        """
+        Return whether the given provider node is upstream of the given
+        consumer node in the network.  Inputs may point at any node upstream,
+        not only at the nodes connected to them, so unless the two are
+        connected, the consumer's upstream nodes are found (once, until an
+        edge changes) and looked in.
+        """
+        if self.network.has_edge(consumerNode, providerNode):
+            return True
+        upstreamNodes = self.upstreamNodeCache.get(consumerNode)
+        if upstreamNodes is None:
+            upstreamNodes = frozenset(networkx.descendants(self.network, consumerNode))
+            self.upstreamNodeCache[consumerNode] = upstreamNodes
+        return providerNode in upstreamNodes
+
+
     def nodeInputDataPacket(self, dagNode, input):
         """
         Given a node and its input, return the datapacket that is coming in.
@@ -357,6 +708,21 @@ class DAG:
         return dagNode.inputRequirementsFulfilled(foo)
     
     
+    def nodeFingerprintUnchanged(self, dagNode, fingerprintCache=None):
+        """
+        Returns whether the given node's fingerprint matches the one recorded
+        when it last executed.  Nodes without a recorded fingerprint (and all
+        nodes, if the DAG has no fingerprint store) are considered unchanged.
+        See depends_fingerprint.nodeFingerprint() for the optional cache.
+        """
+        if not self.fingerprintStore:
+            return True
+        recordedFingerprint = self.fingerprintStore.fingerprint(dagNode)
+        if recordedFingerprint is None:
+            return True
+        return recordedFingerprint == depends_fingerprint.nodeFingerprint(self, dagNode, fingerprintCache)
+
+
     def safeNodeName(self, nodeName):
         """
         Given a node name suggestion, returns a safe version of it that will work in this DAG.
@@ -501,15 +867,41 @@ class DAG:
         """
         Transfers the given JSON snapshot into the current dict.
         """
+        # Restoring creates several long-lived objects per node, and Python's
+        # cyclic garbage collector would keep passing over all of those made
+        # so far, making large workflows load in more than linear time.
+        # Nothing restored is garbage, so collection waits until the end.
+        gcWasEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._restoreSnapshotContents(snapshotDict)
+        finally:
+            if gcWasEnabled:
+                gc.enable()
+
+
+    def _restoreSnapshotContents(self, snapshotDict):
+        """
+        Does the work of restoreSnapshot().
+        """
         # Clear out the existing DAG
+        for dagNode in self.network:
+            dagNode.dag = None
         self.network.clear()
         self.staleNodeDict.clear()
         self.nodeGroupDict.clear()
+        self.nodeNameDict.clear()
+        self.nodeUUIDDict.clear()
+        self.outputConsumerDict.clear()
+        self.inputProviderDict.clear()
+        self.outputTypeCache.clear()
+        self.upstreamNodeCache.clear()
         
-        # Loads of nodes
+        # Loads of nodes, remembering them by their UUID strings for the edges and groups
+        restoredNodeDict = dict()
         for n in snapshotDict["NODES"]:
             nodeType = n["TYPE"]
-            newNode = depends_util.classTypeNamedFromModule(nodeType, 'depends_node')
+            newNode = depends_node.nodeTypeNamed(nodeType)()
             newNode.name = n["NAME"]
             newNode.uuid = uuid.UUID(n['UUID'])
             stale = (n["STALE"] == "True")
@@ -525,13 +917,14 @@ class DAG:
                 newNode.setAttributeValue(a["NAME"], a["VALUE"])
                 newNode.setAttributeRange(a["NAME"], a["RANGE"])
             self.addNode(newNode, stale)
+            restoredNodeDict[n['UUID']] = newNode
             
         # Edge loads
+        connectionList = list()
         for e in snapshotDict["EDGES"]:
-            fromNode = self.node(nUUID=uuid.UUID(e["FROM"]))
-            toNode = self.node(nUUID=uuid.UUID(e["TO"]))
-            self.connectNodes(fromNode, toNode)
+            connectionList.append((restoredNodeDict[e["FROM"]], restoredNodeDict[e["TO"]]))
+        self.connectMany(connectionList)
         
         # Group loads
         for g in snapshotDict["GROUPS"]:
-            self.nodeGroupDict[g["NAME"]] = set([self.node(nUUID=uuid.UUID(ns)) for ns in g["NODES"]])
+            self.nodeGroupDict[g["NAME"]] = set([restoredNodeDict[ns] for ns in g["NODES"]])
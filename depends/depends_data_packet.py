@@ -4,12 +4,12 @@
 # BSD license (LICENSE.txt for details).
 #
 
-import os
 import re
 import uuid
 
 import depends_node
 import depends_util
+import depends_file_cache
 
 
 """
@@ -62,6 +62,21 @@ def uuidFromScenegraphLocationString(string):
     return uuid.UUID(uuidString)
 
 
+def uuidAndOutputNameFromScenegraphLocationString(string):
+    """
+    Returns a tuple containing the UUID object and the output name defined in
+    a location string, without needing the node it refers to.  A tuple of 
+    Nones is returned for strings that aren't valid locations.
+    """
+    try:
+        outputNodeUUID = uuidFromScenegraphLocationString(string)
+        if outputNodeUUID is None:
+            return (None, None)
+        return (outputNodeUUID, string.split(":")[3])
+    except:
+        return (None, None)
+
+
 def nodeAndOutputFromScenegraphLocationString(string, dag):
     """
     Returns a tuple containing the node defined in a location string and its 
@@ -153,18 +168,50 @@ class DataPacket(object):
                 return False
         return True
 
+
+
+    def presence(self, specificFileDescriptorName=None):
+        """
+        Returns a bytearray containing a 1 or 0 for each frame of the current
+        DataPacket's sequence, stating whether the files of every file
+        descriptor (or only the one specified) are present for that frame.
+        """
+        fdNameList = list()
+        if specificFileDescriptorName:
+            fdNameList.append(specificFileDescriptorName)
+        else:
+            fdNameList = self.filenames.keys()
+        presence = None
+        for fileDescriptor in fdNameList:
+            frameList = self.fileDescriptorNamed(fileDescriptor).frames()
+            fdPresence = depends_file_cache.filesPresent(frameList)[0]
+            if presence is None:
+                presence = fdPresence
+            else:
+                presence = bytearray(a & b for (a, b) in zip(presence, fdPresence))
+        if presence is None:
+            presence = bytearray('\x01' * depends_util.framespec("", self.sequenceRange).frameCount())
+        return presence
+
+
+    def missingFrameRanges(self, specificFileDescriptorName=None):
+        """
+        Returns a list of (first, last) frame number tuples, inclusive, 
+        covering each run of frames for which files are missing (see
+        framespec.missingFrameRanges()).
+        """
+        presence = self.presence(specificFileDescriptorName)
+        return depends_util.framespec("", self.sequenceRange).missingFrameRanges(presence)
+
     
     def _filesExist(self, framespecObject):
         """
         Check if all files exist in a given framespec object.
         """
-        numFilesInList = len(framespecObject.frames())
-        if numFilesInList == 0:
+        frameList = framespecObject.frames()
+        if not frameList:
             return False
-        for file in framespecObject.frames():
-            if not os.path.exists(file):
-                return False
-        return True
+        return depends_file_cache.filesPresent(frameList)[1]
 
 
 ######## FUNCTION TO IMPORT PLUGIN DATA PACKETS INTO THIS NAMESPACE  ##########
@@ -0,0 +1,962 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import json
+import heapq
+import itertools
+
+import depends_node
+import depends_util
+import depends_variables
+import depends_file_cache
+import depends_fingerprint
+import depends_artifact_store
+import depends_execution_plan
+import depends_chunk_policy
+import depends_journal
+import depends_data_packet
+import depends_file_dialog
+import depends_output_recipe
+
+
+"""
+The parts of Depends needed to load a workflow and execute its nodes, kept
+free of any user interface code.  Each function operates on a given DAG and
+the current workflow variables (see depends_variables), so the commandline
+can execute nodes without a QApplication or MainWindow, and the MainWindow
+uses the same functions when executing from the user interface.
+"""
+
+
+###############################################################################
+## Session setup
+###############################################################################
+def setupStartupVariables():
+    """
+    Each program starts with a set of workflow variables that are defined
+    by where the program is executed from and potentially a set of
+    environment variables.
+    """
+    # The current session gets a "binary directory" variable
+    depends_variables.add('DEPENDS_DIR')
+    depends_variables.setx('DEPENDS_DIR', os.path.dirname(os.path.realpath(__file__)), readOnly=True)
+
+    # ...And a path that points to where the nodes are loaded from
+    depends_variables.add('NODE_PATH')
+    if not os.environ.get('DEPENDS_NODE_PATH'):
+        depends_variables.setx('NODE_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'nodes'), readOnly=True)
+    else:
+        depends_variables.setx('NODE_PATH', os.environ.get('DEPENDS_NODE_PATH'), readOnly=True)
+
+    # ...And a path that points to where the DataPackets come from
+    depends_variables.add('DATA_PACKET_PATH')
+    if not os.environ.get('DEPENDS_DATA_PACKET_PATH'):
+        depends_variables.setx('DATA_PACKET_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'data_packets'), readOnly=True)
+    else:
+        depends_variables.setx('DATA_PACKET_PATH', os.environ.get('DEPENDS_DATA_PACKET_PATH'), readOnly=True)
+
+    # ...And a path that points to where the Output Recipes come from
+    depends_variables.add('OUTPUT_RECIPE_PATH')
+    if not os.environ.get('DEPENDS_OUTPUT_RECIPE_PATH'):
+        depends_variables.setx('OUTPUT_RECIPE_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'output_recipes'), readOnly=True)
+    else:
+        depends_variables.setx('OUTPUT_RECIPE_PATH', os.environ.get('DEPENDS_OUTPUT_RECIPE_PATH'), readOnly=True)
+
+    # ...And a path that points to where the File Dialogs come from
+    depends_variables.add('FILE_DIALOG_PATH')
+    if not os.environ.get('DEPENDS_FILE_DIALOG_PATH'):
+        depends_variables.setx('FILE_DIALOG_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'file_dialogs'), readOnly=True)
+    else:
+        depends_variables.setx('FILE_DIALOG_PATH', os.environ.get('DEPENDS_FILE_DIALOG_PATH'), readOnly=True)
+
+
+def loadPlugins(includeFileDialogs=True):
+    """
+    Load the node, data packet, output recipe, and file dialog plugins from the
+    paths in the startup variables, and auto-generate the read dag nodes.  File
+    dialogs are user interface plugins, so sessions without one can skip them.
+    """
+    depends_node.loadChildNodesFromPaths(depends_variables.value('NODE_PATH').split(':'))
+    depends_data_packet.loadChildDataPacketsFromPaths(depends_variables.value('DATA_PACKET_PATH').split(':'))
+    depends_output_recipe.loadChildRecipesFromPaths(depends_variables.value('OUTPUT_RECIPE_PATH').split(':'))
+    if includeFileDialogs:
+        depends_file_dialog.loadChildFileDialogsFromPaths(depends_variables.value('FILE_DIALOG_PATH').split(':'))
+    depends_node.generateReadDagNodes()
+
+
+def loadWorkflow(filename, dag):
+    """
+    Loads a snapshot, in the form of a json, file off disk and applies the
+    values it pulls to the given dependency graph and the workflow variables.
+    Returns the full snapshot dictionary, or None if the file doesn't exist.
+    """
+    if not os.path.exists(filename):
+        return None
+
+    # Load the snapshot off disk
+    with open(filename, 'rb') as fp:
+        snapshot = json.loads(fp.read())
+
+    # Apply the data to the in-flight Dag
+    dag.restoreSnapshot(snapshot["DAG"])
+
+    # Variable substitutions
+    for v in snapshot["DAG"]["VARIABLE_SUBSTITIONS"]:
+        if v["NAME"] not in depends_variables.names():
+            depends_variables.add(v["NAME"])
+        depends_variables.setx(v["NAME"], v["VALUE"])
+
+    # The current session gets a variable representing the location of the current workflow
+    if 'WORKFLOW_DIR' not in depends_variables.names():
+        depends_variables.add('WORKFLOW_DIR')
+    depends_variables.setx('WORKFLOW_DIR', os.path.dirname(filename), readOnly=True)
+
+    # Workflows saved when reloading plugins keep the fingerprints of the file they came from
+    attachFingerprintStore(dag, snapshot.get("RELOAD_PLUGINS_FILENAME_TEMP", filename))
+    return snapshot
+
+
+def attachFingerprintStore(dag, workflowFilename):
+    """
+    Give the DAG the fingerprint store kept next to the given workflow file,
+    creating it if needed (unsaved workflows get none).  Any store the DAG
+    already had is closed.  If the store can't be opened (a read-only
+    directory, for example) the DAG gets none and executes as if
+    fingerprints were never recorded.
+    """
+    if dag.fingerprintStore:
+        if workflowFilename and dag.fingerprintStore.databaseFilename == depends_fingerprint.storeFilenameForWorkflow(workflowFilename):
+            return
+        dag.fingerprintStore.close()
+        dag.fingerprintStore = None
+    if not workflowFilename:
+        return
+    try:
+        dag.fingerprintStore = depends_fingerprint.FingerprintStore(depends_fingerprint.storeFilenameForWorkflow(workflowFilename))
+    except Exception, err:
+        print "Fingerprint store for %s could not be opened (%s)." % (workflowFilename, err)
+
+
+def outputRecipeNamed(recipeName):
+    """
+    Return an output recipe object for the loaded recipe with the given name.
+    """
+    for tipe in depends_output_recipe.outputRecipeTypes():
+        recipe = tipe()
+        if recipe.name() == recipeName:
+            return recipe
+    raise RuntimeError("No output recipe named %s exists." % recipeName)
+
+
+###############################################################################
+## Validation
+###############################################################################
+def nodeVariablesUsed(dagNode):
+    """
+    Returns a tuple containing a list of all the single-dollar and a list
+    of all the double-dollar variables used in the given dag node.
+    """
+    singleDollarList = list()
+    doubleDollarList = list()
+    for input in dagNode.inputs():
+        vps = depends_variables.present(dagNode.inputValue(input.name, variableSubstitution=False))
+        vss = (list(), list())
+        vss2 = (list(), list())
+        if dagNode.inputRange(input.name, variableSubstitution=False):
+            vss = depends_variables.present(dagNode.inputRange(input.name, variableSubstitution=False)[0])
+            vss2 = depends_variables.present(dagNode.inputRange(input.name, variableSubstitution=False)[1])
+        singleDollarList += vps[0] + vss[0] + vss2[0]
+        doubleDollarList += vps[1] + vss[1] + vss2[1]
+    for attribute in dagNode.attributes():
+        vps = depends_variables.present(dagNode.attributeValue(attribute.name, variableSubstitution=False))
+        vss = (list(), list())
+        vss2 = (list(), list())
+        if dagNode.attributeRange(attribute.name, variableSubstitution=False):
+            vss = depends_variables.present(dagNode.attributeRange(attribute.name, variableSubstitution=False)[0])
+            vss2 = depends_variables.present(dagNode.attributeRange(attribute.name, variableSubstitution=False)[1])
+        singleDollarList += vps[0] + vss[0] + vss2[0]
+        doubleDollarList += vps[1] + vss[1] + vss2[1]
+    for output in dagNode.outputs():
+        for subName in output.subOutputNames():
+            vps = depends_variables.present(dagNode.outputValue(output.name, subName, variableSubstitution=False))
+            vss = (list(), list())
+            vss2 = (list(), list())
+            if dagNode.outputRange(output.name, variableSubstitution=False):
+                vss = depends_variables.present(dagNode.outputRange(output.name, variableSubstitution=False)[0])
+                vss2 = depends_variables.present(dagNode.outputRange(output.name, variableSubstitution=False)[1])
+            singleDollarList += vps[0] + vss[0] + vss2[0]
+            doubleDollarList += vps[1] + vss[1] + vss2[1]
+    return (list(set(singleDollarList)), list(set(doubleDollarList)))
+
+
+def sanityCheck(dag, dagNodes):
+    """
+    Runs a series of sanity tests on the given dag nodes to make sure they
+    are fit to be executed in their current state.  Raises a RuntimeError
+    describing the first problem found.
+    """
+    #
+    # Full DAG validation
+    #
+    # Insure all $ variables that are used, exist
+    for dagNode in dagNodes:
+        (singleDollarVariables, doubleDollarVariables) = nodeVariablesUsed(dagNode)
+        for sdVariable in singleDollarVariables:
+            if sdVariable not in depends_variables.names():
+                raise RuntimeError("Depends variable $%s used in node '%s' does not exist in current environment." % (sdVariable, dagNode.name))
+
+    # Insure all $$ variables that are used, are present in the current environment
+    for dagNode in dagNodes:
+        (singleDollarVariables, doubleDollarVariables) = nodeVariablesUsed(dagNode)
+        for ddVariable in doubleDollarVariables:
+            if ddVariable not in os.environ:
+                raise RuntimeError("Environment variable $%s used in node '%s' does not exist in current environment." % (ddVariable, dagNode.name))
+
+    #
+    # Individual node validation
+    #
+    for dagNode in dagNodes:
+        # Insure all the inputs are connected
+        if not dag.nodeAllInputsConnected(dagNode):
+            raise RuntimeError("Node '%s' is missing a required input." % (dagNode.name))
+
+        # Insure the inputs match what are connected to them
+        for input in dagNode.inputs():
+            incomingDataPacketType = type(dag.nodeInputDataPacket(dagNode, input))
+            if incomingDataPacketType not in input.allPossibleInputTypes():
+                raise RuntimeError("Node '%s' has an incoming DataPacket that doesn't match its input's ('%s') type." % (dagNode.name, input.name))
+
+        # Insure each input's range is within the output that's connected to it's range
+        for input in dagNode.inputs():
+            if not input.seqRange:
+                continue
+            inputRange = (int(input.seqRange[0]), int(input.seqRange[1]))
+            incomingDataPacket = dag.nodeInputDataPacket(dagNode, input)
+            incomingRange = incomingDataPacket.sequenceRange
+            if inputRange[0] < incomingRange[0] or inputRange[1] > incomingRange[1]:
+                (outputNode, output) = dag.nodeInputComesFromNode(dagNode, input)
+                raise RuntimeError("Input range of node '%s' input '%s' extends beyond the bounds of output from node '%s' output '%s'" %
+                                   (dagNode.name, input.name, outputNode.name, output.name))
+
+        # Insure the number of input frames match the number of output frames for nodes that are embarassingly parallel.
+        # NOTE: This one can go away someday after careful thought - this restriction exists, at the moment, for simplicity's sake.
+        if dagNode.isEmbarrassinglyParallel():          # and dag.nodeGroupCount(dagNode) > 0:
+            for input in dagNode.inputs():
+                if not input.seqRange:
+                    continue
+                inputRange = (int(input.seqRange[0]), int(input.seqRange[1]))
+                outputRangePreSubstitution = dagNode.outputAffectedByInput(input).getSeqRange()
+                outputRange = (int(outputRangePreSubstitution[0]), int(outputRangePreSubstitution[1]))
+                if inputRange != outputRange:
+                    raise RuntimeError("The parallel node, '%s', that lives in group '%s' is trimming its inputs a bit.  This is currently a no-no" %
+                                       (dagNode.name, dag.nodeInGroupNamed(dagNode)))
+
+        # Insure all your outputs are filled-in
+        # Insure output paths exist (most nodes don't create paths if they aren't present)
+        # Insure the output paths can be written to
+        # Insure if there is an output sequence marker (#), there are sequence numbers
+        for output in dagNode.outputs():
+            # NOTE: This doesn't work at the moment because of how inclusive the values dict is.  Fix!
+            #for field in output.value.values():
+            #   if not field:
+            #       raise RuntimeError("Node '%s' is missing a value in its output field '%s'." % (dagNode.name, output.name))
+            for field in output.value.values():
+                if not field:
+                    continue
+                dirName = os.path.dirname(field)
+                if not os.path.exists(dirName):
+                    raise RuntimeError("Node '%s' will attempt to write to a directory that doesn't exist (%s)." % (dagNode.name, dirName))
+            for field in output.value.values():
+                if not field:
+                    continue
+                dirName = os.path.dirname(field)
+                if not os.access(dirName, os.W_OK | os.X_OK):
+                    raise RuntimeError("Node '%s' will attempt to write to a directory that you don't have permissions to (%s)." % (dagNode.name, dirName))
+            for key in output.value:
+                if depends_util.framespec.hasFrameSymbols(output.value[key]):
+                    if not output.getSeqRange():
+                        raise RuntimeError("Node '%s' output '%s' has a string with frame symbols, but has no sequence range defined." % (dagNode.name, output.name))
+
+        # Insure the validation function passes for each node.
+        try:
+            dagNode.validate()
+        except Exception, err:
+            raise RuntimeError("Dag node '%s' did not pass its validation test with the error:\n%s" % (dagNode.name, err))
+
+    #
+    # Node group validation
+    #
+    # Insure all nodes in each node group are embarrassingly parallel
+    for groupName in dag.nodeGroupDict:
+        for dagNode in dag.nodeGroupDict[groupName]:
+            if not dagNode.isEmbarrassinglyParallel():
+                raise RuntimeError("Node '%s' in group '%s' is not embarrassingly parallel." % (dagNode.name, groupName))
+
+    # Insure all input and output ranges are identical in each dag group
+    # NOTE: This check can be removed with some careful thought and changes in the execution engine.
+    for groupName in dag.nodeGroupDict:
+        seqRange = None
+        for dagNode in dag.nodeGroupDict[groupName]:
+            for output in dagNode.outputs():
+                if not seqRange and output.getSeqRange():
+                    seqRange = (int(output.getSeqRange()[0]), int(output.getSeqRange()[1]))
+                else:
+                    if seqRange != (int(output.getSeqRange()[0]), int(output.getSeqRange()[1])):
+                        raise RuntimeError("Sequence ranges in group '%s' do not match.  Detection occurred on node '%s'." % (groupName, dagNode.name))
+
+    # Insure no node is in two groups at once
+    for dagNode in dagNodes:
+        if dag.nodeGroupCount(dagNode) > 1:
+            raise RuntimeError("Node '%s' is present in multiple groups." % (dagNode.name))
+
+
+###############################################################################
+## Execution
+###############################################################################
+def missingFrameSelection(dag, orderedDependencies):
+    """
+    Decide which frames of each embarrassingly parallel node in the given
+    execution order need to run: those whose outputs are missing from disk,
+    and those whose inputs are being made again upstream.  Stale nodes run
+    every frame, and nodes in a group all run the same frames so their
+    commands can still be interleaved.  Returns a tuple containing a dict of
+    dag node -> list of (frame number, [list of commandline arguments])
+    tuples to execute, and a dict of dag node -> list of (first, last) frame
+    ranges that are skipped.  Nodes missing from the first dict cannot be
+    split by frame and run completely.
+    """
+    # The per-frame commands of each node that can be split, keyed by frame number
+    frameCommandDict = dict()
+    for dagNode in orderedDependencies:
+        if not dagNode.isEmbarrassinglyParallel() or not dagNode.outputs():
+            continue
+        outputDataPackets = [dag.nodeOutputDataPacket(dagNode, output) for output in dagNode.outputs()]
+        frames = depends_util.framespec("", outputDataPackets[0].sequenceRange)
+        if not frames.isSequence():
+            continue
+        dataPacketDict = dict(dag.nodeOrderedDataPackets(dagNode))
+        splitCommandList = dagNode.executeList(dataPacketDict, splitOperations=True)
+        if len(splitCommandList) != frames.frameCount():
+            continue
+        frameCommandDict[dagNode] = (frames, outputDataPackets, splitCommandList)
+
+    # Start with the frames whose outputs are missing (or all of them if stale)
+    runFrameDict = dict()
+    for dagNode in frameCommandDict:
+        (frames, outputDataPackets, splitCommandList) = frameCommandDict[dagNode]
+        if dag.nodeStaleState(dagNode):
+            runFrameDict[dagNode] = set(xrange(frames.startFrame, frames.endFrame+1))
+            continue
+        presence = None
+        for dataPacket in outputDataPackets:
+            packetPresence = dataPacket.presence()
+            presence = packetPresence if presence is None else bytearray(a & b for (a, b) in zip(presence, packetPresence))
+        runFrameDict[dagNode] = set(frames.startFrame+i for (i, present) in enumerate(presence) if not present)
+
+    # Frames made again upstream (or by other group members) must be made again here
+    plannedNodes = set(orderedDependencies)
+    changed = True
+    while changed:
+        changed = False
+        for dagNode in orderedDependencies:
+            if dagNode not in frameCommandDict:
+                continue
+            (frames, outputDataPackets, splitCommandList) = frameCommandDict[dagNode]
+            allFrames = set(xrange(frames.startFrame, frames.endFrame+1))
+            neighbours = [dp.sourceNode for (input, dp) in dag.nodeOrderedDataPackets(dagNode) if dp.sourceNode in plannedNodes]
+            groupName = dag.nodeInGroupNamed(dagNode)
+            if groupName:
+                neighbours += [n for n in dag.nodeGroupDict[groupName] if n in plannedNodes and n is not dagNode]
+            runFrames = set(runFrameDict[dagNode])
+            for neighbour in neighbours:
+                if neighbour not in frameCommandDict:
+                    runFrames = allFrames
+                    break
+                runFrames |= runFrameDict[neighbour] & allFrames
+            if runFrames != runFrameDict[dagNode]:
+                runFrameDict[dagNode] = runFrames
+                changed = True
+
+    frameSelection = dict()
+    skippedFrameRangeDict = dict()
+    for dagNode in frameCommandDict:
+        (frames, outputDataPackets, splitCommandList) = frameCommandDict[dagNode]
+        runFrames = runFrameDict[dagNode]
+        frameSelection[dagNode] = list()
+        selected = bytearray(frames.frameCount())
+        for i in range(frames.frameCount()):
+            if frames.startFrame+i in runFrames:
+                frameSelection[dagNode].append((frames.startFrame+i, splitCommandList[i]))
+                selected[i] = 1
+        skippedRanges = depends_util.missingIndexRanges(selected)
+        if skippedRanges:
+            skippedFrameRangeDict[dagNode] = [(frames.startFrame+first, frames.startFrame+last) for (first, last) in skippedRanges]
+    return (frameSelection, skippedFrameRangeDict)
+
+
+def executionList(dag, orderedDependencies, onlyMissingFrames=False):
+    """
+    Given a list of dag nodes in the order they must execute (see
+    DAG.orderedNodeDependenciesAt), build the list of ("Node name", [list of
+    commandline arguments]) tuples an output recipe is given.  This is the
+    flattened executionPlan(); see it for details.
+    """
+    return executionPlan(dag, orderedDependencies, onlyMissingFrames).flatten()
+
+
+def executionPlan(dag, orderedDependencies, onlyMissingFrames=False, splitFrames=False, chunkPolicy=None):
+    """
+    Given a list of dag nodes in the order they must execute, build the
+    ExecutionPlan (see depends_execution_plan) an output recipe is given.
+    Each task depends on the tasks of the nodes providing its node's inputs,
+    and on its node's pre-execution hook; post-execution hooks depend on all
+    of their node's commands.  The commands of grouped nodes are split by
+    frame and interleaved, and frame k of a grouped node depends only on
+    frame k of the nodes in its group providing its inputs (the tasks making
+    frame k share a pipeline, see ExecutionTask).  Embarrassingly
+    parallel nodes outside groups are split by frame as well if splitFrames
+    is set.  If onlyMissingFrames is set, the embarrassingly parallel nodes
+    only execute the frames chosen by missingFrameSelection(), and comments
+    listing the frames skipped by each node (and why) lead the plan.  Given
+    a chunk policy (see depends_chunk_policy), the frames split into tasks
+    are gathered into tasks making chunks of consecutive frames instead,
+    and the nodes of a group are chunked alike so chunk k of a grouped node
+    depends only on chunk k of the nodes providing its inputs.
+    """
+    frameSelection = dict()
+    skippedFrameRangeDict = dict()
+    if onlyMissingFrames:
+        (frameSelection, skippedFrameRangeDict) = missingFrameSelection(dag, orderedDependencies)
+
+    # Report the skipped frames as comments
+    plan = depends_execution_plan.ExecutionPlan()
+    for dagNode in orderedDependencies:
+        if dagNode in skippedFrameRangeDict:
+            skippedRanges = depends_util.frameRangesString(skippedFrameRangeDict[dagNode])
+            plan.addTask(dagNode.name + " [Skipped frames]", 
+                         ["#", "Frames %s skipped because their output data is present." % skippedRanges], dagNode)
+
+    # The ids of the tasks each node's consumers wait for
+    finalTaskIdDict = dict()
+    for unit in _executionUnits(dag, orderedDependencies):
+        groupName = dag.nodeInGroupNamed(unit[0]) if dag.nodeGroupCount(unit[0]) else None
+        unitTaskIdDict = dict()
+        preTaskIdDict = dict()
+        frameCommandDict = dict()
+        for dagNode in unit:
+            # A dictionary with key=input & data=datapacket
+            orderedDataPackets = dag.nodeOrderedDataPackets(dagNode)
+            dataPacketDict = dict(orderedDataPackets)
+            providerTaskIds = set()
+            for (input, dataPacket) in orderedDataPackets:
+                if dataPacket.sourceNode in finalTaskIdDict and dataPacket.sourceNode not in unit:
+                    providerTaskIds.update(finalTaskIdDict[dataPacket.sourceNode])
+            finalTaskIdDict[dagNode] = providerTaskIds
+
+            # Nothing at all runs for nodes with no frames to make
+            if dagNode in frameSelection and not frameSelection[dagNode] and not groupName:
+                continue
+
+            # Pre-execution hook
+            preCommandList = dagNode.preProcess(dataPacketDict)
+            if preCommandList:
+                preTask = plan.addTask(dagNode.name + " [Pre-execution]", preCommandList, dagNode, _nodeFrameRange(dag, dagNode), providerTaskIds)
+                preTaskIdDict[dagNode] = set([preTask.id])
+                finalTaskIdDict[dagNode] = set([preTask.id])
+            else:
+                preTaskIdDict[dagNode] = providerTaskIds
+
+            # Command execution, as a list of (frame range, commandline) tuples
+            if dagNode in frameSelection:
+                frameCommandDict[dagNode] = [((x[0], x[0]), x[1]) for x in frameSelection[dagNode]]
+            elif groupName or (splitFrames and dagNode.isEmbarrassinglyParallel()):
+                commandList = dagNode.executeList(dataPacketDict, splitOperations=True)
+                if commandList and all(isinstance(x, list) for x in commandList):
+                    frameCommandDict[dagNode] = zip(_splitFrameRanges(dag, dagNode, len(commandList)), commandList)
+                else:
+                    frameCommandDict[dagNode] = [(_nodeFrameRange(dag, dagNode), commandList)]
+            else:
+                frameCommandDict[dagNode] = [(_nodeFrameRange(dag, dagNode), dagNode.executeList(dataPacketDict))]
+
+            # Nodes outside groups are done here
+            if groupName:
+                continue
+            if chunkPolicy:
+                chunkSize = chunkPolicy.chunkSize(dagNode, len(frameCommandDict[dagNode]))
+                frameCommandDict[dagNode] = _chunkFrameCommands(dagNode, dataPacketDict, frameCommandDict[dagNode], chunkSize)
+            commandTaskIds = set()
+            for (frameRange, commandList) in frameCommandDict[dagNode]:
+                (inputFiles, outputFiles) = _commandFiles(dag, dagNode, frameRange)
+                commandTaskIds.add(plan.addTask(dagNode.name, commandList, dagNode, frameRange, preTaskIdDict[dagNode], inputFiles, outputFiles).id)
+            if commandTaskIds:
+                finalTaskIdDict[dagNode] = commandTaskIds
+            _addPostProcessTask(plan, dag, dagNode, dataPacketDict, finalTaskIdDict)
+
+        if not groupName:
+            continue
+
+        # Interleave the commands of the group frame by frame (or chunk by chunk)
+        groupNodes = [x for x in unit if x in frameCommandDict]
+        if chunkPolicy and groupNodes:
+            chunkSize = min(chunkPolicy.chunkSize(x, len(frameCommandDict[x])) for x in groupNodes)
+            for dagNode in groupNodes:
+                frameCommandDict[dagNode] = _chunkFrameCommands(dagNode, dict(dag.nodeOrderedDataPackets(dagNode)), frameCommandDict[dagNode], chunkSize)
+        for (frameIndex, frameCommands) in enumerate(itertools.izip(*[frameCommandDict[x] for x in groupNodes])):
+            frameTaskIdDict = dict()
+            for (dagNode, (frameRange, commandList)) in zip(groupNodes, frameCommands):
+                predecessorIds = set(preTaskIdDict[dagNode])
+                for (input, dataPacket) in dag.nodeOrderedDataPackets(dagNode):
+                    if dataPacket.sourceNode in frameTaskIdDict:
+                        predecessorIds.add(frameTaskIdDict[dataPacket.sourceNode])
+                (inputFiles, outputFiles) = _commandFiles(dag, dagNode, frameRange)
+                frameTaskIdDict[dagNode] = plan.addTask(groupName, commandList, dagNode, frameRange, predecessorIds, inputFiles, outputFiles, (groupName, frameIndex)).id
+                unitTaskIdDict.setdefault(dagNode, set()).add(frameTaskIdDict[dagNode])
+        for dagNode in groupNodes:
+            if dagNode in unitTaskIdDict:
+                finalTaskIdDict[dagNode] = unitTaskIdDict[dagNode]
+        for dagNode in groupNodes:
+            _addPostProcessTask(plan, dag, dagNode, dict(dag.nodeOrderedDataPackets(dagNode)), finalTaskIdDict)
+    return plan
+
+
+def _executionUnits(dag, orderedDependencies):
+    """
+    Split the given execution order into lists of nodes that are executed
+    together: each group, and each node outside a group.  Units come in the
+    given order where possible, with each group where its first node is, but
+    always after the units they depend on.
+    """
+    unitList = list()
+    unitIndexDict = dict()
+    groupUnitIndexDict = dict()
+    for dagNode in orderedDependencies:
+        groupName = dag.nodeInGroupNamed(dagNode)
+        if groupName and groupName in groupUnitIndexDict:
+            unitList[groupUnitIndexDict[groupName]].append(dagNode)
+        else:
+            if groupName:
+                groupUnitIndexDict[groupName] = len(unitList)
+            unitList.append([dagNode])
+        unitIndexDict[dagNode] = groupUnitIndexDict[groupName] if groupName else len(unitList)-1
+
+    # A topological sort of the units, preferring those earliest in the given order
+    waitingCounts = [0] * len(unitList)
+    dependentIndexDict = dict((i, set()) for i in range(len(unitList)))
+    for (unitIndex, unit) in enumerate(unitList):
+        providerIndices = set()
+        for dagNode in unit:
+            for (input, dataPacket) in dag.nodeOrderedDataPackets(dagNode):
+                providerIndex = unitIndexDict.get(dataPacket.sourceNode)
+                if providerIndex is not None and providerIndex != unitIndex:
+                    providerIndices.add(providerIndex)
+        waitingCounts[unitIndex] = len(providerIndices)
+        for providerIndex in providerIndices:
+            dependentIndexDict[providerIndex].add(unitIndex)
+    readyHeap = [i for i in range(len(unitList)) if not waitingCounts[i]]
+    orderedUnits = list()
+    while readyHeap:
+        unitIndex = heapq.heappop(readyHeap)
+        orderedUnits.append(unitList[unitIndex])
+        for dependentIndex in dependentIndexDict[unitIndex]:
+            waitingCounts[dependentIndex] -= 1
+            if not waitingCounts[dependentIndex]:
+                heapq.heappush(readyHeap, dependentIndex)
+    if len(orderedUnits) != len(unitList):
+        stuckNodes = [n for (i, unit) in enumerate(unitList) if waitingCounts[i] for n in unit]
+        raise RuntimeError("Node group '%s' cannot be executed as a whole, as nodes outside it both depend on it and provide data to it." %
+                           dag.nodeInGroupNamed([n for n in stuckNodes if dag.nodeGroupCount(n)][0]))
+    return orderedUnits
+
+
+def _addPostProcessTask(plan, dag, dagNode, dataPacketDict, finalTaskIdDict):
+    """
+    Add the given node's post-execution hook (if it has one) to the plan,
+    after the node's other tasks.
+    """
+    postCommandList = dagNode.postProcess(dataPacketDict)
+    if postCommandList:
+        postTask = plan.addTask(dagNode.name + " [Post-execution]", postCommandList, dagNode, _nodeFrameRange(dag, dagNode), finalTaskIdDict[dagNode])
+        finalTaskIdDict[dagNode] = set([postTask.id])
+
+
+def _chunkFrameCommands(dagNode, dataPacketDict, frameCommands, chunkSize):
+    """
+    Given a node's list of (frame range, commandline) tuples, gather the
+    commands making single frames into commands making chunks of up to the
+    given number of consecutive frames.  Nodes that execute frame chunks
+    are asked for each chunk's command (see DagNode.chunkFrameRange), and
+    the per-frame commands of other nodes are joined with "&&" to run one
+    after another (stopping at the first to fail).  Lists of commands that
+    aren't made of single frames are returned unchanged.
+    """
+    if chunkSize < 2 or len(frameCommands) < 2:
+        return frameCommands
+    if not all(frameRange and frameRange[0] == frameRange[1] for (frameRange, commandList) in frameCommands):
+        return frameCommands
+    frameCommandDict = dict((frameRange[0], commandList) for (frameRange, commandList) in frameCommands)
+    chunkCommands = list()
+    for frameList in depends_chunk_policy.frameChunks(sorted(frameCommandDict), chunkSize):
+        frameRange = (frameList[0], frameList[-1])
+        if dagNode.executesFrameChunks():
+            dagNode.setChunkFrameRange(frameRange)
+            try:
+                commandList = dagNode.executeList(dataPacketDict)
+            finally:
+                dagNode.setChunkFrameRange(None)
+        else:
+            commandList = list()
+            for frame in frameList:
+                if commandList and frameCommandDict[frame]:
+                    commandList.append("&&")
+                commandList += frameCommandDict[frame]
+        chunkCommands.append((frameRange, commandList))
+    return chunkCommands
+
+
+def _nodeFrameRange(dag, dagNode):
+    """
+    The (first, last) range of frames a node makes, or None.
+    """
+    if not dagNode.outputs():
+        return None
+    frames = depends_util.framespec("", dag.nodeOutputDataPacket(dagNode, dagNode.outputs()[0]).sequenceRange)
+    if not frames.isSequence():
+        return None
+    return (frames.startFrame, frames.endFrame)
+
+
+def _commandFiles(dag, dagNode, frameRange):
+    """
+    A tuple containing the list of files a node's command making the given
+    range of frames (or all of them, if None) reads from its inputs, and the
+    list it writes to its outputs.  Embarrassingly parallel nodes make each
+    frame from the same frame of their inputs, but other nodes are taken to
+    read all of their input frames.
+    """
+    inputRange = frameRange if dagNode.isEmbarrassinglyParallel() else None
+    inputFiles = list()
+    for (input, dataPacket) in dag.nodeOrderedDataPackets(dagNode):
+        inputFiles += _dataPacketFiles(dataPacket, inputRange)
+    outputFiles = list()
+    for output in dagNode.outputs():
+        outputFiles += _dataPacketFiles(dag.nodeOutputDataPacket(dagNode, output), frameRange)
+    return (_withoutRepeats(inputFiles), _withoutRepeats(outputFiles))
+
+
+def _dataPacketFiles(dataPacket, frameRange):
+    """
+    The filenames of each of a data packet's file descriptors within the
+    given range of frames (or all of them, if None).
+    """
+    filenameList = list()
+    for descriptorName in sorted(dataPacket.filenames):
+        if not dataPacket.filenames[descriptorName]:
+            continue
+        fileDescriptor = dataPacket.fileDescriptorNamed(descriptorName)
+        if frameRange is None or not fileDescriptor.isSequence():
+            filenameList += fileDescriptor.iterFrames()
+            continue
+        for frame in range(max(frameRange[0], fileDescriptor.startFrame), min(frameRange[1], fileDescriptor.endFrame)+1):
+            filenameList.append(fileDescriptor.frame(frame - fileDescriptor.startFrame))
+    return filenameList
+
+
+def _withoutRepeats(itemList):
+    """
+    The given list with only the first of any repeated items.
+    """
+    seen = set()
+    uniqueList = list()
+    for item in itemList:
+        if item not in seen:
+            seen.add(item)
+            uniqueList.append(item)
+    return uniqueList
+
+
+def _splitFrameRanges(dag, dagNode, commandCount):
+    """
+    The frame range of each of the given number of commands a node returned
+    with its operations split, one frame each if the numbers agree.
+    """
+    frameRange = _nodeFrameRange(dag, dagNode)
+    if frameRange is None or frameRange[1]-frameRange[0]+1 != commandCount:
+        return [frameRange] * commandCount
+    return [(frame, frame) for frame in range(frameRange[0], frameRange[1]+1)]
+
+
+def executeNode(dag, dagNode, outputRecipe, destFileOrDir, executeImmediately=False, onlyMissingFrames=False, artifactStore=None, resume=False):
+    """
+    Generate an execution script using the given output recipe object for the
+    given node.  Takes a path for where to write the execution script, and
+    offers the ability to evaluate the script immediately.  Embarrassingly
+    parallel nodes can be limited to the frames that are missing (see
+    executionList).  When executing immediately with an artifact store, nodes
+    whose outputs are in the store are materialized rather than executed, and
+    the outputs of the nodes that do execute are added to it.  Frames split
+    into tasks are chunked by the policy given by DEPENDS_CHUNK_POLICY (see
+    depends_chunk_policy), with duration policies estimating the time frames
+    take from the execution journal of the last execution.  Recipes
+    executing immediately record the tasks they finish in an execution
+    journal (see journalPath), and with resume set, the tasks the journal
+    says are complete are skipped if their outputs are still present.
+    Returns False if the nodes involved did not pass the sanity check, or if
+    any command executed immediately failed (in which case the recipe's
+    executionFailed is set).
+
+    This is done in three steps (see prepareExecution, runExecution, and
+    finishExecution), so the user interface can run the commands in a
+    worker thread.
+    """
+    execution = prepareExecution(dag, dagNode, outputRecipe, destFileOrDir, executeImmediately, onlyMissingFrames, artifactStore, resume)
+    if execution is None:
+        return False
+    runExecution(execution)
+    return finishExecution(execution)
+
+
+def prepareExecution(dag, dagNode, outputRecipe, destFileOrDir, executeImmediately=False, onlyMissingFrames=False, artifactStore=None, resume=False):
+    """
+    The first step of executeNode, taking the same arguments: check the
+    nodes involved, materialize what the artifact store holds, and make the
+    execution plan.  The version of every node in the DAG is noted, so
+    edits made while the commands run can be noticed (see editedNodes).
+    Returns a dict of what the other steps need, or None if the nodes did
+    not pass the sanity check.
+    """
+    # Convert this ordered list into an execution recipe and give it to a plugin that knows what to do with it.
+    orderedDependencies = dag.orderedNodeDependenciesAt(dagNode)
+    try:
+        sanityCheck(dag, orderedDependencies)
+    except Exception, err:
+        print err
+        print "Aborting Dag execution."
+        return None
+
+    # Reuse whatever the artifact store already holds
+    materializedNodes = list()
+    if executeImmediately and artifactStore:
+        materializedNodes = materializeArtifacts(dag, orderedDependencies, artifactStore)
+        orderedDependencies = [n for n in orderedDependencies if n not in materializedNodes]
+        depends_artifact_store.unshareOutputs(dag, orderedDependencies)
+
+    # Duration policies need to know how long each type of node takes to make a frame
+    chunkPolicy = depends_chunk_policy.chunkPolicyFromEnvironment()
+    if isinstance(chunkPolicy, depends_chunk_policy.DurationChunkPolicy):
+        chunkPolicy.frameSecondsDict.update(depends_journal.ExecutionJournal(journalPath(dagNode, destFileOrDir)).frameSecondsDict())
+    plan = executionPlan(dag, orderedDependencies, onlyMissingFrames, splitFrames=outputRecipe.runsConcurrently(),
+                         chunkPolicy=chunkPolicy)
+
+    # Journal each finished task, carrying on from an earlier journal if resuming
+    journal = None
+    if executeImmediately:
+        journal = depends_journal.ExecutionJournal(journalPath(dagNode, destFileOrDir))
+        if resume:
+            plan = depends_journal.resumedPlan(plan, journal.completedTaskKeys())
+        journal.start(dagNode.name, resume)
+    return {"dag": dag,
+            "dagNode": dagNode,
+            "outputRecipe": outputRecipe,
+            "destFileOrDir": destFileOrDir,
+            "executeImmediately": executeImmediately,
+            "artifactStore": artifactStore,
+            "orderedDependencies": orderedDependencies,
+            "materializedNodes": materializedNodes,
+            "plan": plan,
+            "journal": journal,
+            "nodeVersions": dict((n, n.version) for n in dag.nodes()),
+            "variablesGeneration": depends_variables.generation}
+
+
+def runExecution(execution):
+    """
+    The second step of executeNode: give the plan of the given execution
+    (see prepareExecution) to its recipe, which writes a script and runs
+    the commands if executing immediately.  Nothing here touches the DAG,
+    so it may be called from a worker thread.
+    """
+    outputRecipe = execution["outputRecipe"]
+    outputRecipe.journal = execution["journal"]
+    outputRecipe.executionFailed = False
+    try:
+        outputRecipe.generatePlan(execution["plan"], execution["destFileOrDir"], execution["executeImmediately"])
+    finally:
+        outputRecipe.journal = None
+        if execution["journal"]:
+            execution["journal"].close()
+
+
+def finishExecution(execution):
+    """
+    The last step of executeNode: note the outputs the given execution (see
+    prepareExecution) wrote, recording the fingerprints of the nodes it made
+    (see madeNodes) and adding them to the artifact store.  The nodes it
+    failed to make, and those edited since it was prepared (see
+    editedNodes), are recorded as having failed, as their outputs may not
+    match them.  Returns what executeNode does.
+    """
+    dag = execution["dag"]
+    orderedDependencies = execution["orderedDependencies"]
+    materializedNodes = execution["materializedNodes"]
+    artifactStore = execution["artifactStore"]
+
+    # The outputs just written should be seen the next time anything checks for them
+    if execution["executeImmediately"]:
+        depends_file_cache.invalidate(outputDirectories(orderedDependencies + materializedNodes))
+        changedNodes = editedNodes(execution)
+        executedNodes = [n for n in madeNodes(execution) if n not in changedNodes]
+        keptNodes = [n for n in materializedNodes if n not in changedNodes]
+        recordFingerprints(dag, executedNodes + keptNodes, [n for n in orderedDependencies + materializedNodes if n not in executedNodes + keptNodes])
+        if artifactStore:
+            storeArtifacts(dag, executedNodes, artifactStore)
+            (hits, misses, entryCount, totalBytes) = artifactStore.statistics()
+            print "Artifact store: %d hits, %d misses, %d entries holding %d bytes." % (hits, misses, entryCount, totalBytes)
+    return not (execution["executeImmediately"] and execution["outputRecipe"].executionFailed)
+
+
+def madeNodes(execution):
+    """
+    Return the nodes the given execution (see prepareExecution) executed
+    that it is known to have made: those every task of which the recipe
+    says finished successfully (see OutputRecipe.completedTaskIds).  Nodes
+    with a task that failed, or was skipped because another failed, may
+    have left partial or old outputs behind.
+    """
+    completedTaskIds = execution["outputRecipe"].completedTaskIds(execution["plan"])
+    unfinishedNodes = set()
+    for task in execution["plan"].tasks:
+        if task.commandList and not task.isComment() and task.id not in completedTaskIds:
+            unfinishedNodes.add(task.dagNode)
+    return [n for n in execution["orderedDependencies"] if n not in unfinishedNodes]
+
+
+def editedNodes(execution):
+    """
+    Return the set of the nodes of the given execution's DAG that were
+    edited (or removed) since the execution was prepared, along with every
+    node depending on one of them, or all of its nodes if the workflow
+    variables changed.  Their fingerprints no longer describe what the
+    execution made from them.
+    """
+    dag = execution["dag"]
+    nodeVersions = execution["nodeVersions"]
+    if depends_variables.generation != execution["variablesGeneration"]:
+        return set(nodeVersions)
+    currentNodes = set(dag.nodes())
+    changedNodes = set()
+    for (dagNode, version) in nodeVersions.items():
+        if dagNode in changedNodes:
+            continue
+        if dagNode not in currentNodes:
+            changedNodes.add(dagNode)
+        elif dagNode.version != version:
+            changedNodes.add(dagNode)
+            changedNodes.update(dag.allNodesDependingOnNode(dagNode))
+    return changedNodes
+
+
+def journalPath(dagNode, destFileOrDir):
+    """
+    Return the path of the execution journal for executions of the given
+    node writing their scripts to the given dir or path: the path named by
+    the DEPENDS_JOURNAL environment variable, or a file named after the node
+    in the given dir, or the given path with '.journal' appended.
+    """
+    if os.environ.get('DEPENDS_JOURNAL'):
+        return os.environ.get('DEPENDS_JOURNAL')
+    if os.path.isdir(destFileOrDir):
+        return os.path.join(destFileOrDir, "depends_%s.journal" % dagNode.uuid)
+    return destFileOrDir + ".journal"
+
+
+def recordFingerprints(dag, dagNodes, failedNodes=None):
+    """
+    Record the current fingerprint of each of the given nodes whose output
+    data is all present, so later executions know what they were made from.
+    Nodes whose outputs are missing (probably having failed) are forgotten.
+    The given failed nodes (see madeNodes) are recorded as having failed,
+    so the outputs they may have left behind are taken to be out of date.
+    """
+    if not dag.fingerprintStore:
+        return
+    madeNodes = list()
+    missingNodes = list()
+    for dagNode in dagNodes:
+        if all(dag.nodeOutputDataPacket(dagNode, output).dataPresent() for output in dagNode.outputs()):
+            madeNodes.append(dagNode)
+        else:
+            missingNodes.append(dagNode)
+    fingerprintCache = dict()
+    dag.fingerprintStore.record([(n, depends_fingerprint.nodeFingerprint(dag, n, fingerprintCache)) for n in madeNodes])
+    dag.fingerprintStore.record([(n, depends_fingerprint.FAILED_FINGERPRINT) for n in failedNodes or []])
+    dag.fingerprintStore.forget(missingNodes)
+
+
+def artifactStoreFromEnvironment():
+    """
+    Return the artifact store named by the DEPENDS_ARTIFACT_STORE environment
+    variable, limited to DEPENDS_ARTIFACT_STORE_SIZE megabytes if that is set,
+    or None if there isn't one.
+    """
+    rootDir = os.environ.get('DEPENDS_ARTIFACT_STORE')
+    if not rootDir:
+        return None
+    maxBytes = depends_artifact_store.DEFAULT_MAX_BYTES
+    if os.environ.get('DEPENDS_ARTIFACT_STORE_SIZE'):
+        maxBytes = int(os.environ.get('DEPENDS_ARTIFACT_STORE_SIZE')) * 1024 * 1024
+    return depends_artifact_store.ArtifactStore(rootDir, maxBytes)
+
+
+def materializeArtifacts(dag, orderedDependencies, artifactStore):
+    """
+    Walk the given execution order and materialize each node whose outputs
+    are held in the artifact store.  A node's fingerprint depends on its
+    input files, so only nodes none of whose providers are still waiting to
+    execute can be looked up.  Returns the list of materialized nodes.
+    """
+    materializedNodes = list()
+    waitingNodes = set(orderedDependencies)
+    for dagNode in orderedDependencies:
+        providers = [dp.sourceNode for (input, dp) in dag.nodeOrderedDataPackets(dagNode)]
+        if any(p in waitingNodes for p in providers):
+            continue
+        key = depends_fingerprint.nodeFingerprint(dag, dagNode, locationIndependent=True)
+        if artifactStore.materialize(key, dag, dagNode):
+            materializedNodes.append(dagNode)
+            waitingNodes.discard(dagNode)
+    return materializedNodes
+
+
+def storeArtifacts(dag, dagNodes, artifactStore):
+    """
+    Add the outputs of each of the given nodes whose output data is all
+    present to the artifact store.  Only nodes known to have been made
+    successfully (see madeNodes) should be given, as a failed command's
+    partial output would otherwise be reused by every workflow with the
+    same fingerprint.
+    """
+    fingerprintCache = dict()
+    for dagNode in dagNodes:
+        if not all(dag.nodeOutputDataPacket(dagNode, output).dataPresent() for output in dagNode.outputs()):
+            continue
+        key = depends_fingerprint.nodeFingerprint(dag, dagNode, fingerprintCache, locationIndependent=True)
+        artifactStore.store(key, dag, dagNode)
+
+
+def outputDirectories(dagNodes):
+    """
+    Return a list of the directories the outputs of the given dag nodes are
+    written to.
+    """
+    dirSet = set()
+    for dagNode in dagNodes:
+        for output in dagNode.outputs():
+            for subName in output.subOutputNames():
+                filename = dagNode.outputValue(output.name, subName)
+                if filename:
+                    dirSet.add(os.path.dirname(filename))
+    return list(dirSet)
@@ -0,0 +1,139 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+
+"""
+The execution plan handed to output recipes: a graph of tasks, each a single
+command line belonging to a node (and perhaps a range of its frames), with
+the ids of the tasks that must finish before it can start.  Recipes able to
+run tasks concurrently or hand them to a render farm can schedule them from
+the graph.  Recipes that only run commands one after another use flatten(),
+which gives the ordered list of ("Node name", [list of commandline
+arguments]) tuples recipes have always been given.
+
+Plans are built by depends_engine.executionPlan().
+"""
+
+
+###############################################################################
+###############################################################################
+class ExecutionTask(object):
+    """
+    A single command line to execute.  The frame range is a (first, last)
+    tuple of the node's frames the command makes, or None when unknown, and
+    the input and output files are the files the command reads from its
+    node's inputs and writes to its outputs (known for node commands, not
+    for their hooks).  Tasks carrying a frame (or a chunk of frames) through
+    a node group have a pipeline: a (group name, frame index) tuple shared by
+    the tasks of the group making the same frames, which depend only on each
+    other (and on tasks outside the group).  Comment tasks (whose commandline
+    starts with "#") are notes to be shown to the user rather than executed,
+    and tasks with empty commandlines do nothing.
+    """
+
+    def __init__(self, id, name, commandList, dagNode=None, frameRange=None, predecessorIds=None, inputFiles=None, outputFiles=None, pipeline=None):
+        """
+        """
+        self.id = id
+        self.name = name
+        self.commandList = commandList
+        self.dagNode = dagNode
+        self.frameRange = frameRange
+        self.predecessorIds = list(predecessorIds) if predecessorIds else list()
+        self.inputFiles = list(inputFiles) if inputFiles else list()
+        self.outputFiles = list(outputFiles) if outputFiles else list()
+        self.pipeline = pipeline
+
+
+    def isComment(self):
+        """
+        Return whether this task is a comment rather than a command.
+        """
+        return bool(self.commandList) and self.commandList[0] == "#"
+
+
+    def __repr__(self):
+        """
+        """
+        return "ExecutionTask(%d, %r, %r)" % (self.id, self.name, self.commandList)
+
+
+###############################################################################
+###############################################################################
+class ExecutionPlan(object):
+    """
+    A list of ExecutionTasks, in an order that executes each task after its
+    predecessors, whose ids are their indices in the list.
+    """
+
+    def __init__(self):
+        """
+        """
+        self.tasks = list()
+
+
+    def addTask(self, name, commandList, dagNode=None, frameRange=None, predecessorIds=None, inputFiles=None, outputFiles=None, pipeline=None):
+        """
+        Append a task depending on the tasks with the given ids, which must
+        already be in the plan, and return it.
+        """
+        for predecessorId in predecessorIds or list():
+            if predecessorId < 0 or predecessorId >= len(self.tasks):
+                raise RuntimeError("Task '%s' depends on a task (%d) that is not in the plan." % (name, predecessorId))
+        task = ExecutionTask(len(self.tasks), name, commandList, dagNode, frameRange, sorted(set(predecessorIds or list())), inputFiles, outputFiles, pipeline)
+        self.tasks.append(task)
+        return task
+
+
+    def task(self, taskId):
+        """
+        Return the task with the given id.
+        """
+        return self.tasks[taskId]
+
+
+    def tasksForNode(self, dagNode):
+        """
+        Return a list of the tasks belonging to the given node, in order.
+        """
+        return [x for x in self.tasks if x.dagNode is dagNode]
+
+
+    def successorIdDict(self):
+        """
+        Return a dict of task id -> list of the ids of the tasks depending on
+        it directly.
+        """
+        successorIdDict = dict((x.id, list()) for x in self.tasks)
+        for task in self.tasks:
+            for predecessorId in task.predecessorIds:
+                successorIdDict[predecessorId].append(task.id)
+        return successorIdDict
+
+
+    def levels(self):
+        """
+        Return a list of lists of tasks, where each task comes in the first
+        list after those of all of its predecessors.  The tasks in each list
+        can run at the same time once the lists before it are done.
+        """
+        levelList = list()
+        taskLevels = list()
+        for task in self.tasks:
+            level = max([taskLevels[x]+1 for x in task.predecessorIds] or [0])
+            taskLevels.append(level)
+            if level == len(levelList):
+                levelList.append(list())
+            levelList[level].append(task)
+        return levelList
+
+
+    def flatten(self):
+        """
+        Return the list of ("Node name", [list of commandline arguments])
+        tuples recipes that run commands one after another are given.
+        """
+        return [(x.name, x.commandList) for x in self.tasks]
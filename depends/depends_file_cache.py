@@ -0,0 +1,170 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import time
+
+import depends_util
+
+
+"""
+A process-wide cache of which files exist on disk, consulted when DataPackets
+check whether their data is present.  The user interface asks this question
+every time a node is drawn, and answering it from the filesystem each time
+is slow for long sequences and network disks.
+
+What is known about each directory is trusted for TTL seconds.  After that,
+a single stat of the directory tells whether its modification time has
+changed; if not, its entries are trusted for another TTL.  Anything that
+writes files Depends may be asked about should call invalidate() with the
+paths it wrote so the next check sees them straight away.
+
+The cache is read from the user interface's status worker threads.  Two
+threads checking the same directory at once may both go to disk, and the
+hit/miss counters are approximate, but the answers are always correct.
+"""
+
+
+###########################################################################
+###########################################################################
+# How long (in seconds) a directory's cached status is used before checking
+# its modification time again
+TTL = 2.0
+
+# Directory modification times closer than this (in seconds) to the moment
+# they were read may not reflect changes made in the same clock tick (network
+# filesystems are often only accurate to the second), so such directories are
+# listed again rather than trusted
+MTIME_RACE_WINDOW = 2.0
+
+# A "static" dict of cached directory status, keyed by directory name
+directoryStatusDict = dict()
+
+# Counters reporting how useful the cache is
+cacheHits = 0
+cacheMisses = 0
+
+
+###########################################################################
+## Cache entries
+###########################################################################
+class DirectoryStatus(object):
+    """
+    What is known about one directory: its modification time when it was
+    last checked, its full listing (if it has been listed), and the presence
+    of individual files that were checked without listing it.
+    """
+
+    def __init__(self, dirName, checkedTime):
+        """
+        """
+        self.checkedTime = checkedTime
+        try:
+            self.mtime = os.stat(dirName if dirName else os.curdir).st_mtime
+        except OSError:
+            self.mtime = None
+        self.racy = self.mtime is not None and checkedTime - self.mtime < MTIME_RACE_WINDOW
+        self.listing = None
+        self.fileExistsDict = dict()
+
+
+    def stillValid(self, dirName, now):
+        """
+        Return whether this status can still be used, refreshing its check
+        time if the directory's modification time shows it has not changed.
+        """
+        if now - self.checkedTime < TTL:
+            return True
+        if self.racy:
+            return False
+        try:
+            mtime = os.stat(dirName if dirName else os.curdir).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self.mtime:
+            return False
+        self.checkedTime = now
+        return True
+
+
+###########################################################################
+## Queries
+###########################################################################
+def filesPresent(filenameList):
+    """
+    A cached version of depends_util.filesPresent().  Returns a tuple
+    containing a bytearray with a 1 or 0 for each given file, in order, and a
+    boolean stating whether all of them are present.
+    """
+    global cacheHits
+    global cacheMisses
+    presence = bytearray(len(filenameList))
+    indicesInDir = dict()
+    for i, filename in enumerate(filenameList):
+        (dirName, baseName) = os.path.split(filename)
+        if not baseName:
+            presence[i] = os.path.exists(filename)
+            continue
+        indicesInDir.setdefault(dirName, list()).append((i, baseName))
+
+    now = time.time()
+    for dirName in indicesInDir:
+        entries = indicesInDir[dirName]
+        status = directoryStatusDict.get(dirName)
+        if status is not None and status.stillValid(dirName, now):
+            cacheHits += 1
+        else:
+            cacheMisses += 1
+            status = DirectoryStatus(dirName, now)
+            directoryStatusDict[dirName] = status
+        if status.mtime is None:
+            continue
+
+        # Large groups (or directories already listed) are answered from the listing
+        if status.listing is None and len(entries) >= depends_util.LIST_DIR_THRESHOLD:
+            try:
+                status.listing = frozenset(os.listdir(dirName if dirName else os.curdir))
+            except OSError:
+                status.listing = frozenset()
+        if status.listing is not None:
+            for (i, baseName) in entries:
+                presence[i] = baseName in status.listing
+            continue
+
+        for (i, baseName) in entries:
+            if baseName not in status.fileExistsDict:
+                status.fileExistsDict[baseName] = os.path.exists(os.path.join(dirName, baseName))
+            presence[i] = status.fileExistsDict[baseName]
+    return (presence, all(presence))
+
+
+def statistics():
+    """
+    Return a tuple containing the number of directory lookups answered from
+    the cache, the number that went to disk, and the number of directories
+    presently cached.
+    """
+    return (cacheHits, cacheMisses, len(directoryStatusDict))
+
+
+###########################################################################
+## Invalidation
+###########################################################################
+def invalidate(pathList=None):
+    """
+    Forget what is known about the given files or directories (or everything,
+    if no list is given).  Files invalidate the directory they live in.
+    """
+    if pathList is None:
+        directoryStatusDict.clear()
+        return
+    normalizedDirs = set()
+    for path in pathList:
+        normalizedDirs.add(os.path.normpath(path))
+        normalizedDirs.add(os.path.normpath(os.path.dirname(path)))
+    for dirName in list(directoryStatusDict.keys()):
+        if os.path.normpath(dirName) in normalizedDirs:
+            directoryStatusDict.pop(dirName, None)
@@ -0,0 +1,192 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+
+"""
+Node fingerprints and the persistent store that remembers them.  A node's
+fingerprint is a hash of its type, its (variable substituted) attribute,
+input, and output values, the files it reads from its inputs, and the
+fingerprints of the nodes upstream of it.  The fingerprint of each node
+that executes is recorded in a small SQLite database next to the workflow,
+so a later execution can tell which nodes' outputs are out of date even
+though their files exist, and which are up to date.  Nodes an execution
+failed to make are recorded with FAILED_FINGERPRINT, which never matches,
+so whatever they left behind is out of date until they execute again.
+
+Input files are identified by their size and modification time, which is
+cheap.  Setting CONTENT_HASH hashes their contents instead, which notices
+files rewritten with identical timestamps but reads every input in full.
+"""
+
+
+###############################################################################
+###############################################################################
+# Hash the contents of input files rather than their size and modification time
+CONTENT_HASH = False
+
+# The size of the blocks input files are read in when hashing their contents
+CONTENT_HASH_BLOCK_SIZE = 1024 * 1024
+
+# The suffix appended to a workflow's filename to name its fingerprint store
+STORE_SUFFIX = ".fingerprints"
+
+# Recorded for nodes an execution failed to make, in place of a fingerprint
+FAILED_FINGERPRINT = "failed"
+
+
+###############################################################################
+## Fingerprints
+###############################################################################
+def fileFingerprint(filename):
+    """
+    Return a string identifying the current contents of a file on disk, or
+    "missing" if it does not exist.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return "missing"
+    if not CONTENT_HASH:
+        # Milliseconds survive copies made with shutil.copy2, which finer times may not
+        return "%d:%d" % (stat.st_size, int(stat.st_mtime * 1000))
+    contentHash = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        block = fp.read(CONTENT_HASH_BLOCK_SIZE)
+        while block:
+            contentHash.update(block)
+            block = fp.read(CONTENT_HASH_BLOCK_SIZE)
+    return contentHash.hexdigest()
+
+
+def nodeFingerprint(dag, dagNode, fingerprintCache=None, locationIndependent=False):
+    """
+    Return a hex string hashing everything that decides what the given node
+    writes: its type, its substituted attribute, input, and output values and
+    ranges, the fingerprints of the files arriving at its inputs, and the
+    fingerprints of the nodes providing them (so a change anywhere upstream
+    changes every fingerprint below it).  A dict can be given to share the
+    fingerprints computed along the way between calls (each dict should only
+    be used with one value of locationIndependent).
+
+    Location independent fingerprints leave out where files are read from and
+    written to, so the same work done in another version of a workflow (or
+    another workflow entirely) has the same fingerprint.
+    """
+    if fingerprintCache is None:
+        fingerprintCache = dict()
+
+    # Providers are fingerprinted first.  A stack stands in for recursion, as
+    # long chains of nodes would otherwise exceed Python's recursion limit.
+    stack = [dagNode]
+    while stack:
+        currentNode = stack[-1]
+        if currentNode in fingerprintCache:
+            stack.pop()
+            continue
+        providers = [dp.sourceNode for (input, dp) in dag.nodeOrderedDataPackets(currentNode) if dp.sourceNode not in fingerprintCache]
+        if providers:
+            stack.extend(providers)
+            continue
+        fingerprintCache[currentNode] = _singleNodeFingerprint(dag, currentNode, fingerprintCache, locationIndependent)
+        stack.pop()
+    return fingerprintCache[dagNode]
+
+
+def _singleNodeFingerprint(dag, dagNode, fingerprintCache, locationIndependent):
+    """
+    The fingerprint of a node whose providers' fingerprints are all in the
+    given cache.
+    """
+    nodeHash = hashlib.sha1()
+    # Values are serialized as json so str and unicode strings hash alike
+    def add(*items):
+        nodeHash.update(json.dumps(items))
+        nodeHash.update("\n")
+
+    add("TYPE", type(dagNode).__name__)
+    for attribute in sorted(dagNode.attributes(), key=lambda a: a.name):
+        add("ATTRIBUTE", attribute.name, dagNode.attributeValue(attribute.name), dagNode.attributeRange(attribute.name))
+    for output in sorted(dagNode.outputs(), key=lambda o: o.name):
+        if not locationIndependent:
+            for subName in sorted(output.subOutputNames()):
+                add("OUTPUT", output.name, subName, dagNode.outputValue(output.name, subName))
+        add("OUTPUT RANGE", output.name, dagNode.outputRange(output.name))
+    for input in sorted(dagNode.inputs(), key=lambda i: i.name):
+        if locationIndependent:
+            add("INPUT RANGE", input.name, dagNode.inputRange(input.name))
+        else:
+            add("INPUT", input.name, dagNode.inputValue(input.name), dagNode.inputRange(input.name))
+    for (input, dataPacket) in sorted(dag.nodeOrderedDataPackets(dagNode), key=lambda x: x[0].name):
+        add("PROVIDER", input.name, fingerprintCache[dataPacket.sourceNode])
+        for descriptorName in sorted(dataPacket.filenames):
+            for (frameIndex, filename) in enumerate(dataPacket.fileDescriptorNamed(descriptorName).iterFrames()):
+                add("FILE", input.name, descriptorName, frameIndex if locationIndependent else filename, fileFingerprint(filename))
+    return nodeHash.hexdigest()
+
+
+###############################################################################
+## Persistent store
+###############################################################################
+class FingerprintStore(object):
+    """
+    The fingerprints each node had when it last executed, kept in an SQLite
+    database and keyed by node UUID.
+    """
+
+    def __init__(self, databaseFilename):
+        """
+        """
+        self.databaseFilename = databaseFilename
+        self.connection = sqlite3.connect(databaseFilename)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS fingerprints "
+                                "(uuid TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, recorded REAL NOT NULL)")
+        self.connection.commit()
+
+
+    def fingerprint(self, dagNode):
+        """
+        Return the fingerprint recorded for the given node, or None if none
+        has been.
+        """
+        row = self.connection.execute("SELECT fingerprint FROM fingerprints WHERE uuid = ?", (str(dagNode.uuid),)).fetchone()
+        return row[0] if row else None
+
+
+    def record(self, dagNodeFingerprintList):
+        """
+        Record a list of (dag node, fingerprint) tuples.
+        """
+        now = time.time()
+        self.connection.executemany("INSERT OR REPLACE INTO fingerprints (uuid, fingerprint, recorded) VALUES (?, ?, ?)",
+                                    [(str(n.uuid), f, now) for (n, f) in dagNodeFingerprintList])
+        self.connection.commit()
+
+
+    def forget(self, dagNodes):
+        """
+        Remove the fingerprints recorded for the given nodes.
+        """
+        self.connection.executemany("DELETE FROM fingerprints WHERE uuid = ?", [(str(n.uuid),) for n in dagNodes])
+        self.connection.commit()
+
+
+    def close(self):
+        """
+        """
+        self.connection.close()
+
+
+def storeFilenameForWorkflow(workflowFilename):
+    """
+    Return the filename of the fingerprint store kept next to a workflow.
+    """
+    return workflowFilename + STORE_SUFFIX
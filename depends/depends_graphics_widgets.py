@@ -9,6 +9,7 @@ import math
 from PySide import QtCore, QtGui
 
 import depends_node
+import depends_status_model
 import depends_undo_commands
 
 
@@ -117,7 +118,7 @@ class DrawNode(QtGui.QGraphicsItem):
         # For handling movement undo/redos of groups of objects
         # This is a little strange to be handled by the node itself 
         # and maybe can move elsewhere?
-        self.clickSnap = None
+        self.clickPositions = None
         self.clickPosition = None
 
         if type(self.dagNode) == depends_node.DagNodeDot:
@@ -209,7 +210,9 @@ class DrawNode(QtGui.QGraphicsItem):
         little light denoting if it already has data present and/or if it is
         in a "stale" state.
         """
-        inputsFulfilled = self.scene().dag.nodeAllInputsDataPresent(self.dagNode)
+        # Disk status comes from the scene's status model, which may not know it yet
+        status = self.scene().statusModel.nodeStatus(self.dagNode)
+        inputsFulfilled = status.inputsFulfilled if status else False
         
         # Draw the box
         gradient = QtGui.QLinearGradient(0, -self.height/2, 0, self.height/2)
@@ -242,12 +245,12 @@ class DrawNode(QtGui.QGraphicsItem):
 
         # The "data present" light
         painter.setPen(QtGui.QPen(QtGui.QColor(0, 0, 0), 0.25))
-        for output in self.dagNode.outputs():
-            if self.scene().dag.nodeOutputDataPacket(self.dagNode, output).dataPresent():
-                painter.setBrush(QtGui.QBrush(QtGui.QColor(0, 255, 0)))
-            else:
-                painter.setBrush(QtGui.QBrush(QtGui.QColor(255, 0, 0)))
-                break
+        if not status:
+            painter.setBrush(QtGui.QBrush(QtGui.QColor(128, 128, 128)))
+        elif status.outputsPresent is True:
+            painter.setBrush(QtGui.QBrush(QtGui.QColor(0, 255, 0)))
+        elif status.outputsPresent is False:
+            painter.setBrush(QtGui.QBrush(QtGui.QColor(255, 0, 0)))
 
         # The stale light overrides all
         if self.scene().dag.nodeStaleState(self.dagNode):
@@ -273,7 +276,10 @@ class DrawNode(QtGui.QGraphicsItem):
         QtGui.QGraphicsItem.mousePressEvent(self, event)
         
         # Let the QT parent class handle the selection process before querying what's selected
-        self.clickSnap = self.scene().dag.snapshot(nodeMetaDict=self.scene().nodeMetaDict(), connectionMetaDict=self.scene().connectionMetaDict())
+        movingDrawNodes = [n for n in self.scene().selectedItems() if type(n) == DrawNode]
+        if self not in movingDrawNodes:
+            movingDrawNodes.append(self)
+        self.clickPositions = dict((n.dagNode, n.pos()) for n in movingDrawNodes)
         self.clickPosition = self.pos()
         
 
@@ -283,8 +289,8 @@ class DrawNode(QtGui.QGraphicsItem):
         """
         # Don't register undos for selections without moves
         if self.pos() != self.clickPosition:
-            currentSnap = self.scene().dag.snapshot(nodeMetaDict=self.scene().nodeMetaDict(), connectionMetaDict=self.scene().connectionMetaDict())
-            self.scene().undoStack().push(depends_undo_commands.SceneOnlyUndoCommand(self.clickSnap, currentSnap, self.scene()))
+            releasePositions = dict((dagNode, self.scene().drawNode(dagNode).pos()) for dagNode in self.clickPositions)
+            self.scene().undoStack().push(depends_undo_commands.NodeMoveUndoCommand(self.clickPositions, releasePositions, self.scene()))
         QtGui.QGraphicsItem.mouseReleaseEvent(self, event)
 
 
@@ -471,14 +477,17 @@ class DrawEdge(QtGui.QGraphicsItem):
             self.floatingDestinationPoint = event.scenePos()
             if self.destDrawNode():
                 # Disconnect an edge from a node
-                preSnap = self.scene().dag.snapshot(nodeMetaDict=self.scene().nodeMetaDict(), connectionMetaDict=self.scene().connectionMetaDict())
+                connectedDagNodes = [self.sourceDrawNode().dagNode, self.destDrawNode().dagNode]
+                oldConnectionMeta = self.scene().connectionMetaDict(connectedDagNodes)
+                self.scene().dag.beginChangeRecord()
                 
                 self.destDrawNode().removeDrawEdge(self)
                 self.scene().nodesDisconnected.emit(self.sourceDrawNode().dagNode, self.destDrawNode().dagNode)
                 self.setDestDrawNode(None)
 
-                currentSnap = self.scene().dag.snapshot(nodeMetaDict=self.scene().nodeMetaDict(), connectionMetaDict=self.scene().connectionMetaDict())
-                self.scene().undoStack().push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.scene().dag, self.scene()))
+                changeRecord = self.scene().dag.endChangeRecord()
+                self.scene().undoStack().push(depends_undo_commands.DagChangeUndoCommand(changeRecord, self.scene().dag, self.scene(), 
+                                                                                         oldConnectionMeta=oldConnectionMeta))
             self.adjust()
             # TODO: Hoover-color nodes as potential targets
         QtGui.QGraphicsItem.mouseMoveEvent(self, event)
@@ -503,7 +512,7 @@ class DrawEdge(QtGui.QGraphicsItem):
                 duplicatingConnection = self.sourceDrawNode().dagNode in self.scene().dag.nodeConnectionsIn(topHitNode.dagNode)
                 if topHitNode is not self.sourceDrawNode() and not duplicatingConnection:
                     # Connect an edge to a node
-                    preSnap = self.scene().dag.snapshot(nodeMetaDict=self.scene().nodeMetaDict(), connectionMetaDict=self.scene().connectionMetaDict())
+                    self.scene().dag.beginChangeRecord()
                     
                     self.setDestDrawNode(topHitNode)
                     self.dest.addDrawEdge(self)
@@ -511,8 +520,8 @@ class DrawEdge(QtGui.QGraphicsItem):
                     self.scene().nodesConnected.emit(self.sourceDrawNode().dagNode, self.destDrawNode().dagNode)
                     self.adjust()
 
-                    currentSnap = self.scene().dag.snapshot(nodeMetaDict=self.scene().nodeMetaDict(), connectionMetaDict=self.scene().connectionMetaDict())
-                    self.scene().undoStack().push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.scene().dag, self.scene()))
+                    changeRecord = self.scene().dag.endChangeRecord()
+                    self.scene().undoStack().push(depends_undo_commands.DagChangeUndoCommand(changeRecord, self.scene().dag, self.scene()))
                     return QtGui.QGraphicsItem.mouseReleaseEvent(self, event)
 
             # No hits?  Delete yourself (You have no chance to win!)
@@ -590,6 +599,10 @@ class SceneWidget(QtGui.QGraphicsScene):
         self.highlightNodes = list()
         self.highlightIntensities = list()
 
+        # The on-disk status of each node, computed in the background
+        self.statusModel = depends_status_model.NodeStatusModel(self)
+        self.statusModel.nodeStatusChanged.connect(self.nodeStatusChanged)
+
 
     def undoStack(self):
         """
@@ -653,6 +666,7 @@ class SceneWidget(QtGui.QGraphicsScene):
         """
         self.clear()
         self.dag = dag
+        self.statusModel.setDag(dag)
     
     
     def addExistingDagNode(self, dagNode, position):
@@ -680,6 +694,40 @@ class SceneWidget(QtGui.QGraphicsScene):
         return newDrawEdge
 
 
+    def removeExistingDagNode(self, dagNode):
+        """
+        Removes the draw node for a given dag node, along with its draw edges.
+        """
+        drawNode = self.drawNode(dagNode)
+        if not drawNode:
+            raise RuntimeError("Attempting to remove node %s which is not registered to QGraphicsScene." % dagNode.name)
+        for edge in drawNode.drawEdges():
+            self._removeDrawEdge(edge)
+        self.removeItem(drawNode)
+
+
+    def removeExistingConnection(self, fromDagNode, toDagNode):
+        """
+        Removes the draw edge between given from and to dag nodes.
+        """
+        drawEdge = self.drawEdge(self.drawNode(fromDagNode), self.drawNode(toDagNode))
+        if not drawEdge:
+            raise RuntimeError("Attempting to remove connection from %s to %s which is not registered to QGraphicsScene." % (fromDagNode.name, toDagNode.name))
+        self._removeDrawEdge(drawEdge)
+
+
+    def _removeDrawEdge(self, drawEdge):
+        """
+        Detach a draw edge from the draw nodes at both of its ends and take it
+        out of the scene.
+        """
+        if drawEdge.sourceDrawNode():
+            drawEdge.sourceDrawNode().removeDrawEdge(drawEdge)
+        if drawEdge.destDrawNode():
+            drawEdge.destDrawNode().removeDrawEdge(drawEdge)
+        self.removeItem(drawEdge)
+
+
     def addExistingGroupBox(self, name, groupDagNodeList):
         """
         Add a group box from a given list of dag nodes & names it with a string.
@@ -709,10 +757,21 @@ class SceneWidget(QtGui.QGraphicsScene):
 
     def refreshDrawNodes(self, dagNodes):
         """
-        Refresh the draw nodes representing a given list of dag nodes.
+        Refresh the draw nodes representing a given list of dag nodes.  Their
+        on-disk status is checked again in the background.
         """
+        self.statusModel.requestStatus(dagNodes)
         for drawNode in [self.drawNode(n) for n in dagNodes]:
             drawNode.update()
+
+
+    def nodeStatusChanged(self, dagNode):
+        """
+        Redraw a node whose on-disk status has changed.
+        """
+        drawNode = self.drawNode(dagNode)
+        if drawNode:
+            drawNode.update()
     
 
     def setHighlightNodes(self, drawNodes, intensities=None):
@@ -756,13 +815,16 @@ class SceneWidget(QtGui.QGraphicsScene):
         QtGui.QGraphicsScene.mousePressEvent(self, event)
         
     
-    def nodeMetaDict(self):
+    def nodeMetaDict(self, dagNodes=None):
         """
         Returns a dictionary containing meta information for each of the draw 
-        nodes in the scene.
+        nodes in the scene, or only those drawing the given list of dag nodes.
         """
         nodeMetaDict = dict()
         nodes = [n for n in self.items() if type(n) == DrawNode]
+        if dagNodes is not None:
+            dagNodeSet = set(dagNodes)
+            nodes = [n for n in nodes if n.dagNode in dagNodeSet]
         for n in nodes:
             nodeMetaDict[str(n.dagNode.uuid)] = dict()
             nodeMetaDict[str(n.dagNode.uuid)]['locationX'] = str(n.pos().x())
@@ -770,16 +832,19 @@ class SceneWidget(QtGui.QGraphicsScene):
         return nodeMetaDict
 
 
-    def connectionMetaDict(self):
+    def connectionMetaDict(self, dagNodes=None):
         """
         Returns a dictionary containing meta information for each of the draw
-        edges in the scene.
+        edges in the scene, or only those touching the given list of dag nodes.
         """
         connectionMetaDict = dict()
         connections = [n for n in self.items() if type(n) == DrawEdge]
+        dagNodeSet = set(dagNodes) if dagNodes is not None else None
         for c in connections:
             if not c.sourceDrawNode() or not c.destDrawNode():
                 continue
+            if dagNodeSet is not None and c.sourceDrawNode().dagNode not in dagNodeSet and c.destDrawNode().dagNode not in dagNodeSet:
+                continue
             connectionString = "%s|%s" % (str(c.sourceDrawNode().dagNode.uuid), str(c.destDrawNode().dagNode.uuid))
             connectionMetaDict[connectionString] = dict()
             connectionMetaDict[connectionString]['horizontalConnectionOffset'] = str(c.horizontalConnectionOffset)
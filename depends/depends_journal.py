@@ -0,0 +1,187 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import json
+import time
+import hashlib
+
+import depends_file_cache
+import depends_execution_plan
+
+
+"""
+An append-only journal of the tasks an executing output recipe has finished,
+so an execution that dies halfway can be resumed rather than started again.
+Each line of the journal is a JSON object: one starting each execution, and
+one for each task as it finishes, flushed and synced to disk before the
+next task is recorded so a crash loses at most the tasks still running.
+
+Tasks are recognized across executions by a key made from their node, name,
+frames, and commandline, so a task whose node has changed since it was
+journaled is not mistaken for the one that finished.  When resuming, a task
+is skipped if its last journal entry says it finished successfully, its
+output files are still present, and none of the tasks it depends on are
+executing again (see resumedPlan).
+"""
+
+
+###############################################################################
+###############################################################################
+class ExecutionJournal(object):
+    """
+    An execution journal in a JSON lines file at the given path.
+    """
+
+    def __init__(self, pathName):
+        """
+        """
+        self.pathName = pathName
+        self.fp = None
+
+
+    def start(self, nodeName, resume=False):
+        """
+        Open the journal for an execution of the given node, starting a new
+        journal unless resuming the execution recorded in the existing one.
+        """
+        self.close()
+        self.fp = open(self.pathName, 'a' if resume else 'w')
+        self._write({"event": "start", "node": nodeName, "resume": resume, "time": time.time()})
+
+
+    def record(self, task, state, returnCode=None, seconds=None, usage=None):
+        """
+        Record that the given task finished in the given state ("done" or
+        "failed"), with the resources it used (a TaskUsage, see
+        depends_resource_usage) if measured, and sync the journal to disk.
+        """
+        entry = {"event": "task",
+                 "key": taskKey(task),
+                 "name": task.name,
+                 "frames": task.frameRange,
+                 "state": state,
+                 "returnCode": returnCode,
+                 "seconds": seconds,
+                 "time": time.time()}
+        if usage:
+            entry.update(usage.dictionary())
+        self._write(entry)
+
+
+    def close(self):
+        """
+        """
+        if self.fp:
+            self.fp.close()
+            self.fp = None
+
+
+    def completedTaskKeys(self):
+        """
+        Return the set of the keys of the tasks whose last entry in the journal
+        says they finished successfully.  A line left half-written by a crash
+        is ignored.
+        """
+        stateDict = dict()
+        if not os.path.isfile(self.pathName):
+            return set()
+        with open(self.pathName, 'r') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("event") == "task":
+                    stateDict[entry["key"]] = entry["state"]
+        return set(key for key in stateDict if stateDict[key] == "done")
+
+
+    def frameSecondsDict(self):
+        """
+        Return a dict of node type name -> the average wall seconds a frame
+        took, over the tasks of each node type the journal says finished
+        successfully, for estimating how long frames will take (see
+        depends_chunk_policy.DurationChunkPolicy).  Only tasks with a frame
+        range whose time was measured count.
+        """
+        totalDict = dict()
+        if not os.path.isfile(self.pathName):
+            return dict()
+        with open(self.pathName, 'r') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("event") != "task" or entry.get("state") != "done":
+                    continue
+                if not entry.get("nodeType") or not entry.get("frames") or entry.get("wallSeconds") is None:
+                    continue
+                total = totalDict.setdefault(entry["nodeType"], [0.0, 0])
+                total[0] += entry["wallSeconds"]
+                total[1] += entry["frames"][1] - entry["frames"][0] + 1
+        return dict((nodeType, seconds / frameCount) for (nodeType, (seconds, frameCount)) in totalDict.items() if frameCount > 0)
+
+
+    def _write(self, entry):
+        """
+        Append an entry to the journal and sync it to disk.
+        """
+        if not self.fp:
+            raise RuntimeError("Execution journal %s has not been started." % self.pathName)
+        self.fp.write(json.dumps(entry, sort_keys=True) + "\n")
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+
+
+###############################################################################
+## Utility
+###############################################################################
+def taskKey(task):
+    """
+    Return a string identifying the given ExecutionTask across executions of
+    the same workflow.
+    """
+    nodeId = str(task.dagNode.uuid) if task.dagNode else None
+    frameRange = list(task.frameRange) if task.frameRange else None
+    return hashlib.sha1(json.dumps([nodeId, task.name, frameRange, task.commandList])).hexdigest()
+
+
+def resumedPlan(executionPlan, completedTaskKeys):
+    """
+    Return a copy of the given ExecutionPlan without the tasks a journal says
+    are complete (see ExecutionJournal.completedTaskKeys) whose output files
+    are all still present, unless a task they depend on is still in the
+    plan.  A comment stating how many tasks were skipped leads the plan.
+    """
+    # Check the outputs of every completed task at once, so each directory is listed once
+    outputFiles = list()
+    for task in executionPlan.tasks:
+        if taskKey(task) in completedTaskKeys:
+            outputFiles += task.outputFiles
+    presentFiles = set(f for (f, present) in zip(outputFiles, depends_file_cache.filesPresent(outputFiles)[0]) if present)
+
+    skippedIds = set()
+    for task in executionPlan.tasks:
+        if task.isComment() or taskKey(task) not in completedTaskKeys:
+            continue
+        if any(x not in skippedIds for x in task.predecessorIds):
+            continue
+        if all(x in presentFiles for x in task.outputFiles):
+            skippedIds.add(task.id)
+
+    plan = depends_execution_plan.ExecutionPlan()
+    if skippedIds:
+        plan.addTask("Resumed execution", ["#", "%d tasks skipped because the execution journal says they are complete." % len(skippedIds)])
+    newIdDict = dict()
+    for task in executionPlan.tasks:
+        if task.id in skippedIds:
+            continue
+        predecessorIds = [newIdDict[x] for x in task.predecessorIds if x in newIdDict]
+        newIdDict[task.id] = plan.addTask(task.name, task.commandList, task.dagNode, task.frameRange, predecessorIds,
+                                          task.inputFiles, task.outputFiles, task.pipeline).id
+    return plan
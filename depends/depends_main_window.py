@@ -8,18 +8,19 @@ import os
 import sys
 import json
 import tempfile
-import itertools
 
 from PySide import QtCore, QtGui
 
 import depends_dag
 import depends_node
 import depends_util
+import depends_engine
 import depends_variables
 import depends_data_packet
-import depends_file_dialog
 import depends_output_recipe
 import depends_undo_commands
+import depends_output_widget
+import depends_resource_usage
 import depends_communications
 import depends_property_widget
 import depends_variable_widget
@@ -35,6 +36,50 @@ does not display it.
 """
 
 
+###############################################################################
+###############################################################################
+# How often (in milliseconds) the output dock shows the latest output of the
+# commands being executed
+OUTPUT_REFRESH_INTERVAL = 500
+
+
+###############################################################################
+###############################################################################
+class _ExecutionTaskSignals(QtCore.QObject):
+    """
+    QRunnables are not QObjects, so each one carries one of these to report
+    that it is done.  It lives in the GUI thread, making the connection
+    queued.
+    """
+
+    # Signals
+    finished = QtCore.Signal()
+
+
+class _ExecutionTask(QtCore.QRunnable):
+    """
+    A unit of work run in the execution thread pool: run the commands of an
+    execution (see depends_engine.runExecution).
+    """
+
+    def __init__(self, execution):
+        """
+        """
+        QtCore.QRunnable.__init__(self)
+        self.execution = execution
+        self.signals = _ExecutionTaskSignals()
+
+
+    def run(self):
+        """
+        Called from a worker thread.
+        """
+        try:
+            depends_engine.runExecution(self.execution)
+        finally:
+            self.signals.finished.emit()
+
+
 ###############################################################################
 ###############################################################################
 class MainWindow(QtGui.QMainWindow):
@@ -89,6 +134,26 @@ class MainWindow(QtGui.QMainWindow):
         self.variableDock.setWidget(self.variableWidget)
         self.variableDock.hide()
 
+        # Create a dock for the output of executed commands
+        self.outputDock = QtGui.QDockWidget()
+        self.outputDock.setObjectName('outputDock')
+        self.outputDock.setAllowedAreas(QtCore.Qt.RightDockWidgetArea | QtCore.Qt.LeftDockWidgetArea | QtCore.Qt.BottomDockWidgetArea)
+        self.outputDock.setWindowTitle("Command Output")
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.outputDock)
+
+        # Create and add the output widget to the dock widget
+        self.outputWidget = depends_output_widget.OutputWidget(self)
+        self.outputDock.setWidget(self.outputWidget)
+        self.outputDock.hide()
+
+        # Commands executed immediately run in a thread of their own, one execution at a time
+        self.execution = None
+        self.executionThreadPool = QtCore.QThreadPool(self)
+        self.executionThreadPool.setMaxThreadCount(1)
+        self.executionTimer = QtCore.QTimer(self)
+        self.executionTimer.setInterval(OUTPUT_REFRESH_INTERVAL)
+        self.executionTimer.timeout.connect(lambda: self.outputWidget.refresh(self.execution["outputRecipe"].commandOutputs))
+
         # Set some locals
         self.dag = None
         self.undoStack = QtGui.QUndoStack(self)
@@ -120,6 +185,8 @@ class MainWindow(QtGui.QMainWindow):
         executeMenu = self.menuBar().addMenu("E&xecute")
         executeMenu.addAction(QtGui.QAction("&Write Recipe", self, shortcut= "Ctrl+E", triggered=self.executeSelected))
         executeMenu.addAction(QtGui.QAction("Execute &Selected Node", self, shortcut= "Ctrl+Shift+E", triggered=lambda: self.executeSelected(executeImmediately=True)))
+        executeMenu.addAction(QtGui.QAction("Write Recipe for &Missing Frames", self, shortcut= "Ctrl+Alt+E", triggered=lambda: self.executeSelected(onlyMissingFrames=True)))
+        executeMenu.addAction(QtGui.QAction("Execute Selected Node's Missing &Frames", self, shortcut= "Ctrl+Alt+Shift+E", triggered=lambda: self.executeSelected(executeImmediately=True, onlyMissingFrames=True)))
         recipeMenu = executeMenu.addMenu("&Output Recipe")
         executeMenu.addSeparator()
         executeMenu.addAction(QtGui.QAction("W&ipe stale status", self, shortcut= "Ctrl+W", triggered=self.clearStaleStatus))
@@ -131,18 +198,18 @@ class MainWindow(QtGui.QMainWindow):
         windowMenu.addAction(self.propDock.toggleViewAction())
         windowMenu.addAction(self.sceneGraphDock.toggleViewAction())
         windowMenu.addAction(self.variableDock.toggleViewAction())
+        windowMenu.addAction(self.outputDock.toggleViewAction())
 
         # Application settings
         self.settings = QtCore.QSettings('vcl', 'depends', self)
         self.restoreSettings()
 
         # Setup the variables, load the plugins, and auto-generate the read dag nodes
-        self.setupStartupVariables()
-        depends_node.loadChildNodesFromPaths(depends_variables.value('NODE_PATH').split(':'))
-        depends_data_packet.loadChildDataPacketsFromPaths(depends_variables.value('DATA_PACKET_PATH').split(':'))
-        depends_output_recipe.loadChildRecipesFromPaths(depends_variables.value('OUTPUT_RECIPE_PATH').split(':'))
-        depends_file_dialog.loadChildFileDialogsFromPaths(depends_variables.value('FILE_DIALOG_PATH').split(':'))
-        depends_node.generateReadDagNodes()
+        depends_engine.setupStartupVariables()
+        depends_engine.loadPlugins()
+
+        # Outputs of previous executions can be reused if an artifact store is configured
+        self.artifactStore = depends_engine.artifactStoreFromEnvironment()
 
         # Generate the Create menu.  Must be done after plugins are loaded.
         for action in self.createCreateMenuActions():
@@ -207,6 +274,10 @@ class MainWindow(QtGui.QMainWindow):
         """
         Save program settings and ask "are you sure" if there are unsaved changes.
         """
+        if self.execution:
+            print "Waiting for the execution of node '%s' to finish..." % self.execution["dagNode"].name
+            self.executionThreadPool.waitForDone()
+            self.executionFinished()
         if not self.undoStack.isClean():
             if self.yesNoDialog("Current workflow is not saved.  Save it before quitting?"):
                 if self.workingFilename:
@@ -239,45 +310,6 @@ class MainWindow(QtGui.QMainWindow):
         return [sdn.dagNode for sdn in selectedDrawNodes]
 
 
-    def setupStartupVariables(self):
-        """
-        Each program starts with a set of workflow variables that are defined
-        by where the program is executed from and potentially a set of
-        environment variables.
-        """
-        # The current session gets a "binary directory" variable
-        depends_variables.add('DEPENDS_DIR')
-        depends_variables.setx('DEPENDS_DIR', os.path.dirname(os.path.realpath(__file__)), readOnly=True)
-
-        # ...And a path that points to where the nodes are loaded from
-        depends_variables.add('NODE_PATH')
-        if not os.environ.get('DEPENDS_NODE_PATH'):
-            depends_variables.setx('NODE_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'nodes'), readOnly=True)
-        else:
-            depends_variables.setx('NODE_PATH', os.environ.get('DEPENDS_NODE_PATH'), readOnly=True)
-
-        # ...And a path that points to where the DataPackets come from
-        depends_variables.add('DATA_PACKET_PATH')
-        if not os.environ.get('DEPENDS_DATA_PACKET_PATH'):
-            depends_variables.setx('DATA_PACKET_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'data_packets'), readOnly=True)
-        else:
-            depends_variables.setx('DATA_PACKET_PATH', os.environ.get('DEPENDS_DATA_PACKET_PATH'), readOnly=True)
-        
-        # ...And a path that points to where the Output Recipes come from
-        depends_variables.add('OUTPUT_RECIPE_PATH')
-        if not os.environ.get('DEPENDS_OUTPUT_RECIPE_PATH'):
-            depends_variables.setx('OUTPUT_RECIPE_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'output_recipes'), readOnly=True)
-        else:
-            depends_variables.setx('OUTPUT_RECIPE_PATH', os.environ.get('DEPENDS_OUTPUT_RECIPE_PATH'), readOnly=True)
-
-        # ...And a path that points to where the File Dialogs come from
-        depends_variables.add('FILE_DIALOG_PATH')
-        if not os.environ.get('DEPENDS_FILE_DIALOG_PATH'):
-            depends_variables.setx('FILE_DIALOG_PATH', os.path.join(depends_variables.value('DEPENDS_DIR'), 'file_dialogs'), readOnly=True)
-        else:
-            depends_variables.setx('FILE_DIALOG_PATH', os.environ.get('DEPENDS_FILE_DIALOG_PATH'), readOnly=True)
-
-        
     def clearVariableDictionary(self):
         """
         Clear all variables from the 'global' variable dictionary that aren't 
@@ -316,7 +348,7 @@ class MainWindow(QtGui.QMainWindow):
         """
         Create a new dag node with a safe name, add it to the dag, and register it with the QGraphicsScene.
         """
-        preSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
+        self.dag.beginChangeRecord()
 
         newDagNode = nodeType()
         nodeName = depends_node.cleanNodeName(newDagNode.typeStr())
@@ -327,8 +359,7 @@ class MainWindow(QtGui.QMainWindow):
         if newDagNode.typeStr() == "Maya":
             newDagNode.comms = self.comms
 
-        currentSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
-        self.undoStack.push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.dag, self.graphicsScene))
+        self.pushDagChangeRecord()
 
 
     def deleteNodes(self, dagNodesToDelete):
@@ -336,7 +367,9 @@ class MainWindow(QtGui.QMainWindow):
         Delete an existing dag node and its edges, and make sure the QGraphicsScene cleans up as well.
         """
         nodesAffected = list()
-        preSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
+        oldNodeMeta = self.graphicsScene.nodeMetaDict(dagNodesToDelete)
+        oldConnectionMeta = self.graphicsScene.connectionMetaDict(dagNodesToDelete)
+        self.dag.beginChangeRecord()
 
         # Clean up the graphics scene
         # TODO: Should be a signal that tells the scene what to do
@@ -355,8 +388,7 @@ class MainWindow(QtGui.QMainWindow):
             nodesAffected.remove(delNode)
             self.dag.removeNode(delNode)
 
-        currentSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
-        self.undoStack.push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.dag, self.graphicsScene))
+        self.pushDagChangeRecord(oldNodeMeta, oldConnectionMeta)
         
         # Updates the drawNodes for each of the affected dagNodes
         self.graphicsScene.refreshDrawNodes(nodesAffected)
@@ -368,7 +400,8 @@ class MainWindow(QtGui.QMainWindow):
         losing downstream information.
         """
         nodesAffected = list()
-        preSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
+        oldConnectionMeta = self.graphicsScene.connectionMetaDict(dagNodesToShake)
+        self.dag.beginChangeRecord()
 
         for dagNode in dagNodesToShake:
             inNodes = self.dag.nodeConnectionsIn(dagNode)
@@ -402,8 +435,7 @@ class MainWindow(QtGui.QMainWindow):
             for input in dagNode.inputs():
                 dagNode.setInputValue(input.name, "")
 
-        currentSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
-        self.undoStack.push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.dag, self.graphicsScene))
+        self.pushDagChangeRecord(oldConnectionMeta=oldConnectionMeta)
 
         # A few refreshes
         self.propWidget.refresh()
@@ -416,7 +448,7 @@ class MainWindow(QtGui.QMainWindow):
         Create identical copies of the given dag nodes, but drop their 
         incoming and outgoing connections.
         """
-        preSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
+        self.dag.beginChangeRecord()
         
         for dagNode in dagNodesToDupe:
             dupedNode = dagNode.duplicate("_Dupe")
@@ -424,8 +456,7 @@ class MainWindow(QtGui.QMainWindow):
             self.dag.addNode(dupedNode)
             self.graphicsScene.addExistingDagNode(dupedNode, newLocation)
         
-        currentSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
-        self.undoStack.push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.dag, self.graphicsScene))
+        self.pushDagChangeRecord()
 
 
     def versionUpOutputFilenames(self, dagNodesToVersionUp):
@@ -433,7 +464,7 @@ class MainWindow(QtGui.QMainWindow):
         Increment the filename version of all output filenames in a given
         list of dag nodes.
         """
-        preSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
+        self.dag.beginChangeRecord()
 
         nodesAffected = list()
         for dagNode in self.selectedDagNodes():
@@ -448,8 +479,7 @@ class MainWindow(QtGui.QMainWindow):
                     nodesAffected = nodesAffected + self.dagNodeOutputChanged(dagNode, dagNode.outputNamed(output.name))
             nodesAffected = nodesAffected + self.dagSetChildrenStale(dagNode)
 
-        currentSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
-        self.undoStack.push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.dag, self.graphicsScene))
+        self.pushDagChangeRecord()
 
         # Updates the drawNodes for each of the affected dagNodes
         self.propWidget.refresh()
@@ -487,7 +517,7 @@ class MainWindow(QtGui.QMainWindow):
         and nodes, and handle the repercussions.
         """
         somethingChanged = False
-        preSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
+        self.dag.beginChangeRecord()
 
         nodesAffected = list()
         if propName == "Name" and propertyType is depends_node.DagNodeAttribute:
@@ -524,9 +554,7 @@ class MainWindow(QtGui.QMainWindow):
             nodesAffected = nodesAffected + self.dagSetChildrenStale(dagNode)
         
         # Undos aren't registered when the value doesn't actually change
-        if somethingChanged:
-            currentSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
-            self.undoStack.push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.dag, self.graphicsScene, self.propWidget))
+        self.pushDagChangeRecord(propertyWidget=self.propWidget)
 
         # Updates the drawNodes for each of the affected dagNodes
         self.graphicsScene.refreshDrawNodes(nodesAffected)
@@ -538,8 +566,7 @@ class MainWindow(QtGui.QMainWindow):
         or output), modify the in-flight dag and nodes and insure everything
         needed changes accordingly.
         """
-        registerUndo = False
-        preSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
+        self.dag.beginChangeRecord()
 
         # None is a legit value for a range value.  Make sure blanks are Nones.
         if newRange[0] == "":
@@ -552,29 +579,38 @@ class MainWindow(QtGui.QMainWindow):
             if newRange != dagNode.inputRange(propName, variableSubstitution=False):
                 dagNode.setInputRange(propName, newRange)
                 nodesAffected = nodesAffected + [dagNode]
-                registerUndo = True
                 
         elif propertyType is depends_node.DagNodeOutput:
             if newRange != dagNode.outputRange(propName, variableSubstitution=False):
                 dagNode.setOutputRange(propName, newRange)
                 # Note: Changing the output range does not affect the staleness of the node
                 nodesAffected = nodesAffected + [dagNode]
-                registerUndo = True
                 
         elif propertyType is depends_node.DagNodeAttribute:
             if newRange != dagNode.attributeRange(propName, variableSubstitution=False):
                 dagNode.setAttributeRange(propName, newRange)
                 nodesAffected = nodesAffected + [dagNode]
 
-        # Undos aren't registered when the value doesn't actually change, 
-        if registerUndo:
-            currentSnap = self.dag.snapshot(nodeMetaDict=self.graphicsScene.nodeMetaDict(), connectionMetaDict=self.graphicsScene.connectionMetaDict())
-            self.undoStack.push(depends_undo_commands.DagAndSceneUndoCommand(preSnap, currentSnap, self.dag, self.graphicsScene, self.propWidget))
+        # Undos aren't registered when the value doesn't actually change
+        self.pushDagChangeRecord(propertyWidget=self.propWidget)
 
         # Updates the drawNodes for each of the affected dagNodes
         self.graphicsScene.refreshDrawNodes(nodesAffected)
 
 
+    def pushDagChangeRecord(self, oldNodeMeta=None, oldConnectionMeta=None, propertyWidget=None):
+        """
+        Stop recording changes to the DAG (see DAG.beginChangeRecord) and 
+        register them with the undo stack, unless nothing actually changed.
+        The old meta dicts are needed when draw nodes or edges were removed.
+        """
+        changeRecord = self.dag.endChangeRecord()
+        if not changeRecord:
+            return
+        self.undoStack.push(depends_undo_commands.DagChangeUndoCommand(changeRecord, self.dag, self.graphicsScene, 
+                                                                       oldNodeMeta, oldConnectionMeta, propertyWidget))
+
+
     def communicationReceived(self, message):
         """
         This function acts as a switchboard for incoming messages from the
@@ -724,7 +760,7 @@ class MainWindow(QtGui.QMainWindow):
             for input in affectedNode.inputs():
                 (incomingNode, incomingOutput) = self.dag.nodeInputComesFromNode(affectedNode, input)
                 if input.seqRange != incomingOutput.getSeqRange():
-                    input.seqRange = incomingOutput.getSeqRange()
+                    affectedNode.setInputRange(input.name, incomingOutput.getSeqRange())
                     nodesAffected.append(affectedNode)
                     
         # Data that used to exist may no longer exist.  Therefore all directly affected nodes should refresh.
@@ -733,44 +769,6 @@ class MainWindow(QtGui.QMainWindow):
         return nodesAffected
 
 
-    def dagNodeVariablesUsed(self, dagNode):
-        """
-        Returns a tuple containing a list of all the single-dollar and a list 
-        of all the double-dollar variables used in the current DAG.
-        """
-        singleDollarList = list()
-        doubleDollarList = list()
-        for input in dagNode.inputs():
-            vps = depends_variables.present(dagNode.inputValue(input.name, variableSubstitution=False))
-            vss = (list(), list())
-            vss2 = (list(), list())
-            if dagNode.inputRange(input.name, variableSubstitution=False):
-                vss = depends_variables.present(dagNode.inputRange(input.name, variableSubstitution=False)[0])
-                vss2 = depends_variables.present(dagNode.inputRange(input.name, variableSubstitution=False)[1])
-            singleDollarList += vps[0] + vss[0] + vss2[0]
-            doubleDollarList += vps[1] + vss[1] + vss2[1]
-        for attribute in dagNode.attributes():
-            vps = depends_variables.present(dagNode.attributeValue(attribute.name, variableSubstitution=False))
-            vss = (list(), list())
-            vss2 = (list(), list())
-            if dagNode.attributeRange(attribute.name, variableSubstitution=False):
-                vss = depends_variables.present(dagNode.attributeRange(attribute.name, variableSubstitution=False)[0])
-                vss2 = depends_variables.present(dagNode.attributeRange(attribute.name, variableSubstitution=False)[1])
-            singleDollarList += vps[0] + vss[0] + vss2[0]
-            doubleDollarList += vps[1] + vss[1] + vss2[1]
-        for output in dagNode.outputs():
-            for subName in output.subOutputNames():
-                vps = depends_variables.present(dagNode.outputValue(output.name, subName, variableSubstitution=False))
-                vss = (list(), list())
-                vss2 = (list(), list())
-                if dagNode.outputRange(output.name, variableSubstitution=False):
-                    vss = depends_variables.present(dagNode.outputRange(output.name, variableSubstitution=False)[0])
-                    vss2 = depends_variables.present(dagNode.outputRange(output.name, variableSubstitution=False)[1])
-                singleDollarList += vps[0] + vss[0] + vss2[0]
-                doubleDollarList += vps[1] + vss[1] + vss2[1]
-        return (list(set(singleDollarList)), list(set(doubleDollarList)))
-
-
     def dagSetChildrenStale(self, dagNodeChanged):
         """
         Given a dag node that has changed, mark all its children that have data
@@ -786,183 +784,61 @@ class MainWindow(QtGui.QMainWindow):
         return nodesAffected
         
 
-    def dagNodesSanityCheck(self, dagNodes):
-        """
-        Runs a series of sanity tests on the given dag nodes to make sure they
-        are fit to be executed in their current state.
-        """
-        #
-        # Full DAG validation
-        #
-        # Insure all $ variables that are used, exist
-        for dagNode in dagNodes:
-            (singleDollarVariables, doubleDollarVariables) = self.dagNodeVariablesUsed(dagNode)
-            for sdVariable in singleDollarVariables:
-                if sdVariable not in depends_variables.names():
-                    raise RuntimeError("Depends variable $%s used in node '%s' does not exist in current environment." % (sdVariable, dagNode.name))
-
-        # Insure all $$ variables that are used, are present in the current environment
-        for dagNode in dagNodes:
-            (singleDollarVariables, doubleDollarVariables) = self.dagNodeVariablesUsed(dagNode)
-            for ddVariable in doubleDollarVariables:
-                if ddVariable not in os.environ:
-                    raise RuntimeError("Environment variable $%s used in node '%s' does not exist in current environment." % (ddVariable, dagNode.name))
-        
-        #
-        # Individual node validation
-        #
-        for dagNode in dagNodes:
-            # Insure all the inputs are connected
-            if not self.dag.nodeAllInputsConnected(dagNode):
-                raise RuntimeError("Node '%s' is missing a required input." % (dagNode.name))
-            
-            # Insure the inputs match what are connected to them
-            for input in dagNode.inputs():
-                incomingDataPacketType = type(self.dag.nodeInputDataPacket(dagNode, input))
-                if incomingDataPacketType not in input.allPossibleInputTypes():
-                    raise RuntimeError("Node '%s' has an incoming DataPacket that doesn't match its input's ('%s') type." % (dagNode.name, input.name))
-            
-            # Insure each input's range is within the output that's connected to it's range
-            for input in dagNode.inputs():
-                if not input.seqRange:
-                    continue
-                inputRange = (int(input.seqRange[0]), int(input.seqRange[1]))
-                incomingDataPacket = self.dag.nodeInputDataPacket(dagNode, input)
-                incomingRange = incomingDataPacket.sequenceRange
-                if inputRange[0] < incomingRange[0] or inputRange[1] > incomingRange[1]:
-                    (outputNode, output) = self.dag.nodeInputComesFromNode(dagNode, input)
-                    raise RuntimeError("Input range of node '%s' input '%s' extends beyond the bounds of output from node '%s' output '%s'" % 
-                                       (dagNode.name, input.name, outputNode.name, output.name))
-            
-            # Insure the number of input frames match the number of output frames for nodes that are embarassingly parallel.
-            # NOTE: This one can go away someday after careful thought - this restriction exists, at the moment, for simplicity's sake.
-            if dagNode.isEmbarrassinglyParallel():          # and self.dag.nodeGroupCount(dagNode) > 0:
-                for input in dagNode.inputs():
-                    if not input.seqRange:
-                        continue
-                    inputRange = (int(input.seqRange[0]), int(input.seqRange[1]))
-                    outputRangePreSubstitution = dagNode.outputAffectedByInput(input).getSeqRange()
-                    outputRange = (int(outputRangePreSubstitution[0]), int(outputRangePreSubstitution[1]))
-                    if inputRange != outputRange:
-                        raise RuntimeError("The parallel node, '%s', that lives in group '%s' is trimming its inputs a bit.  This is currently a no-no" %
-                                           (dagNode.name, self.dag.nodeInGroupNamed(dagNode)))
-            
-            # Insure all your outputs are filled-in
-            # Insure output paths exist (most nodes don't create paths if they aren't present)
-            # Insure the output paths can be written to
-            # Insure if there is an output sequence marker (#), there are sequence numbers
-            for output in dagNode.outputs():
-                # NOTE: This doesn't work at the moment because of how inclusive the values dict is.  Fix!
-                #for field in output.value.values():
-                #   if not field:
-                #       raise RuntimeError("Node '%s' is missing a value in its output field '%s'." % (dagNode.name, output.name))
-                for field in output.value.values():
-                    if not field: 
-                        continue
-                    dirName = os.path.dirname(field)
-                    if not os.path.exists(dirName):
-                        raise RuntimeError("Node '%s' will attempt to write to a directory that doesn't exist (%s)." % (dagNode.name, dirName))
-                for field in output.value.values():
-                    if not field: 
-                        continue
-                    dirName = os.path.dirname(field)
-                    if not os.access(dirName, os.W_OK | os.X_OK):
-                        raise RuntimeError("Node '%s' will attempt to write to a directory that you don't have permissions to (%s)." % (dagNode.name, dirName))
-                for key in output.value:
-                    if depends_util.framespec.hasFrameSymbols(output.value[key]):
-                        if not output.getSeqRange():
-                            raise RuntimeError("Node '%s' output '%s' has a string with frame symbols, but has no sequence range defined." % (dagNode.name, output.name))
-            
-            # Insure the validation function passes for each node.
-            try:
-                dagNode.validate()
-            except Exception, err:
-                raise RuntimeError("Dag node '%s' did not pass its validation test with the error:\n%s" % (dagNode.name, err))
-        
-        #
-        # Node group validation
-        #
-        # Insure all nodes in each node group are embarrassingly parallel
-        for groupName in self.dag.nodeGroupDict:
-            for dagNode in self.dag.nodeGroupDict[groupName]:
-                if not dagNode.isEmbarrassinglyParallel():
-                    raise RuntimeError("Node '%s' in group '%s' is not embarrassingly parallel." % (dagNode.name, groupName))
-        
-        # Insure all input and output ranges are identical in each dag group
-        # NOTE: This check can be removed with some careful thought and changes in the execution engine.
-        for groupName in self.dag.nodeGroupDict:
-            seqRange = None
-            for dagNode in self.dag.nodeGroupDict[groupName]:
-                for output in dagNode.outputs():
-                    if not seqRange and output.getSeqRange():
-                        seqRange = (int(output.getSeqRange()[0]), int(output.getSeqRange()[1]))
-                    else:
-                        if seqRange != (int(output.getSeqRange()[0]), int(output.getSeqRange()[1])):
-                            raise RuntimeError("Sequence ranges in group '%s' do not match.  Detection occurred on node '%s'." % (groupName, dagNode.name))
-        
-        # Insure no node is in two groups at once
-        for dagNode in dagNodes:
-            if self.dag.nodeGroupCount(dagNode) > 1:
-                raise RuntimeError("Node '%s' is present in multiple groups." % (dagNode.name))
+    def dagExecuteNode(self, dagNode, destFileOrDir, executeImmediately=False, onlyMissingFrames=False):
+        """
+        Generate an execution script using the active output recipe for the 
+        given node.  Takes a path for where to write the execution script, and
+        offers the ability to evaluate the script immediately.  Embarrassingly
+        parallel nodes can be limited to the frames whose outputs are missing.
+        Commands executed immediately run in a worker thread, one execution at
+        a time, and their output is shown in the output dock as it arrives.
+        Once they finish, the output dock lists them all (and is shown again,
+        selecting the first, if any failed), and a summary of the time and
+        memory each node's commands used is printed.  The DAG is only read on
+        this thread (see depends_engine.executeNode).  It can be edited while
+        the commands run, but the nodes edited (and those depending on them)
+        are then not taken to be up to date afterwards (see
+        depends_engine.editedNodes).
+        """
+        if self.execution:
+            print "Node '%s' is still executing." % self.execution["dagNode"].name
+            return
+        outputRecipe = self.activeOutputRecipe()
+        execution = depends_engine.prepareExecution(self.dag, dagNode, outputRecipe, destFileOrDir, executeImmediately, onlyMissingFrames, self.artifactStore)
+        if execution is None:
+            return
+        if not executeImmediately:
+            depends_engine.runExecution(execution)
+            depends_engine.finishExecution(execution)
+            return
+        self.execution = execution
+        self.outputWidget.rebuild(list())
+        self.outputDock.show()
+        task = _ExecutionTask(execution)
+        task.signals.finished.connect(self.executionFinished)
+        self.executionThreadPool.start(task)
+        self.executionTimer.start()
 
 
-    def dagExecuteNode(self, dagNode, destFileOrDir, executeImmediately=False):
+    def executionFinished(self):
         """
-        Generate an execution script using a output recipe for the given node.
-        Takes a path for where to write the execution script, and offers the 
-        ability to evaluate the script immediately.
+        Finish the execution started by dagExecuteNode once its commands have
+        run, and show what became of them.  Does nothing if it has already
+        been finished (when the window closed while the commands ran).
         """
-        # Convert this ordered list into an execution recipe and give it to a plugin that knows what to do with it.
-        orderedDependencies = self.dag.orderedNodeDependenciesAt(dagNode)
-        try:
-            self.dagNodesSanityCheck(orderedDependencies)
-        except Exception, err:
-            print err
-            print "Aborting Dag execution."
+        if self.execution is None:
             return
-        
-        executionList = list()
-        for dagNode in orderedDependencies:
-            # A dictionary with key=input & data=datapacket
-            dataPacketDict = dict(self.dag.nodeOrderedDataPackets(dagNode))
-            
-            # Pre-execution hook
-            preCommandList = dagNode.preProcess(dataPacketDict)
-            if preCommandList:
-                executionList.append((dagNode.name + " [Pre-execution]", preCommandList))
-            
-            # Command execution
-            splitOperationFlag = True if self.dag.nodeGroupCount(dagNode) else False
-            commandList = dagNode.executeList(dataPacketDict, splitOperations=splitOperationFlag)
-            executionList.append((dagNode.name, commandList))
-            
-            # Post-execution hook
-            postCommandList = dagNode.postProcess(dataPacketDict)
-            if postCommandList:
-                executionList.append((dagNode.name + " [Post-execution]", postCommandList))
-        
-        # Interleave all groups of commands and jam them back into the executionList for execution recipe handling
-        for group in self.dag.nodeGroupDict.values():
-            starti, endi = self.dag.groupIndicesInExecutionList(group, orderedDependencies)
-            if endi is None:
-                # This means the entire range isn't in the execution list & we need to stick the list of 
-                # execution lists into a format the output recipe can handle
-                endi = starti
-            if starti is None and endi is None:
-                # This means the group isn't present in the execution list at all.
-                continue
-            onlyListCommandsInRange = [x[1] for x in executionList[starti:endi+1]]
-            zippedExecutionLists = itertools.izip(*onlyListCommandsInRange)
-            fullyInterleavedCommandList = list()
-            for x in zippedExecutionLists:
-                fullyInterleavedCommandList += x
-            for i in range(len(fullyInterleavedCommandList)):
-                fullyInterleavedCommandList[i] = (self.dag.nodeGroupName(group), fullyInterleavedCommandList[i])
-            for d in range(endi, starti-1, -1):
-                del executionList[d]
-            executionList[starti:starti] = fullyInterleavedCommandList
-        
-        self.activeOutputRecipe().generate(executionList, destFileOrDir, executeImmediately)
+        self.executionTimer.stop()
+        execution = self.execution
+        self.execution = None
+        depends_engine.finishExecution(execution)
+        outputRecipe = execution["outputRecipe"]
+        self.graphicsScene.refreshDrawNodes(self.dag.nodes())
+        self.outputWidget.rebuild(outputRecipe.commandOutputs)
+        if self.outputWidget.hasFailures():
+            self.outputDock.show()
+        if outputRecipe.taskUsages():
+            print depends_resource_usage.summaryReport(outputRecipe.taskUsages())
         
 
     ###########################################################################
@@ -974,15 +850,11 @@ class MainWindow(QtGui.QMainWindow):
         values it pulls to the currently active dependency graph.  Cleans up
         the UI accordingly.
         """
-        if not os.path.exists(filename):
+        # Apply the file's data to the in-flight Dag and the workflow variables
+        self.clearVariableDictionary()
+        snapshot = depends_engine.loadWorkflow(filename, self.dag)
+        if not snapshot:
             return False
-        
-        # Load the snapshot off disk
-        with open(filename, 'rb') as fp:
-            snapshot = json.loads(fp.read())
-            
-        # Apply the data to the in-flight Dag
-        self.dag.restoreSnapshot(snapshot["DAG"])
 
         # Initialize the objects inside the graphWidget & restore the scene
         self.graphicsScene.restoreSnapshot(snapshot["DAG"])
@@ -991,16 +863,6 @@ class MainWindow(QtGui.QMainWindow):
         for key in self.dag.nodeGroupDict:
             self.graphicsScene.addExistingGroupBox(key, self.dag.nodeGroupDict[key])
 
-        # Variable substitutions
-        self.clearVariableDictionary()
-        for v in snapshot["DAG"]["VARIABLE_SUBSTITIONS"]:
-            depends_variables.variableSubstitutions[v["NAME"]] = (v["VALUE"], False)
-
-        # The current session gets a variable representing the location of the current workflow
-        if 'WORKFLOW_DIR' not in depends_variables.names():
-            depends_variables.add('WORKFLOW_DIR')
-        depends_variables.setx('WORKFLOW_DIR', os.path.dirname(filename), readOnly=True)
-
         # Additional meta-data loading
         if "RELOAD_PLUGINS_FILENAME_TEMP" in snapshot:
             filename = snapshot["RELOAD_PLUGINS_FILENAME_TEMP"]
@@ -1062,6 +924,10 @@ class MainWindow(QtGui.QMainWindow):
         fp = open(filename, 'wb')
         fp.write(json.dumps(fullSnap, sort_keys=True, indent=4))
         fp.close()
+
+        # Node fingerprints live next to the workflow
+        if not additionalFileDictionary or "RELOAD_PLUGINS_FILENAME_TEMP" not in additionalFileDictionary:
+            depends_engine.attachFingerprintStore(self.dag, filename)
         
         # UI tidies
         self.undoStack.setClean()
@@ -1117,7 +983,7 @@ class MainWindow(QtGui.QMainWindow):
         depends_util.restartProgram(args)
         
     
-    def executeSelected(self, executeImmediately=False):
+    def executeSelected(self, executeImmediately=False, onlyMissingFrames=False):
         """
         Execute the selected node using self.dagExecuteNode().
         """
@@ -1125,7 +991,7 @@ class MainWindow(QtGui.QMainWindow):
         if len(selectedDagNodes) > 1 or not selectedDagNodes:
             # TODO: Status bar
             return
-        self.dagExecuteNode(selectedDagNodes[0], '/tmp', executeImmediately)
+        self.dagExecuteNode(selectedDagNodes[0], '/tmp', executeImmediately, onlyMissingFrames)
 
 
     def deleteSelectedNodes(self):
@@ -1307,4 +1173,4 @@ class MainWindow(QtGui.QMainWindow):
         
         #print self.dag.nodeInGroupNamed(self.selectedDagNodes()[0])
 
-        print self.dagNodeVariablesUsed(self.selectedDagNodes()[0])
+        print depends_engine.nodeVariablesUsed(self.selectedDagNodes()[0])
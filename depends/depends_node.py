@@ -4,6 +4,7 @@
 # BSD license (LICENSE.txt for details).
 #
 
+import os
 import re
 import copy
 import uuid
@@ -29,6 +30,11 @@ inherited node should be as atomic as possible, performing one operation well.
 ###############################################################################
 ## Utility
 ###############################################################################
+# A dict of every node class that can be created by its type name, filled as
+# built-in nodes are defined and plugin nodes are loaded.
+nodeTypeRegistry = dict()
+
+
 def dagNodeTypes():
     """
     Return a list of node types presently loaded.
@@ -36,6 +42,22 @@ def dagNodeTypes():
     return DagNode.__subclasses__()
 
 
+def registerNodeType(nodeClass):
+    """
+    Make a node class available to nodeTypeNamed() under its class name.
+    """
+    nodeTypeRegistry[nodeClass.__name__] = nodeClass
+
+
+def nodeTypeNamed(typeString):
+    """
+    Return the node class registered with the given type name.
+    """
+    if typeString not in nodeTypeRegistry:
+        raise RuntimeError("Node type %s has not been loaded." % typeString)
+    return nodeTypeRegistry[typeString]
+
+
 def cleanNodeName(name):
     """
     Return a cleaned version of a string, suitable for naming a node.
@@ -210,6 +232,16 @@ class DagNode(object):
     def __init__(self, name="", nUUID=None):
         """
         """
+        # The DAG this node has been added to (maintained by the DAG)
+        self.dag = None
+
+        # Incremented each time a property changes, and used to tell when the
+        # data packets cached for each (output name, output type) are outdated
+        self.version = 0
+        self._dataPacketCache = dict()
+
+        # The (first, last) frames of the chunk being executed (maintained by the engine)
+        self._chunkFrameRange = None
         self.setName(name)
         self._properties = dict()
         self.uuid = nUUID if nUUID else uuid.uuid4()
@@ -297,7 +329,13 @@ class DagNode(object):
         """
         Set an input named the given name to the given string.
         """
-        self.inputNamed(inputName).value = value
+        input = self.inputNamed(inputName)
+        oldValue = input.value
+        input.value = value
+        self.version += 1
+        if self.dag:
+            self.dag.nodeInputValueChanged(self, inputName)
+            self.dag.nodePropertyChanged(self, "setInputValue", (inputName,), oldValue, value)
 
 
     def setInputRange(self, inputName, newRange):
@@ -305,7 +343,12 @@ class DagNode(object):
         Set the range of an input named the given name to the given range 
         tuple (string, string).
         """
-        self.inputNamed(inputName).seqRange = newRange
+        input = self.inputNamed(inputName)
+        oldRange = input.seqRange
+        input.seqRange = newRange
+        self.version += 1
+        if self.dag:
+            self.dag.nodePropertyChanged(self, "setInputRange", (inputName,), oldRange, newRange)
 
 
     def inputNamed(self, inputName):
@@ -358,7 +401,12 @@ class DagNode(object):
         """
         Set an output named the given name to the given string.
         """
-        self.outputNamed(outputName).value[subOutputName] = value
+        output = self.outputNamed(outputName)
+        oldValue = output.value.get(subOutputName)
+        output.value[subOutputName] = value
+        self.version += 1
+        if self.dag:
+            self.dag.nodePropertyChanged(self, "setOutputValue", (outputName, subOutputName), oldValue, value)
 
 
     def setOutputRange(self, outputName, newRange):
@@ -366,7 +414,12 @@ class DagNode(object):
         Set the range of an output named the given name to the given range 
         tuple (string, string).
         """
-        self.outputNamed(outputName).seqRange = newRange
+        output = self.outputNamed(outputName)
+        oldRange = output.seqRange
+        output.seqRange = newRange
+        self.version += 1
+        if self.dag:
+            self.dag.nodePropertyChanged(self, "setOutputRange", (outputName,), oldRange, newRange)
 
 
     def outputNamed(self, outputName):
@@ -429,7 +482,12 @@ class DagNode(object):
         """
         Set an attribute named the given name to the given string.
         """
-        self.attributeNamed(attrName).value = value
+        attribute = self.attributeNamed(attrName)
+        oldValue = attribute.value
+        attribute.value = value
+        self.version += 1
+        if self.dag:
+            self.dag.nodePropertyChanged(self, "setAttributeValue", (attrName,), oldValue, value)
 
 
     def setAttributeRange(self, attrName, newRange):
@@ -437,7 +495,12 @@ class DagNode(object):
         Set the range of an attribute named the given name to the given range
         tuple (string, string).
         """
-        self.attributeNamed(attrName).seqRange = newRange
+        attribute = self.attributeNamed(attrName)
+        oldRange = attribute.seqRange
+        attribute.seqRange = newRange
+        self.version += 1
+        if self.dag:
+            self.dag.nodePropertyChanged(self, "setAttributeRange", (attrName,), oldRange, newRange)
 
 
     def attributeNamed(self, attrName):
@@ -466,7 +529,7 @@ class DagNode(object):
         Workflow variables are substituted by default.
         """
         seqRange = self.attributeNamed(attrName).seqRange
-        if variableSubstitution:
+        if seqRange and seqRange[0] and seqRange[1] and variableSubstitution:
             seqRange = (depends_variables.substitute(seqRange[0]), depends_variables.substitute(seqRange[1]))
         return seqRange
 
@@ -493,6 +556,11 @@ class DagNode(object):
         underscores.
         """
         processedName = cleanNodeName(name)
+        if self.dag and processedName != self.name:
+            oldName = self.name
+            self.name = processedName
+            self.dag.nodeRenamed(self, oldName)
+            return
         self.name = processedName
 
 
@@ -535,7 +603,8 @@ class DagNode(object):
         If the output is specialized to an inherited type, pass a dictionary
         in containing the specializations.  Currently multiple outputs exist
         for each node, so return a list of all data packets generated by this
-        node.
+        node.  The data packets are cached and shared between callers, so they
+        should not be modified.
         """
         # TODO: This loops over all outputs and works now because only a single
         #       output exists (see usages in dag.py).  This may be inadvisable.
@@ -547,16 +616,65 @@ class DagNode(object):
             # If a specializationDict has been supplied, use the given type
             if specializationDict and output.name in specializationDict:
                 outputType = specializationDict[output.name]
-            # Create the new datapacket and populate its attributes.
-            newDataPacket = outputType(self, output.name)
-            for fdName in newDataPacket.filenames:
-                newDataPacket.setFilename(fdName, self.outputValue(output.name, fdName))
-                # TODO: This happens multiple times right now.  Once the UI is fixed, it won't
-                newDataPacket.setSequenceRange(self.outputRange(output.name, fdName))
-            dpList.append(newDataPacket)
+            dpList.append(self._cachedDataPacket(output, outputType))
         return dpList
 
 
+    def _cachedDataPacket(self, output, outputType):
+        """
+        Return a data packet of the given type for the given output.  A new 
+        one is only built if this node has changed, or the workflow or
+        environment variables its output uses (directly or through other
+        variables) have changed, since the last one was built.
+        """
+        cacheKey = (output.name, outputType)
+        if cacheKey in self._dataPacketCache:
+            (version, generation, variableState, dataPacket) = self._dataPacketCache[cacheKey]
+            if version == self.version:
+                # Environment variables can change without touching the generation
+                usesEnvironment = any(x[0].startswith('$$') for x in variableState)
+                if generation == depends_variables.generation and not usesEnvironment:
+                    return dataPacket
+                # Some variable changed, but perhaps not one this output uses
+                if variableState == self._outputVariableState(output):
+                    self._dataPacketCache[cacheKey] = (version, depends_variables.generation, variableState, dataPacket)
+                    return dataPacket
+
+        # Create the new datapacket and populate its attributes.
+        newDataPacket = outputType(self, output.name)
+        for fdName in newDataPacket.filenames:
+            newDataPacket.setFilename(fdName, self.outputValue(output.name, fdName))
+            # TODO: This happens multiple times right now.  Once the UI is fixed, it won't
+            newDataPacket.setSequenceRange(self.outputRange(output.name, fdName))
+        self._dataPacketCache[cacheKey] = (self.version, depends_variables.generation, self._outputVariableState(output), newDataPacket)
+        return newDataPacket
+
+
+    def _outputVariableState(self, output):
+        """
+        Return a tuple of (variable, value) tuples for each workflow and 
+        environment variable used by the given output's values and range,
+        including the variables used by those variables' values.
+        """
+        usedStrings = list(output.value.values())
+        if output.seqRange:
+            usedStrings += [x for x in output.seqRange if x]
+        variableStateDict = dict()
+        while usedStrings:
+            (singleDollarList, doubleDollarList) = depends_variables.present(usedStrings.pop())
+            for variable in singleDollarList:
+                if '$'+variable not in variableStateDict:
+                    variableStateDict['$'+variable] = depends_variables.variableSubstitutions.get(variable)
+                    if variableStateDict['$'+variable]:
+                        usedStrings.append(variableStateDict['$'+variable][0])
+            for variable in doubleDollarList:
+                if '$$'+variable not in variableStateDict:
+                    variableStateDict['$$'+variable] = os.environ.get(variable)
+                    if variableStateDict['$$'+variable]:
+                        usedStrings.append(variableStateDict['$$'+variable])
+        return tuple(sorted(variableStateDict.items()))
+
+
     def inputAffectingOutput(self, output):
         """
         Returns the one input that affects the given output.
@@ -581,6 +699,25 @@ class DagNode(object):
         return None
         
 
+    def setChunkFrameRange(self, frameRange):
+        """
+        Set the (first, last) range of frames the commands returned by
+        executeList should make, or None for all of them.  The execution
+        engine sets this around its calls to executeList for nodes that
+        execute frame chunks.
+        """
+        self._chunkFrameRange = frameRange
+
+
+    def chunkFrameRange(self):
+        """
+        Return the (first, last) range of frames the commands returned by
+        executeList should make, or None if they should make all of them.
+        Only nodes returning True from executesFrameChunks are given chunks.
+        """
+        return self._chunkFrameRange
+
+
     ###########################################################################
     ## Children must inherit these
     ###########################################################################
@@ -660,6 +797,18 @@ class DagNode(object):
         a hint that a single node or entire groups of nodes' can be parallelized.
         """
         return False
+
+
+    def executesFrameChunks(self):
+        """
+        Embarrassingly parallel nodes that can make a range of their frames with
+        a single command can overload this function and return True.  When the
+        engine executes their frames in chunks, executeList is called (without
+        splitOperations) once per chunk, and should return a command making
+        only the frames in chunkFrameRange.  The per-frame commands of other
+        nodes are simply run one after another within each chunk.
+        """
+        return False
         
 
 ###############################################################################
@@ -721,6 +870,7 @@ def generateReadDagNodes():
         NewClassType = readNodeClassFactory(packetType)
         # Install class into current module
         globals()[NewClassType.__name__] = NewClassType
+        registerNodeType(NewClassType)
         del NewClassType
 
 
@@ -734,6 +884,7 @@ def loadChildNodesFromPaths(pathList):
         nodeClassDict = depends_util.allClassesOfInheritedTypeFromDir(path, DagNode)
         for nc in nodeClassDict:
             globals()[nc] = nodeClassDict[nc]
+            registerNodeType(nodeClassDict[nc])
 
 
 ###############################################################################
@@ -854,3 +1005,11 @@ class DagNodeCoalesce(DagNode):
 
     def executeList(self, dataPacketDict):
         pass
+
+
+###############################################################################
+## Built-in node registration
+###############################################################################
+for builtInNodeClass in [DagNodeMaya, DagNodeDot, DagNodeCoalesce]:
+    registerNodeType(builtInNodeClass)
+del builtInNodeClass
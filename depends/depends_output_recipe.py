@@ -4,17 +4,55 @@
 # BSD license (LICENSE.txt for details).
 #
 
+import os
+import re
+import sys
+import time
+import errno
+import threading
+import subprocess
+import collections
+import multiprocessing
+
 import depends_util
+import depends_resource_usage
+import depends_execution_plan
 
 
 """
 A class and collection of functions that assist in loading output recipe
 plugins.  Creating one's own output recipe consists of inheriting from the 
 OutputRecipe class, setting a unique name, and overloading the generate 
-function.
+function (or the generatePlan function, to see the dependencies between
+commands).
 """
 
 
+###############################################################################
+###############################################################################
+# The number of commands recipes run at once.  None runs one per processor,
+# and the DEPENDS_PARALLEL_WORKERS environment variable overrides both.
+WORKER_COUNT = None
+
+# The number of lines at the end of each command's output kept in memory
+# while it runs (all of it goes to the command's log file)
+OUTPUT_TAIL_LINES = 100
+
+# The longest line of output read at once; longer lines (progress bars
+# redrawn with carriage returns, for example) are split
+MAX_LINE_BYTES = 64 * 1024
+
+# The line scripts running several commands print before each, so their
+# output can be split into the output of each command (see streamScript)
+TASK_MARKER = "### Depends task %d"
+
+
+###############################################################################
+###############################################################################
+# Held while writing a line of output to the console
+consoleLock = threading.Lock()
+
+
 ###############################################################################
 ## Utility
 ###############################################################################
@@ -25,6 +63,298 @@ def outputRecipeTypes():
     return OutputRecipe.__subclasses__()
 
 
+def workerCount():
+    """
+    Return the number of commands recipes that run them concurrently should
+    run at once.
+    """
+    if os.environ.get('DEPENDS_PARALLEL_WORKERS'):
+        return max(1, int(os.environ.get('DEPENDS_PARALLEL_WORKERS')))
+    if WORKER_COUNT:
+        return WORKER_COUNT
+    return multiprocessing.cpu_count()
+
+
+def serialPlan(executionRecipe):
+    """
+    Return an ExecutionPlan running the entries of a flat execution recipe
+    one after another, for recipes given one through generate.
+    """
+    plan = depends_execution_plan.ExecutionPlan()
+    for item in executionRecipe:
+        plan.addTask(item[0], item[1], predecessorIds=[len(plan.tasks)-1] if plan.tasks else None)
+    return plan
+
+
+def taskTargets(executionPlan, stampDir):
+    """
+    For recipes handing an execution plan to build tools that decide what to
+    run from file timestamps (make and ninja, for example), return a dict of
+    task id -> tuple containing the list of files the task makes and the list
+    of files it needs, in a stable order.  Tasks that make no files of their
+    own (hooks, nodes without outputs, and commands whose outputs an earlier
+    task already makes) touch a stamp file in the given directory instead,
+    named after the task's node and frames.  Each task needs its input files
+    and the first file made by each of its predecessors.  Comments are left
+    out.
+    """
+    targetDict = dict()
+    claimedFiles = set()
+    for task in executionPlan.tasks:
+        if task.isComment():
+            continue
+        targets = [x for x in task.outputFiles if x not in claimedFiles]
+        if not targets:
+            stampName = "task%d" % task.id
+            if task.dagNode:
+                stampName = "%s_%s" % (task.dagNode.uuid, _safeName(task.name))
+            if task.frameRange:
+                stampName += ".%d-%d" % task.frameRange
+            targets = [os.path.join(stampDir, stampName + ".stamp")]
+        claimedFiles.update(targets)
+        prerequisites = list(task.inputFiles)
+        for predecessorId in task.predecessorIds:
+            if predecessorId in targetDict and targetDict[predecessorId][0][0] not in prerequisites:
+                prerequisites.append(targetDict[predecessorId][0][0])
+        targetDict[task.id] = (targets, prerequisites)
+    return targetDict
+
+
+def taskDescription(task):
+    """
+    A task's name, with the frames it makes if they are known.
+    """
+    if task.frameRange is None:
+        return task.name
+    if task.frameRange[0] == task.frameRange[1]:
+        return "%s [Frame %d]" % (task.name, task.frameRange[0])
+    return "%s [Frames %d-%d]" % (task.name, task.frameRange[0], task.frameRange[1])
+
+
+def logDirectory(scriptPathName):
+    """
+    The directory the log files of the commands run from the given script
+    are written to.
+    """
+    return os.path.splitext(scriptPathName)[0] + "_logs"
+
+
+def taskLogPath(logDir, task):
+    """
+    The path of the log file of the given task's command in the given dir.
+    """
+    logName = "%05d_%s" % (task.id, _safeName(task.name))
+    if task.frameRange:
+        logName += ".%d-%d" % task.frameRange
+    return os.path.join(logDir, logName + ".log")
+
+
+def streamCommand(argList, linesFunction, usage=None):
+    """
+    Run the given commandline, handing the lines it writes to stdout or
+    stderr to the given function as soon as they are written (as a list of
+    the lines that arrived together), and return its exit status.  Only the
+    lines read at once are held in memory.  The resources the command used
+    are measured into the given TaskUsage, if any.  If the function raises
+    an exception, the command is killed (and waited for) before the
+    exception is passed on.
+    """
+    startTime = time.time()
+    process = subprocess.Popen(argList, stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
+    outputFinished = False
+    try:
+        partialLine = ""
+        while True:
+            data = os.read(process.stdout.fileno(), MAX_LINE_BYTES)
+            if not data:
+                break
+            lines = (partialLine + data).splitlines(True)
+            partialLine = ""
+            if not lines[-1].endswith("\n") and len(lines[-1]) < MAX_LINE_BYTES:
+                partialLine = lines.pop()
+            if lines:
+                linesFunction(lines)
+        if partialLine:
+            linesFunction([partialLine])
+        outputFinished = True
+    finally:
+        process.stdout.close()
+        if not outputFinished:
+            # Nothing is reading the command's output any more, so it must not be left running (or unreaped)
+            if process.poll() is None:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+            process.wait()
+    return depends_resource_usage.waitForProcess(process, usage, startTime)
+
+
+def streamScript(argList, commandOutputDict, scriptOutput):
+    """
+    Run a script printing TASK_MARKER before each of its commands, sending
+    the lines after each marker to the CommandOutput for that task id in the
+    given dict, and lines before the first marker (or after markers for
+    tasks not in the dict) to the given script output.  A marker ends a line
+    but need not start one, as the command before it may not have ended its
+    output with a newline.  Returns the exit status of the script.  The wall
+    time from each marker to the next is taken as the time of that task's
+    command (measured into the usage of its CommandOutput, if any), but CPU
+    times and memory can only be measured for the script as a whole (into
+    the script output's usage).
+    """
+    markerPattern = re.compile(re.escape(TASK_MARKER).replace(re.escape("%d"), "([0-9]+)") + "\r?\n?$")
+    markerStart = TASK_MARKER.split("%")[0]
+    currentOutput = [scriptOutput]
+    currentStartTime = [None]
+    def finishCurrentOutput():
+        if currentOutput[0] is scriptOutput:
+            return
+        if currentOutput[0].usage:
+            currentOutput[0].usage.wallSeconds = time.time() - currentStartTime[0]
+        currentOutput[0].close()
+    def handleLines(lines):
+        firstLine = 0
+        for (i, line) in enumerate(lines):
+            position = line.rfind(markerStart)
+            match = markerPattern.match(line, position) if position >= 0 else None
+            if not match:
+                continue
+            endLines = lines[firstLine:i] + ([line[:position]] if position else [])
+            if endLines:
+                currentOutput[0].writeLines(endLines)
+            firstLine = i+1
+            finishCurrentOutput()
+            currentOutput[0] = commandOutputDict.get(int(match.group(1)), scriptOutput)
+            currentStartTime[0] = time.time()
+        if firstLine < len(lines):
+            currentOutput[0].writeLines(lines[firstLine:])
+    try:
+        return streamCommand(argList, handleLines, scriptOutput.usage)
+    finally:
+        finishCurrentOutput()
+
+
+def fileTail(pathName, lineCount):
+    """
+    Return the last given number of lines of a file as a string, reading
+    only as much of its end as needed.
+    """
+    blockSize = 8192
+    with open(pathName, 'rb') as fp:
+        fp.seek(0, os.SEEK_END)
+        position = fp.tell()
+        data = ""
+        while position > 0 and data.count("\n", 0, len(data)-1) < lineCount:
+            readSize = min(blockSize, position)
+            position -= readSize
+            fp.seek(position)
+            data = fp.read(readSize) + data
+    lines = data.splitlines(True)
+    return "".join(lines[-lineCount:])
+
+
+def _safeName(name):
+    """
+    The given name with anything but letters, digits, dots, dashes and
+    underscores replaced, for use in filenames.
+    """
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+
+
+def writeFileIfChanged(pathName, contents):
+    """
+    Write the given string to the given file, unless the file already holds
+    exactly that, so regenerating an unchanged build file leaves its
+    modification time alone.  Returns whether the file was written.
+    """
+    if os.path.isfile(pathName):
+        with open(pathName, 'rb') as fp:
+            if fp.read() == contents:
+                return False
+    with open(pathName, 'wb') as fp:
+        fp.write(contents)
+    return True
+
+
+###############################################################################
+## Command output
+###############################################################################
+class CommandOutput(object):
+    """
+    The output of one command, streamed line by line to its log file (if
+    it has one) and to the console (if echoing, with the given prefix before
+    each line).  Only the last OUTPUT_TAIL_LINES lines are kept in memory,
+    and once the command is closed only its log file holds them, so the
+    output of long commands never piles up.  The exit status of the command
+    is kept as well, once known, and the resources it used are kept in its
+    usage (see depends_resource_usage) if it has one.
+    """
+
+    def __init__(self, description, logPathName=None, echo=False, prefix=""):
+        """
+        """
+        self.description = description
+        self.logPathName = logPathName
+        self.echo = echo
+        self.prefix = prefix
+        self.lineCount = 0
+        self.returnCode = None
+        self.usage = None
+        self.tailLines = collections.deque(maxlen=OUTPUT_TAIL_LINES)
+        self.fp = None
+
+
+    def writeLines(self, lines):
+        """
+        Add a list of lines of output (each ending with its newline, if it
+        has one).
+        """
+        if self.fp is None and self.logPathName:
+            try:
+                os.makedirs(os.path.dirname(self.logPathName))
+            except OSError, err:
+                if err.errno != errno.EEXIST:
+                    raise
+            self.fp = open(self.logPathName, 'wb')
+        if self.fp:
+            self.fp.writelines(lines)
+            self.fp.flush()
+        if self.tailLines is not None:
+            self.tailLines.extend(lines)
+        self.lineCount += len(lines)
+        if self.echo:
+            text = "".join(self.prefix + x if x.endswith("\n") else self.prefix + x + "\n" for x in lines)
+            with consoleLock:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+
+
+    def close(self):
+        """
+        Note the command has finished, closing its log file and releasing the
+        lines held in memory if the log file has them.
+        """
+        if self.fp:
+            self.fp.close()
+            self.fp = None
+            self.tailLines = None
+
+
+    def tail(self, lineCount=OUTPUT_TAIL_LINES):
+        """
+        Return the last given number of lines of output (at most
+        OUTPUT_TAIL_LINES while the command runs) as a string.
+        """
+        # The command may be closed by another thread at any moment
+        tailLines = self.tailLines
+        if tailLines is not None:
+            return "".join(list(tailLines)[-lineCount:])
+        if self.logPathName and os.path.isfile(self.logPathName):
+            return fileTail(self.logPathName, lineCount)
+        return ""
+
+
 ###############################################################################
 ## Base recipe class
 ###############################################################################
@@ -32,11 +362,18 @@ class OutputRecipe(object):
     """
     A simple parent class that new output recipe plugins can inherit from.
     Each method must be overridden with unique code in order to make the plugin
-    accessible to the Depends plugin system.
+    accessible to the Depends plugin system.  Recipes that execute tasks one
+    by one record each in the journal (see depends_journal) they are given
+    while executing, if any, and list a CommandOutput for each command they
+    run in commandOutputs, before starting the commands, so their output
+    can be watched (from another thread) as it arrives.  Recipes executing immediately set
+    executionFailed if any command failed (or was skipped because of one).
     """
 
     def __init__(self):
-        pass
+        self.journal = None
+        self.commandOutputs = list()
+        self.executionFailed = False
 
 
     def name(self):
@@ -58,6 +395,44 @@ class OutputRecipe(object):
         raise RuntimeError("Attempting to execute Output Recipe base class.")
 
 
+    def runsConcurrently(self):
+        """
+        Recipes that can run independent commands at the same time return
+        True, and are given plans with the frames of embarrassingly parallel
+        nodes split into tasks of their own.
+        """
+        return False
+
+
+    def generatePlan(self, executionPlan, destFileOrDir, executeImmediately=False):
+        """
+        Given an ExecutionPlan (see depends_execution_plan), a graph of tasks
+        with the ids of the tasks each must wait for, do what generate does.
+        Recipes able to schedule tasks as their predecessors finish override
+        this; by default the flattened plan is given to generate.
+        """
+        self.generate(executionPlan.flatten(), destFileOrDir, executeImmediately)
+
+
+    def completedTaskIds(self, executionPlan):
+        """
+        Return the set of the ids of the tasks of the given plan that the last
+        execution finished successfully.  Recipes only knowing whether the
+        execution as a whole failed take every task to have failed if it did.
+        """
+        if self.executionFailed:
+            return set()
+        return set(x.id for x in executionPlan.tasks)
+
+
+    def taskUsages(self):
+        """
+        Return the TaskUsages (see depends_resource_usage) of the commands
+        the last execution ran, as far as they were measured.
+        """
+        return [x.usage for x in self.commandOutputs if x.usage]
+
+
 ########### FUNCTION TO IMPORT PLUGIN RECIPES INTO THIS NAMESPACE  ############
 def loadChildRecipesFromPaths(pathList):
     """
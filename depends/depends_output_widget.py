@@ -0,0 +1,117 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+from PySide import QtCore, QtGui
+
+
+"""
+A QT widget listing the commands the last execution ran, showing the end of
+the output of the selected one.  Only the tail of each command's output is
+read (from its log file, see depends_output_recipe.CommandOutput), so
+commands with huge logs are cheap to look at.  While an execution is still
+running, refresh() brings the list and the output shown up to date.
+"""
+
+
+###############################################################################
+###############################################################################
+class OutputWidget(QtGui.QWidget):
+    """
+    A list of executed commands above a read-only text view of the tail of
+    the selected command's output, and the path of its full log.
+    """
+
+    # The number of lines of output shown for the selected command
+    TAIL_LINES = 100
+
+    def __init__(self, parent=None):
+        """
+        """
+        QtGui.QWidget.__init__(self, parent)
+        self.commandOutputs = list()
+
+        self.mainLayout = QtGui.QVBoxLayout(self)
+        self.setLayout(self.mainLayout)
+        self.setMinimumWidth(400)
+
+        self.listWidget = QtGui.QListWidget()
+        self.listWidget.currentRowChanged.connect(self.showOutput)
+        self.mainLayout.addWidget(self.listWidget)
+
+        self.textWidget = QtGui.QPlainTextEdit()
+        self.textWidget.setReadOnly(True)
+        self.textWidget.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
+        self.textWidget.setMaximumBlockCount(self.TAIL_LINES)
+        self.mainLayout.addWidget(self.textWidget)
+
+        self.logLabel = QtGui.QLabel()
+        self.logLabel.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+        self.mainLayout.addWidget(self.logLabel)
+
+
+    def rebuild(self, commandOutputs):
+        """
+        List the given CommandOutputs, selecting the first failed command (or
+        the last command, if none failed).
+        """
+        self.commandOutputs = list(commandOutputs)
+        self.listWidget.clear()
+        selectedRow = len(self.commandOutputs)-1
+        for (row, commandOutput) in enumerate(self.commandOutputs):
+            if commandOutput.returnCode and selectedRow == len(self.commandOutputs)-1:
+                selectedRow = row
+            self.listWidget.addItem(self._itemText(commandOutput))
+        if self.commandOutputs:
+            self.listWidget.setCurrentRow(selectedRow)
+        else:
+            self.showOutput(-1)
+
+
+    def refresh(self, commandOutputs):
+        """
+        Bring the list up to date with the given CommandOutputs of commands
+        that may still be running, keeping the selected command (the first
+        one, when the commands are new) and showing its latest output.
+        """
+        if list(commandOutputs) != self.commandOutputs:
+            self.rebuild(commandOutputs)
+            if self.commandOutputs:
+                self.listWidget.setCurrentRow(0)
+            return
+        for (row, commandOutput) in enumerate(self.commandOutputs):
+            self.listWidget.item(row).setText(self._itemText(commandOutput))
+        self.showOutput(self.listWidget.currentRow())
+
+
+    def showOutput(self, row):
+        """
+        Show the tail of the output of the command in the given row.
+        """
+        if row < 0 or row >= len(self.commandOutputs):
+            self.textWidget.setPlainText("")
+            self.logLabel.setText("")
+            return
+        commandOutput = self.commandOutputs[row]
+        self.textWidget.setPlainText(commandOutput.tail(self.TAIL_LINES))
+        self.textWidget.moveCursor(QtGui.QTextCursor.End)
+        self.logLabel.setText("Full log: %s" % commandOutput.logPathName if commandOutput.logPathName else "")
+
+
+    def hasFailures(self):
+        """
+        Return whether any of the listed commands failed.
+        """
+        return any(x.returnCode for x in self.commandOutputs)
+
+
+    def _itemText(self, commandOutput):
+        """
+        The text listing the given command, noting its exit status if it
+        failed.
+        """
+        if commandOutput.returnCode:
+            return "%s  (failed with status %d)" % (commandOutput.description, commandOutput.returnCode)
+        return commandOutput.description
@@ -7,6 +7,7 @@
 from PySide import QtCore, QtGui
 
 import depends_node
+import depends_util
 import depends_data_packet
 import depends_file_dialog
 
@@ -434,6 +435,7 @@ class OutputEdit(QtGui.QWidget):
         self.outputLayout = QtGui.QVBoxLayout()
         self.outputLayout.addWidget(self.currentSubGroup)
         parent.setLayout(self.outputLayout)
+        self.refreshMissingFrames()
 
 
     def valueChangedStub(self, subName, value, type):
@@ -475,6 +477,23 @@ class OutputEdit(QtGui.QWidget):
             edit.setValue(self.dagNode.outputValue(self.output.name, edit.label.text(), variableSubstitution=False))
             edit.setRange(self.dagNode.outputRange(self.output.name, variableSubstitution=False))
             self.blockSignals(False)
+        self.refreshMissingFrames()
+
+
+    def refreshMissingFrames(self):
+        """
+        Describe which of the output's frames are missing from disk in the
+        tooltip of the current output type's group.
+        """
+        dataPacket = self.dag.nodeOutputDataPacket(self.dagNode, self.output)
+        missingRanges = dataPacket.missingFrameRanges()
+        if not missingRanges:
+            toolTip = "All output data is present."
+        elif missingRanges == [(None, None)]:
+            toolTip = "Output data is missing."
+        else:
+            toolTip = "Missing frames: %s" % depends_util.frameRangesString(missingRanges)
+        self.currentSubGroup.setToolTip(toolTip)
 
 
 ###############################################################################
@@ -0,0 +1,137 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import sys
+import time
+
+
+"""
+Accounting of the time and memory each executed task used, so expensive
+nodes stand out.  Recipes measure each command as it finishes: its wall
+time, the user and system CPU time of it and everything it waited for,
+and the peak resident set size of the largest of those processes (all from
+os.wait4 where available).  Each measurement is kept by node name, node
+type, and frame range, is written to the execution journal, and the
+measurements of an execution are summarized per node by summaryReport().
+"""
+
+
+###############################################################################
+###############################################################################
+class TaskUsage(object):
+    """
+    The resources used by one executed task (or script).  Values that could
+    not be measured are None.  Peak RSS is in kilobytes, and is never less
+    than the size of the process that started the command, which the
+    command starts out as a copy of.
+    """
+
+    def __init__(self, name, nodeType=None, frameRange=None):
+        """
+        """
+        self.name = name
+        self.nodeType = nodeType
+        self.frameRange = frameRange
+        self.wallSeconds = None
+        self.userSeconds = None
+        self.systemSeconds = None
+        self.peakRssKb = None
+
+
+    def key(self):
+        """
+        Return the (node name, node type, frame range) tuple the usage is kept
+        by.
+        """
+        return (self.name, self.nodeType, self.frameRange)
+
+
+    def setRusage(self, rusage):
+        """
+        Take the CPU times and peak RSS from the given resource.struct_rusage.
+        """
+        self.userSeconds = rusage.ru_utime
+        self.systemSeconds = rusage.ru_stime
+        # Linux reports kilobytes, OS X bytes
+        self.peakRssKb = rusage.ru_maxrss / 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+
+
+    def dictionary(self):
+        """
+        Return the measurements as a dict, for the execution journal.
+        """
+        return {"nodeType": self.nodeType,
+                "wallSeconds": self.wallSeconds,
+                "userSeconds": self.userSeconds,
+                "systemSeconds": self.systemSeconds,
+                "peakRssKb": self.peakRssKb}
+
+
+###############################################################################
+## Utility
+###############################################################################
+def taskUsage(task):
+    """
+    Return an empty TaskUsage for the given ExecutionTask, named after its
+    node (even when the task is named after the node's group), with hooks
+    keeping their own names.
+    """
+    if task.dagNode is None:
+        return TaskUsage(task.name, None, task.frameRange)
+    name = task.name if task.name.startswith(task.dagNode.name + " [") else task.dagNode.name
+    return TaskUsage(name, type(task.dagNode).__name__, task.frameRange)
+
+
+def waitForProcess(process, usage=None, startTime=None):
+    """
+    Wait for the given subprocess.Popen object to exit and return its exit
+    status, filling in the given TaskUsage (if any) with the resources it
+    used and the wall time since the given start time.  CPU times and peak
+    RSS are only measured where os.wait4 exists.
+    """
+    if not hasattr(os, 'wait4'):
+        returnCode = process.wait()
+    else:
+        (pid, status, rusage) = os.wait4(process.pid, 0)
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+        returnCode = process.returncode
+        if usage:
+            usage.setRusage(rusage)
+    if usage and startTime is not None:
+        usage.wallSeconds = time.time() - startTime
+    return returnCode
+
+
+def summaryReport(taskUsages):
+    """
+    Return a table of the given TaskUsages summed per node (and node type),
+    most expensive first, with the peak RSS of each node's largest task.
+    """
+    summaryDict = dict()
+    for usage in taskUsages:
+        key = (usage.name, usage.nodeType)
+        summary = summaryDict.setdefault(key, [0, 0.0, None, None, None])
+        summary[0] += 1
+        summary[1] += usage.wallSeconds or 0.0
+        if usage.userSeconds is not None:
+            summary[2] = (summary[2] or 0.0) + usage.userSeconds
+        if usage.systemSeconds is not None:
+            summary[3] = (summary[3] or 0.0) + usage.systemSeconds
+        if usage.peakRssKb is not None:
+            summary[4] = max(summary[4], usage.peakRssKb)
+
+    def seconds(value):
+        return "%10.2f" % value if value is not None else "%10s" % "-"
+    lines = ["%-40s %6s %10s %10s %10s %12s" % ("Node", "Tasks", "Wall (s)", "User (s)", "System (s)", "Peak RSS (MB)")]
+    for (key, summary) in sorted(summaryDict.items(), key=lambda x: (-x[1][1], x[0])):
+        name = key[0] if not key[1] else "%s (%s)" % key
+        peakRss = "%12.1f" % (summary[4] / 1024.0) if summary[4] is not None else "%12s" % "-"
+        lines.append("%-40s %6d %s %s %s %s" % (name[:40], summary[0], seconds(summary[1]), seconds(summary[2]), seconds(summary[3]), peakRss))
+    return "\n".join(lines)
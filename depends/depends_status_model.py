@@ -0,0 +1,215 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+from PySide import QtCore
+
+import depends_node
+
+
+"""
+A model holding the on-disk status of each node in a dependency graph: whether
+the data its inputs need is present, and whether its outputs have been
+written.  Finding this out means touching the filesystem, which can take a
+long time on slow network mounts, so the checks are run in a pool of worker
+threads and the user interface only ever reads the cached results.
+
+The DAG itself is only walked on the GUI thread.  Each worker is handed the
+(unchanging) DataPackets it must check, and reports back through a queued
+signal.  A signal is emitted for each node whose status actually changed.
+"""
+
+
+###############################################################################
+###############################################################################
+# The number of worker threads checking the filesystem
+STATUS_THREAD_COUNT = 4
+
+# How often (in milliseconds) every node's status is checked again, to catch
+# files written by programs other than Depends
+STATUS_REFRESH_INTERVAL = 5000
+
+
+###############################################################################
+###############################################################################
+class NodeStatus(object):
+    """
+    The cached status of one node.  The outputs are None when the node has no
+    outputs to check.
+    """
+
+    def __init__(self, inputsFulfilled, outputsPresent):
+        """
+        """
+        self.inputsFulfilled = inputsFulfilled
+        self.outputsPresent = outputsPresent
+
+
+    def __eq__(self, other):
+        """
+        """
+        if not isinstance(other, NodeStatus):
+            return False
+        return (self.inputsFulfilled, self.outputsPresent) == (other.inputsFulfilled, other.outputsPresent)
+
+
+    def __ne__(self, other):
+        """
+        """
+        return not self.__eq__(other)
+
+
+###############################################################################
+###############################################################################
+class _StatusTaskSignals(QtCore.QObject):
+    """
+    QRunnables are not QObjects, so each one carries one of these to report
+    its result.  It lives in the GUI thread, making the connection queued.
+    """
+
+    # Signals
+    finished = QtCore.Signal(depends_node.DagNode, object)
+
+
+class _StatusTask(QtCore.QRunnable):
+    """
+    A unit of work run in the thread pool: check which of the given
+    DataPackets are present on disk and report the node's status.
+    """
+
+    def __init__(self, dagNode, inputsConnected, inputDataPackets, outputDataPackets):
+        """
+        """
+        QtCore.QRunnable.__init__(self)
+        self.dagNode = dagNode
+        self.inputsConnected = inputsConnected
+        self.inputDataPackets = inputDataPackets
+        self.outputDataPackets = outputDataPackets
+        self.signals = _StatusTaskSignals()
+
+
+    def run(self):
+        """
+        Called from a worker thread.
+        """
+        inputsFulfilled = self.inputsConnected
+        if inputsFulfilled:
+            inputsFulfilled = all(dp.dataPresent() for dp in self.inputDataPackets)
+        outputsPresent = None
+        if self.outputDataPackets:
+            outputsPresent = all(dp.dataPresent() for dp in self.outputDataPackets)
+        self.signals.finished.emit(self.dagNode, NodeStatus(inputsFulfilled, outputsPresent))
+
+
+###############################################################################
+###############################################################################
+class NodeStatusModel(QtCore.QObject):
+    """
+    Holds the most recently computed NodeStatus of each node in the current
+    DAG and keeps it up to date using a private thread pool.
+    """
+
+    # Signals
+    nodeStatusChanged = QtCore.Signal(depends_node.DagNode)
+
+    def __init__(self, parent=None):
+        """
+        """
+        QtCore.QObject.__init__(self, parent)
+        self.dag = None
+        self.statusDict = dict()
+
+        # Nodes being checked right now, and those that changed while they were
+        self.pendingNodes = set()
+        self.dirtyNodes = set()
+
+        self.threadPool = QtCore.QThreadPool(self)
+        self.threadPool.setMaxThreadCount(STATUS_THREAD_COUNT)
+
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setInterval(STATUS_REFRESH_INTERVAL)
+        self.refreshTimer.timeout.connect(lambda: self.requestStatus(recheckPending=False))
+        self.refreshTimer.start()
+
+
+    def setDag(self, dag):
+        """
+        Forget everything known about the previous DAG.  Results still being
+        computed for it are thrown away when they arrive.
+        """
+        self.dag = dag
+        self.statusDict = dict()
+        self.pendingNodes = set()
+        self.dirtyNodes = set()
+
+
+    def nodeStatus(self, dagNode):
+        """
+        Return the cached NodeStatus of the given node, or None if it is not
+        known yet.  A check is started for nodes that are not known.
+        """
+        status = self.statusDict.get(dagNode)
+        if status is None:
+            self.requestStatus([dagNode], recheckPending=False)
+        return status
+
+
+    def requestStatus(self, dagNodes=None, recheckPending=True):
+        """
+        Check the status of the given nodes (or every node in the DAG) again.
+        Nodes already being checked are checked once more when they finish,
+        as they may have changed since their check started, unless
+        recheckPending is False (for requests that only want the status
+        kept fresh, which the check already running will do).
+        """
+        if self.dag is None:
+            return
+        if dagNodes is None:
+            dagNodes = self.dag.nodes()
+        for dagNode in dagNodes:
+            if dagNode.dag is not self.dag:
+                continue
+            if dagNode in self.pendingNodes:
+                if recheckPending:
+                    self.dirtyNodes.add(dagNode)
+                continue
+            self._startTask(dagNode)
+
+
+    def _startTask(self, dagNode):
+        """
+        Gather the DataPackets a node's status depends on (this walks the DAG,
+        so it is done here in the GUI thread) and queue the disk checks.
+        """
+        inputDataPackets = self.dag.nodeOrderedDataPackets(dagNode)
+        inputsConnected = dagNode.inputRequirementsFulfilled(inputDataPackets)
+        outputDataPackets = [self.dag.nodeOutputDataPacket(dagNode, output) for output in dagNode.outputs()]
+        task = _StatusTask(dagNode, inputsConnected, [x[1] for x in inputDataPackets], outputDataPackets)
+        task.signals.finished.connect(self._taskFinished)
+        self.pendingNodes.add(dagNode)
+        self.threadPool.start(task)
+
+
+    def _taskFinished(self, dagNode, status):
+        """
+        Store a node's new status, emitting nodeStatusChanged if it differs
+        from what was known.  If the node changed while it was being checked,
+        the result may already be out of date, so it is checked again, but
+        it is still stored: on slow disks a node changing more often than
+        it can be checked would otherwise never get a status at all.
+        """
+        if dagNode not in self.pendingNodes:
+            return
+        self.pendingNodes.discard(dagNode)
+        if dagNode.dag is not self.dag:
+            self.dirtyNodes.discard(dagNode)
+            self.statusDict.pop(dagNode, None)
+            return
+        if self.statusDict.get(dagNode) != status:
+            self.statusDict[dagNode] = status
+            self.nodeStatusChanged.emit(dagNode)
+        if dagNode in self.dirtyNodes:
+            self.dirtyNodes.discard(dagNode)
+            self._startTask(dagNode)
@@ -4,32 +4,37 @@
 # BSD license (LICENSE.txt for details).
 #
 
-from PySide import QtGui
+from PySide import QtCore, QtGui
 
 
 """
 A collection of QUndoCommand objects that are managed by the QT undo manager.
+Rather than holding copies of the whole DAG, each command only remembers what
+changed and applies the change (or its inverse) to the existing DAG and scene.
 """
 
 
 ###############################################################################
 ###############################################################################
-class SceneOnlyUndoCommand(QtGui.QUndoCommand):
+class NodeMoveUndoCommand(QtGui.QUndoCommand):
     """
-    An undo command that only tracks the state of the user interface 
-    QGraphicsScene.  No internal dependency graph info is tracked here.
+    An undo command that tracks the positions of a set of draw nodes that have
+    been moved in the user interface QGraphicsScene.  No internal dependency
+    graph info is tracked here.
     """
-    
-    def __init__(self, oldSnap, newSnap, scene, parent=None):
+
+    def __init__(self, oldPositionDict, newPositionDict, scene, parent=None):
         """
+        The position dicts map dag nodes to the QPointF locations of their
+        draw nodes.
         """
         QtGui.QUndoCommand.__init__(self, parent)
         self.scene = scene
-        self.oldSnap = oldSnap
-        self.newSnap = newSnap
+        self.oldPositionDict = oldPositionDict
+        self.newPositionDict = newPositionDict
         self.first = True
-        
-    
+
+
     def id(self):
         """
         Required for commands that are capable of merging themselves.
@@ -39,42 +44,67 @@ class SceneOnlyUndoCommand(QtGui.QUndoCommand):
 
     def undo(self):
         """
-        Restore the old state of the user interface.
+        Move the draw nodes back to where they were.
         """
-        self.scene.restoreSnapshot(self.oldSnap)
-        
-        
+        self._applyPositions(self.oldPositionDict)
+
+
     def redo(self):
         """
-        Restore the new state of the user interface.
+        Move the draw nodes to where they were moved to.
         The 'first' flag is used to stifle a double-apply when the command is
         first executed.
         """
         if not self.first:
-            self.scene.restoreSnapshot(self.newSnap)
+            self._applyPositions(self.newPositionDict)
         self.first = False
 
 
+    def _applyPositions(self, positionDict):
+        """
+        Set the position of each dag node's draw node.
+        """
+        for dagNode in positionDict:
+            self.scene.drawNode(dagNode).setPos(positionDict[dagNode])
+
+
 ###############################################################################
 ###############################################################################
-class DagAndSceneUndoCommand(QtGui.QUndoCommand):
+class DagChangeUndoCommand(QtGui.QUndoCommand):
     """
-    An undo command that tracks the state of the user interface as well as the
-    state of the given dependency graph.
+    An undo command that tracks a list of changes made to the given dependency
+    graph (as recorded by DAG.beginChangeRecord and DAG.endChangeRecord) and
+    keeps the user interface in step with them.  Property changes, stale
+    changes, connections, and added or removed nodes are all applied in place.
     """
 
-    def __init__(self, oldSnap, newSnap, dag, scene, propertyWidget=None, parent=None):
+    def __init__(self, changeRecord, dag, scene, oldNodeMeta=None, oldConnectionMeta=None, propertyWidget=None, parent=None):
         """
+        The old meta dicts describe the draw nodes and edges as they were before
+        the change (see SceneWidget.nodeMetaDict and connectionMetaDict), and
+        are needed to draw removed nodes and connections again when undoing.
+        The matching information for added nodes and connections is taken from
+        the scene when the command is created.
         """
         QtGui.QUndoCommand.__init__(self, parent)
         self.dag = dag
         self.scene = scene
         self.propertyWidget = propertyWidget
-        self.oldSnap = oldSnap
-        self.newSnap = newSnap
+        self.changeRecord = changeRecord
         self.first = True
-        
-    
+
+        # Only keep the meta information the changes will need
+        removedNodes = [c[1] for c in changeRecord if c[0] == "REMOVE_NODE"]
+        addedNodes = [c[1] for c in changeRecord if c[0] == "ADD_NODE"]
+        removedConnections = [(c[1], c[2]) for c in changeRecord if c[0] == "DISCONNECT"]
+        addedConnections = [(c[1], c[2]) for c in changeRecord if c[0] == "CONNECT"]
+        self.oldNodeMeta = _metaSubset(oldNodeMeta, [str(n.uuid) for n in removedNodes])
+        self.oldConnectionMeta = _metaSubset(oldConnectionMeta, [_connectionIdString(*c) for c in removedConnections])
+        self.newNodeMeta = _metaSubset(scene.nodeMetaDict(addedNodes), [str(n.uuid) for n in addedNodes])
+        self.newConnectionMeta = _metaSubset(scene.connectionMetaDict([c[1] for c in addedConnections]),
+                                             [_connectionIdString(*c) for c in addedConnections])
+
+
     def id(self):
         """
         Required for commands that are capable of merging themselves.
@@ -84,28 +114,104 @@ class DagAndSceneUndoCommand(QtGui.QUndoCommand):
 
     def undo(self):
         """
-        Restore the old state of the user interface and dependency graph.
-        Rebuild the property widget if it was provided as well.
+        Apply the inverse of each change, newest first, to the dependency graph
+        and user interface.  Rebuild the property widget if it was provided as
+        well.
         """
-        self.dag.restoreSnapshot(self.oldSnap)
-        self.scene.restoreSnapshot(self.oldSnap)
-        if self.propertyWidget:
-            selectedDrawNodes = self.scene.selectedItems()
-            selectedDagNodes = [sdn.dagNode for sdn in selectedDrawNodes]
-            self.propertyWidget.rebuild(self.dag, selectedDagNodes)
-        
-        
+        for change in reversed(self.changeRecord):
+            self._applyChange(change, inverse=True)
+        self._refresh()
+
+
     def redo(self):
         """
-        Restore the new state of the user interface and dependency graph.
-        Rebuild the property widget if it was provided as well.  The 'first' 
-        flag is used to stifle a double-apply when the command is first executed.
+        Apply each change, oldest first, to the dependency graph and user
+        interface.  Rebuild the property widget if it was provided as well.
+        The 'first' flag is used to stifle a double-apply when the command is
+        first executed.
         """
         if not self.first:
-            self.dag.restoreSnapshot(self.newSnap)
-            self.scene.restoreSnapshot(self.newSnap)
-            if self.propertyWidget:
-                selectedDrawNodes = self.scene.selectedItems()
-                selectedDagNodes = [sdn.dagNode for sdn in selectedDrawNodes]
-                self.propertyWidget.rebuild(self.dag, selectedDagNodes)
+            for change in self.changeRecord:
+                self._applyChange(change, inverse=False)
+            self._refresh()
         self.first = False
+
+
+    def _applyChange(self, change, inverse):
+        """
+        Apply a single recorded change (or its inverse).
+        """
+        changeType = change[0]
+        if changeType == "PROPERTY":
+            (dagNode, setterName, setterArgs, oldValue, newValue) = change[1:]
+            value = oldValue if inverse else newValue
+            getattr(dagNode, setterName)(*(setterArgs + (value,)))
+
+        elif changeType == "STALE":
+            (dagNode, oldState, newState) = change[1:]
+            self.dag.setNodeStale(dagNode, oldState if inverse else newState)
+
+        elif changeType in ("CONNECT", "DISCONNECT"):
+            (startNode, endNode) = change[1:]
+            if (changeType == "CONNECT") != inverse:
+                connectionMeta = self.oldConnectionMeta if inverse else self.newConnectionMeta
+                self.dag.connectNodes(startNode, endNode)
+                drawEdge = self.scene.addExistingConnection(startNode, endNode)
+                meta = connectionMeta.get(_connectionIdString(startNode, endNode), dict())
+                if 'horizontalConnectionOffset' in meta:
+                    drawEdge.horizontalConnectionOffset = float(meta['horizontalConnectionOffset'])
+                    drawEdge.adjust()
+            else:
+                self.scene.removeExistingConnection(startNode, endNode)
+                self.dag.disconnectNodes(startNode, endNode)
+
+        elif changeType in ("ADD_NODE", "REMOVE_NODE"):
+            (dagNode, stale) = change[1:]
+            if (changeType == "ADD_NODE") != inverse:
+                nodeMeta = self.oldNodeMeta if inverse else self.newNodeMeta
+                meta = nodeMeta.get(str(dagNode.uuid), dict())
+                location = QtCore.QPointF(float(meta.get('locationX', 0.0)), float(meta.get('locationY', 0.0)))
+                self.dag.addNode(dagNode, stale)
+                self.scene.addExistingDagNode(dagNode, location)
+            else:
+                self.scene.removeExistingDagNode(dagNode)
+                self.dag.removeNode(dagNode)
+
+        else:
+            raise RuntimeError("Unknown DAG change type %s." % changeType)
+
+
+    def _refresh(self):
+        """
+        Redraw the nodes the changes touched that are still in the DAG, and
+        rebuild the property widget if it was provided.
+        """
+        touchedNodes = set()
+        for change in self.changeRecord:
+            touchedNodes.add(change[1])
+            if change[0] in ("CONNECT", "DISCONNECT"):
+                touchedNodes.add(change[2])
+        self.scene.refreshDrawNodes([n for n in touchedNodes if n.dag is self.dag])
+        if self.propertyWidget:
+            selectedDrawNodes = self.scene.selectedItems()
+            selectedDagNodes = [sdn.dagNode for sdn in selectedDrawNodes]
+            self.propertyWidget.rebuild(self.dag, selectedDagNodes)
+
+
+###############################################################################
+## Utility
+###############################################################################
+def _connectionIdString(startNode, endNode):
+    """
+    The key a connection is stored under in a connection meta dict.
+    """
+    return "%s|%s" % (str(startNode.uuid), str(endNode.uuid))
+
+
+def _metaSubset(metaDict, keys):
+    """
+    Return a copy of a meta dict holding only the given keys.
+    """
+    if not metaDict:
+        return dict()
+    return dict((k, metaDict[k]) for k in keys if k in metaDict)
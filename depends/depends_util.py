@@ -202,7 +202,137 @@ def generateUniqueNameSimiarToExisting(prefix, existingNames):
             return "%s%02d" % (prefix, nameIndices[i]+1)
         if nameIndices[i+1] != nameIndices[i]+1:
             return "%s%02d" % (prefix, nameIndices[i]+1)
-    
+
+
+# The fewest files expected in one directory before filesPresent() lists it
+# rather than checking each file individually
+LIST_DIR_THRESHOLD = 5
+
+
+def filesPresent(filenameList):
+    """
+    Check which of the given files exist on disk, grouping them by directory
+    so each directory with several expected files is listed once rather than
+    stat'ing every file.  Returns a tuple containing a bytearray with a 1 or
+    0 for each given file, in order, and a boolean stating whether all of
+    them are present.  Files found in a listing count as present even if they
+    are broken symlinks.
+    """
+    presence = bytearray(len(filenameList))
+    indicesInDir = dict()
+    for i, filename in enumerate(filenameList):
+        (dirName, baseName) = os.path.split(filename)
+        if not baseName:
+            presence[i] = os.path.exists(filename)
+            continue
+        indicesInDir.setdefault(dirName, list()).append((i, baseName))
+
+    for dirName in indicesInDir:
+        entries = indicesInDir[dirName]
+        # A single stat is cheaper than listing a large directory for a file or two
+        if len(entries) < LIST_DIR_THRESHOLD:
+            for (i, baseName) in entries:
+                presence[i] = os.path.exists(os.path.join(dirName, baseName))
+            continue
+        try:
+            dirContents = set(os.listdir(dirName if dirName else os.curdir))
+        except OSError:
+            continue
+        for (i, baseName) in entries:
+            presence[i] = baseName in dirContents
+    return (presence, all(presence))
+
+
+def missingIndexRanges(presence):
+    """
+    Given a presence bitmap (as returned by filesPresent()), return a list of
+    (first, last) index tuples, inclusive, covering each run of missing files.
+    """
+    ranges = list()
+    missingStart = presence.find('\x00')
+    while missingStart != -1:
+        missingEnd = presence.find('\x01', missingStart)
+        if missingEnd == -1:
+            missingEnd = len(presence)
+        ranges.append((missingStart, missingEnd-1))
+        missingStart = presence.find('\x00', missingEnd)
+    return ranges
+
+
+def frameRangesString(frameRanges):
+    """
+    Return a short human-readable string (like "1-10, 12, 15-20") describing
+    a list of (first, last) frame range tuples.
+    """
+    rangeStrings = list()
+    for (first, last) in frameRanges:
+        if first == last:
+            rangeStrings.append(str(first))
+        else:
+            rangeStrings.append("%s-%s" % (first, last))
+    return ", ".join(rangeStrings)
+
+
+# Unescaped runs of frame symbols ('#') in a framespec filename
+FRAME_SYMBOL_REGEX = re.compile(r'((?<!\\)\#+)')
+
+# Parsed frame templates, keyed by filename, shared by all framespec objects
+frameTemplateCache = dict()
+FRAME_TEMPLATE_CACHE_SIZE = 1024
+
+
+class frameTemplate(object):
+    """
+    A filename containing frame symbols, parsed once into the literal segments
+    between the symbols and the pad width of each symbol.  Substituting a
+    frame number is then a single string format, rather than a search and
+    rebuild of the string for each symbol.
+    """
+
+    def __init__(self, fileString):
+        """
+        """
+        self.segments = list()
+        self.padWidths = list()
+        position = 0
+        for matchObj in FRAME_SYMBOL_REGEX.finditer(fileString):
+            self.segments.append(fileString[position:matchObj.start()].replace('\#', '#'))
+            self.padWidths.append(len(matchObj.group(0)))
+            position = matchObj.end()
+        self.segments.append(fileString[position:].replace('\#', '#'))
+
+        # Literal %s are escaped since the segments become a format string
+        formatParts = list()
+        for segment, padWidth in zip(self.segments, self.padWidths):
+            formatParts.append(segment.replace('%', '%%'))
+            formatParts.append('%%0%dd' % padWidth)
+        formatParts.append(self.segments[-1].replace('%', '%%'))
+        self.formatString = "".join(formatParts)
+        self.symbolCount = len(self.padWidths)
+
+
+    def substitute(self, frameNumber):
+        """
+        Return the filename with every frame symbol replaced by the given
+        frame number, padded to the symbol's width.
+        """
+        if not self.symbolCount:
+            return self.segments[0]
+        return self.formatString % ((frameNumber,) * self.symbolCount)
+
+
+def frameTemplateNamed(fileString):
+    """
+    Return the (cached) frameTemplate for a given filename.
+    """
+    template = frameTemplateCache.get(fileString)
+    if template is None:
+        if len(frameTemplateCache) >= FRAME_TEMPLATE_CACHE_SIZE:
+            frameTemplateCache.clear()
+        template = frameTemplate(fileString)
+        frameTemplateCache[fileString] = template
+    return template
+
 
 class framespec(object):
     """
@@ -217,6 +347,9 @@ class framespec(object):
         foo.##.txt      1             foo.01.txt
         foo.#.txt       100           foo.100.txt
         foo\#.#.txt     5             foo#.5.txt
+    Long sequences can be walked with iterFrames() or frame() without
+    building the complete list of filenames.  Which frames are on disk is
+    reported by presence() and missingFrameRanges().
     """
     
     def __init__(self, fileString, fileRange):
@@ -238,16 +371,81 @@ class framespec(object):
         self.endFrame = int(endFrame) if endFrame else None
         
 
+    def isSequence(self):
+        """
+        Return a boolean stating whether this framespec has a complete frame
+        range.  Filenames without one are taken as-is.
+        """
+        return self.startFrame is not None and self.endFrame is not None
+
+
+    def frameCount(self):
+        """
+        Return the number of filenames this framespec object represents.
+        """
+        if not self.isSequence():
+            return 1
+        return max(0, self.endFrame - self.startFrame + 1)
+
+
+    def frame(self, index):
+        """
+        Return the filename at the given index (counting from zero, or from
+        the end if negative) of this framespec object's filenames.
+        """
+        count = self.frameCount()
+        if index < 0:
+            index += count
+        if index < 0 or index >= count:
+            raise IndexError("Frame index %d is out of range for %s." % (index, self.filename))
+        if not self.isSequence():
+            return self.filename
+        return frameTemplateNamed(self.filename).substitute(self.startFrame + index)
+
+
+    def iterFrames(self):
+        """
+        Iterate over the filenames this framespec object represents, in order,
+        without building a list of them.
+        """
+        if not self.isSequence():
+            yield self.filename
+            return
+        substitute = frameTemplateNamed(self.filename).substitute
+        for i in xrange(self.startFrame, self.endFrame+1):
+            yield substitute(i)
+
+
     def frames(self):
         """
         Return a complete list of filenames this framespec object represents.
         """
-        frameList = list()
-        if self.startFrame is None or self.endFrame is None:
+        if not self.isSequence():
             return [self.filename]
-        for i in range(self.startFrame, self.endFrame+1):
-            frameList.append(self.replaceFrameSymbols(self.filename, i))
-        return frameList
+        substitute = frameTemplateNamed(self.filename).substitute
+        return [substitute(i) for i in xrange(self.startFrame, self.endFrame+1)]
+
+
+    def presence(self):
+        """
+        Return a bytearray containing a 1 or 0 for each of this framespec
+        object's filenames, in order, stating whether it is present on disk.
+        """
+        return filesPresent(self.frames())[0]
+
+
+    def missingFrameRanges(self, presence=None):
+        """
+        Return a list of (first, last) frame number tuples, inclusive, covering
+        each run of frames that are missing from disk.  A presence bitmap can
+        be given if it is already known.  A filename without a frame range is
+        reported as the single range (None, None) if it is missing.
+        """
+        if presence is None:
+            presence = self.presence()
+        if not self.isSequence():
+            return [(None, None)] if not all(presence) else []
+        return [(self.startFrame+first, self.startFrame+last) for (first, last) in missingIndexRanges(presence)]
 
 
     @staticmethod
@@ -256,11 +454,7 @@ class framespec(object):
         Return a boolean stating whether or not the given string contains 
         known frame symbols ('#').
         """
-        matchObj = re.finditer(r'((?<!\\)\#+)', checkString)
-        i = next(matchObj, None)
-        if not i:
-            return False
-        return True
+        return FRAME_SYMBOL_REGEX.search(checkString) is not None
         
 
     @staticmethod
@@ -271,12 +465,4 @@ class framespec(object):
         padded to the number of #s.  Escaped #s with a backslash (\#) will be 
         replaced with a single # character in this function.
         """
-        matchObj = re.finditer(r'((?<!\\)\#+)', replaceString)
-        i = next(matchObj, None)
-        while i:
-            padString = "%s" % str(frameNumber).zfill(len(i.group(0)))
-            replaceString = replaceString[:i.start()] + padString + replaceString[i.end():]
-            matchObj = re.finditer(r'((?<!\\)\#+)', replaceString)
-            i = next(matchObj, None)
-        replaceString = replaceString.replace('\#', '#')
-        return replaceString
+        return frameTemplateNamed(replaceString).substitute(frameNumber)
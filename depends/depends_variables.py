@@ -22,6 +22,10 @@ and functions to manipulate it.
 #       projects to be loaded at once, but this is a non-issue for now.
 variableSubstitutions = dict()
 
+# Incremented each time variableSubstitutions is modified, letting anything
+# that caches substituted strings know when to take another look.
+generation = 0
+
 
 ###########################################################################
 ## Variable substitution
@@ -30,8 +34,10 @@ def add(variable):
     """
     Add a variable that doesn't exist in variableSubstitutions.
     """
+    global generation
     if variable not in variableSubstitutions:
         variableSubstitutions.update({variable : ("", False)})
+        generation += 1
     else:
         raise RuntimeError("Variable %s already exists in substitution dictionary." % variable)
     
@@ -40,8 +46,10 @@ def remove(variable):
     """
     Remove a variable that exists in variableSubstitutions.
     """
+    global generation
     if variable in variableSubstitutions:
         variableSubstitutions.pop(variable, None)
+        generation += 1
     else:
         raise RuntimeError("Variable %s does not exist in substitution dictionary." % variable)
     
@@ -52,8 +60,10 @@ def setx(variable, value, readOnly=False):
     Can also set the "read only" bit while doing so.  (The function is named 
     'setx' to avoid conflicts with the built-in keyword 'set')
     """
+    global generation
     if variable in variableSubstitutions:
         variableSubstitutions.update({variable : (value, readOnly)})
+        generation += 1
     else:
         raise RuntimeError("Variable %s does not exist in substitution dictionary." % variable)
 
@@ -265,7 +265,9 @@ class DagNodeImageTransform(depends_node.DagNode):
         appList = list()
         if not splitOperations:
             appList.extend(['nuke'])
-            if inputImages.startFrame and inputImages.endFrame:
+            if self.chunkFrameRange():
+                appList.extend(['-t', '%d-%d' % self.chunkFrameRange()])
+            elif inputImages.startFrame and inputImages.endFrame:
                 appList.extend(['-t', '%d-%d' % (inputImages.startFrame, inputImages.endFrame)])
             appList.extend(['-infile', inputImages.filename])
             appList.extend(['-scale', str(float(self.attributeValue('scale')) / 100.0)])
@@ -284,3 +286,7 @@ class DagNodeImageTransform(depends_node.DagNode):
     def isEmbarrassinglyParallel(self):
         return True
 
+
+    def executesFrameChunks(self):
+        return True
+
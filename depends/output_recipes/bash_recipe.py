@@ -5,9 +5,12 @@
 #
 
 import os
+import json
+import time
 import tempfile
-import subprocess
 
+import depends_journal
+import depends_resource_usage
 import depends_output_recipe
 
 
@@ -25,6 +28,7 @@ class BashOutputRecipe(depends_output_recipe.OutputRecipe):
     """
     def __init__(self):
         depends_output_recipe.OutputRecipe.__init__(self)
+        self.completedIds = set()
 
 
     def name(self):
@@ -36,6 +40,21 @@ class BashOutputRecipe(depends_output_recipe.OutputRecipe):
         Create a bash script from the given execution recipe into a temporary file in 
         the given dir or directly to a given path.
         """
+        self.generatePlan(depends_output_recipe.serialPlan(executionRecipe), destFileOrDir, executeImmediately)
+
+
+    def generatePlan(self, executionPlan, destFileOrDir, executeImmediately=False):
+        """
+        Create a bash script running the tasks of the given plan one after 
+        another, as generate does.  The script carries on past commands that 
+        fail, but exits with status 1 if any did.  When given a journal, the 
+        script records each task in it as the task finishes.  When executed 
+        immediately, the commands of the script are run here in the same
+        order, each in a bash process of its own (so, unlike in the script,
+        no shell state is shared between them), so the time, CPU time and
+        peak memory of each can be measured.  The output of each command is
+        streamed to the console and to a log file of its own as it arrives.
+        """
         pathName = None
         if os.path.isdir(destFileOrDir):
             (osJunk, pathName) = tempfile.mkstemp(prefix="bashExecutionRecipe_", suffix=".sh", dir=destFileOrDir)
@@ -44,14 +63,98 @@ class BashOutputRecipe(depends_output_recipe.OutputRecipe):
         
         fp = open(pathName, 'w')
         print "WRITING SHELL SCRIPT HERE:", pathName
-        for item in executionRecipe:
-            if item[1]:
-                fp.write("# Node '%s' generated the following line...\n" % item[0])
-                fp.write(" ".join(item[1]))
-                fp.write("\n\n")
+        fp.write("dependsFailed=0\n\n")
+        if self.journal:
+            fp.write("# Each finished command is appended to the execution journal (and synced to disk)\n")
+            fp.write("journal=%s\n" % _shellQuote(self.journal.pathName))
+            fp.write("dependsJournal() { local state=done; [ $1 -eq 0 ] || state=failed; ")
+            fp.write("printf '%s, \"returnCode\": %d, \"state\": \"%s\", \"time\": %s}\\n' \"$2\" $1 $state $(date +%s) >> \"$journal\"; ")
+            fp.write("sync \"$journal\" 2>/dev/null; }\n\n")
+        for task in executionPlan.tasks:
+            if task.commandList:
+                fp.write("# Node '%s' generated the following line...\n" % task.name)
+                if not task.isComment():
+                    fp.write("echo '%s'\n" % (depends_output_recipe.TASK_MARKER % task.id))
+                fp.write(" ".join(task.commandList))
+                fp.write("\n")
+                if not task.isComment():
+                    fp.write("dependsStatus=$?\n")
+                    if self.journal:
+                        fp.write("dependsJournal $dependsStatus %s\n" % _shellQuote(_journalEntryStart(task)))
+                    fp.write("[ $dependsStatus -eq 0 ] || dependsFailed=1\n")
+                fp.write("\n")
+        fp.write("exit $dependsFailed\n")
         fp.close()
     
         if executeImmediately:
-            print "Executing bash script as a subprocess of this application..."
-            runme = subprocess.Popen(['bash', pathName], stderr=subprocess.STDOUT, stdout=subprocess.PIPE)
-            out, err = runme.communicate()
+            print "Executing the commands of the bash script one after another..."
+            logDir = depends_output_recipe.logDirectory(pathName)
+            tasks = [x for x in executionPlan.tasks if x.commandList and not x.isComment()]
+            commandOutputDict = dict()
+            for task in tasks:
+                commandOutputDict[task.id] = depends_output_recipe.CommandOutput(depends_output_recipe.taskDescription(task),
+                                                                                 depends_output_recipe.taskLogPath(logDir, task), echo=True)
+                commandOutputDict[task.id].usage = depends_resource_usage.taskUsage(task)
+            self.commandOutputs = [commandOutputDict[x.id] for x in tasks]
+            self.completedIds = set()
+            for task in executionPlan.tasks:
+                if task.isComment():
+                    print " ".join(task.commandList)
+                    continue
+                if task.id not in commandOutputDict:
+                    continue
+                returnCode = self._runTask(task, commandOutputDict[task.id])
+                if returnCode == 0:
+                    self.completedIds.add(task.id)
+            self.executionFailed = len(self.completedIds) != len(tasks)
+            print "%d of %d commands succeeded.  The output of each command is in %s" % (len(self.completedIds), len(tasks), logDir)
+
+
+    def completedTaskIds(self, executionPlan):
+        """
+        """
+        return set(self.completedIds)
+
+
+    def _runTask(self, task, output):
+        """
+        Run the command of the given task in a bash process of its own,
+        streaming its output to the given CommandOutput and measuring the
+        resources it used into the output's usage, record it in the journal
+        if any, and return its exit status (None if it couldn't be run).
+        """
+        startTime = time.time()
+        returnCode = None
+        try:
+            returnCode = depends_output_recipe.streamCommand(['bash', '-c', " ".join(task.commandList)], output.writeLines, output.usage)
+        except Exception, err:
+            output.writeLines([str(err) + "\n"])
+        output.returnCode = returnCode
+        output.close()
+        if self.journal:
+            self.journal.record(task, "done" if returnCode == 0 else "failed", returnCode, time.time() - startTime, output.usage)
+        return returnCode
+
+
+###############################################################################
+## Utility
+###############################################################################
+def _journalEntryStart(task):
+    """
+    The start of the journal entry for the given task (see
+    ExecutionJournal.record), missing the fields the script adds once the
+    task has finished and the closing brace.
+    """
+    entry = json.dumps({"event": "task",
+                        "key": depends_journal.taskKey(task),
+                        "name": task.name,
+                        "frames": task.frameRange,
+                        "seconds": None}, sort_keys=True)
+    return entry[:-1]
+
+
+def _shellQuote(string):
+    """
+    The given string quoted for the shell.
+    """
+    return "'" + string.replace("'", "'\\''") + "'"
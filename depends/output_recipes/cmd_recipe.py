@@ -1,7 +1,8 @@
 
+import os
 import tempfile
-import subprocess
 
+import depends_resource_usage
 import depends_output_recipe
 
 
@@ -31,21 +32,56 @@ class CmdOutputRecipe(depends_output_recipe.OutputRecipe):
         osJunk, pathName = tempfile.mkstemp(prefix="bashExecutionRecipe_",
                                             suffix=".bat", dir=root)
 
+        # The script carries on past commands that fail, but exits
+        # with status 1 if any did
         with open(pathName, 'w') as fp:
-            for item in executionRecipe:
+            fp.write("@set failed=0\n\n")
+            for index, item in enumerate(executionRecipe):
                 if not item[1]:
                     continue
 
                 fp.write("# Node '%s' generated the "
                          "following line...\n" % item[0])
+                marker = depends_output_recipe.TASK_MARKER % index
+                fp.write("@echo %s\n" % marker)
                 fp.write(" ".join(item[1]))
-                fp.write("\n\n")
+                fp.write("\n")
+                if item[1][0] != "#":
+                    fp.write("@if errorlevel 1 set failed=1\n")
+                fp.write("\n")
+            fp.write("@exit /b %failed%\n")
 
         if executeImmediately:
             print ("Executing command as a subprocess "
                    "of this application...")
+
+            # Stream the output of each command to the console and its
+            # own log file, rather than holding all of it in memory
+            logDir = depends_output_recipe.logDirectory(pathName)
+            commandOutputDict = dict()
+            for index, item in enumerate(executionRecipe):
+                if not item[1]:
+                    continue
+                safeName = "".join(c if c.isalnum() else "_" for c in item[0])
+                logPathName = os.path.join(logDir,
+                                           "%05d_%s.log" % (index, safeName))
+                commandOutputDict[index] = depends_output_recipe.CommandOutput(
+                    item[0], logPathName, echo=True)
+                commandOutputDict[index].usage = \
+                    depends_resource_usage.TaskUsage(item[0])
+            scriptOutput = depends_output_recipe.CommandOutput(
+                os.path.basename(pathName),
+                os.path.join(logDir, "script.log"),
+                echo=True)
+            scriptOutput.usage = depends_resource_usage.TaskUsage(
+                os.path.basename(pathName))
+
+            self.commandOutputs = [commandOutputDict[x]
+                                   for x in sorted(commandOutputDict)]
+            self.commandOutputs.append(scriptOutput)
+
             command = ['cmd', '/C', pathName]
-            runme = subprocess.Popen(command,
-                                     stderr=subprocess.STDOUT,
-                                     stdout=subprocess.PIPE)
-            out, err = runme.communicate()
+            scriptOutput.returnCode = depends_output_recipe.streamScript(
+                command, commandOutputDict, scriptOutput)
+            scriptOutput.close()
+            self.executionFailed = scriptOutput.returnCode != 0
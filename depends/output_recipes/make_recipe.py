@@ -0,0 +1,127 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import subprocess
+
+import depends_output_recipe
+
+
+"""
+An output recipe writing a Makefile, so 'make -j' runs independent commands
+in parallel and only remakes the outputs that are older than their inputs.
+Each task in the execution plan becomes a rule making its node's output files
+(one frame's worth for split operations) from its input files.
+
+Rules with several output files make the first of them, and the rest are
+given empty rules depending on it, which works with any version of make
+(make only notices missing outputs other than the first if the first is
+remade).  Tasks without output files of their own touch stamp files in a
+directory next to the Makefile.  The Makefile is only rewritten when its
+contents change.
+"""
+
+
+################################################################################
+################################################################################
+class MakeOutputRecipe(depends_output_recipe.OutputRecipe):
+    """
+    """
+    def __init__(self):
+        depends_output_recipe.OutputRecipe.__init__(self)
+
+
+    def name(self):
+        return "Makefile Output Recipe"
+
+
+    def runsConcurrently(self):
+        return True
+
+
+    def generate(self, executionRecipe, destFileOrDir, executeImmediately=False):
+        """
+        Without the plan, nothing is known about the files each command makes,
+        so each entry makes a stamp file and waits for the one before it.
+        """
+        self.generatePlan(depends_output_recipe.serialPlan(executionRecipe), destFileOrDir, executeImmediately)
+
+
+    def generatePlan(self, executionPlan, destFileOrDir, executeImmediately=False):
+        """
+        Write a Makefile for the given plan to a file named Makefile in the
+        given dir or directly to a given path, and optionally run make on it.
+        """
+        pathName = destFileOrDir
+        if os.path.isdir(destFileOrDir):
+            pathName = os.path.join(destFileOrDir, "Makefile")
+        stampDir = os.path.join(os.path.dirname(os.path.abspath(pathName)), ".depends_stamps")
+        print "WRITING MAKEFILE HERE:", pathName
+        depends_output_recipe.writeFileIfChanged(pathName, makefileContents(executionPlan, stampDir))
+
+        if executeImmediately:
+            print "Executing make as a subprocess of this application..."
+            returnCode = subprocess.call(['make', '-f', pathName, '-j', str(depends_output_recipe.workerCount())])
+            self.executionFailed = returnCode != 0
+
+
+###############################################################################
+## Utility
+###############################################################################
+def makefileContents(executionPlan, stampDir):
+    """
+    Return the text of a Makefile executing the given plan.
+    """
+    targetDict = depends_output_recipe.taskTargets(executionPlan, stampDir)
+    lines = ["# Generated by Depends.  Run 'make -j' to execute independent commands in parallel."]
+    for task in executionPlan.tasks:
+        if task.isComment():
+            lines.append(" ".join(task.commandList))
+
+    # Everything no other task needs is made by default
+    neededTargets = set()
+    for (targets, prerequisites) in targetDict.values():
+        neededTargets.update(prerequisites)
+    finalTargets = [targetDict[x][0][0] for x in sorted(targetDict) if targetDict[x][0][0] not in neededTargets]
+    lines += ["",
+              "SHELL := /bin/bash",
+              ".DELETE_ON_ERROR:",
+              ".PHONY: all",
+              "all: " + " ".join(_makePath(x) for x in finalTargets),
+              ""]
+
+    for task in executionPlan.tasks:
+        if task.id not in targetDict:
+            continue
+        (targets, prerequisites) = targetDict[task.id]
+        lines.append("# Node '%s' generated the following rule..." % task.name)
+        lines.append(("%s: %s" % (_makePath(targets[0]), " ".join(_makePath(x) for x in prerequisites))).rstrip())
+        if task.commandList:
+            lines.append("\t" + " ".join(task.commandList).replace("$", "$$"))
+        if targets[0].startswith(stampDir + os.sep):
+            lines.append("\t@mkdir -p %s && touch %s" % (_shellPath(stampDir), _shellPath(targets[0])))
+        elif not task.commandList:
+            lines.append("\t@true")
+        if len(targets) > 1:
+            lines.append("%s: %s ;" % (" ".join(_makePath(x) for x in targets[1:]), _makePath(targets[0])))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _makePath(path):
+    """
+    A path escaped for use as a target or prerequisite in a Makefile.
+    """
+    for character in "\\ :#":
+        path = path.replace(character, "\\" + character)
+    return path.replace("$", "$$")
+
+
+def _shellPath(path):
+    """
+    A path quoted for the shell, in a Makefile rule.
+    """
+    return "'" + path.replace("'", "'\\''").replace("$", "$$") + "'"
@@ -0,0 +1,122 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import subprocess
+
+import depends_output_recipe
+
+
+"""
+An output recipe writing a build.ninja file, so ninja runs independent
+commands in parallel and only remakes the outputs that are older than their
+inputs (or whose commands have changed).  Each task in the execution plan
+becomes a build statement making its node's output files (one frame's worth
+for split operations) from its input files.  Tasks without output files of
+their own touch stamp files in a directory next to the build file, and
+ninja's log is kept there too.  The build file is only rewritten when its
+contents change.
+"""
+
+
+################################################################################
+################################################################################
+class NinjaOutputRecipe(depends_output_recipe.OutputRecipe):
+    """
+    """
+    def __init__(self):
+        depends_output_recipe.OutputRecipe.__init__(self)
+
+
+    def name(self):
+        return "Ninja Output Recipe"
+
+
+    def runsConcurrently(self):
+        return True
+
+
+    def generate(self, executionRecipe, destFileOrDir, executeImmediately=False):
+        """
+        Without the plan, nothing is known about the files each command makes,
+        so each entry makes a stamp file and waits for the one before it.
+        """
+        self.generatePlan(depends_output_recipe.serialPlan(executionRecipe), destFileOrDir, executeImmediately)
+
+
+    def generatePlan(self, executionPlan, destFileOrDir, executeImmediately=False):
+        """
+        Write a ninja build file for the given plan to a file named
+        build.ninja in the given dir or directly to a given path, and
+        optionally run ninja on it.
+        """
+        pathName = destFileOrDir
+        if os.path.isdir(destFileOrDir):
+            pathName = os.path.join(destFileOrDir, "build.ninja")
+        stampDir = os.path.join(os.path.dirname(os.path.abspath(pathName)), ".depends_stamps")
+        print "WRITING NINJA BUILD FILE HERE:", pathName
+        depends_output_recipe.writeFileIfChanged(pathName, buildFileContents(executionPlan, stampDir))
+
+        if executeImmediately:
+            print "Executing ninja as a subprocess of this application..."
+            returnCode = subprocess.call(['ninja', '-f', pathName, '-j', str(depends_output_recipe.workerCount())])
+            self.executionFailed = returnCode != 0
+
+
+###############################################################################
+## Utility
+###############################################################################
+def buildFileContents(executionPlan, stampDir):
+    """
+    Return the text of a ninja build file executing the given plan.
+    """
+    targetDict = depends_output_recipe.taskTargets(executionPlan, stampDir)
+    lines = ["# Generated by Depends.  Run 'ninja' to execute independent commands in parallel."]
+    for task in executionPlan.tasks:
+        if task.isComment():
+            lines.append(" ".join(task.commandList))
+    lines += ["",
+              "ninja_required_version = 1.3",
+              "builddir = " + _ninjaValue(stampDir),
+              "",
+              "rule run",
+              "  command = $command",
+              "  description = $description",
+              ""]
+
+    for task in executionPlan.tasks:
+        if task.id not in targetDict:
+            continue
+        (targets, prerequisites) = targetDict[task.id]
+        commandList = ["(%s)" % " ".join(task.commandList)] if task.commandList else list()
+        if targets[0].startswith(stampDir + os.sep):
+            commandList.append("mkdir -p %s && touch %s" % (_shellPath(stampDir), _shellPath(targets[0])))
+        lines.append(("build %s: run %s" % (" ".join(_ninjaPath(x) for x in targets), " ".join(_ninjaPath(x) for x in prerequisites))).rstrip())
+        lines.append("  command = " + _ninjaValue(" && ".join(commandList) if commandList else "true"))
+        lines.append("  description = " + _ninjaValue(task.name + (" [Frames %d-%d]" % task.frameRange if task.frameRange else "")))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _ninjaPath(path):
+    """
+    A path escaped for use as an output or input of a ninja build statement.
+    """
+    return path.replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+
+def _ninjaValue(value):
+    """
+    A string escaped for use as the value of a ninja variable.
+    """
+    return value.replace("$", "$$")
+
+
+def _shellPath(path):
+    """
+    A path quoted for the shell.
+    """
+    return "'" + path.replace("'", "'\\''") + "'"
@@ -0,0 +1,446 @@
+#
+# Depends
+# Copyright (C) 2014 by Andrew Gardner & Jonas Unger.  All rights reserved.
+# BSD license (LICENSE.txt for details).
+#
+
+import os
+import time
+import heapq
+import Queue
+import tempfile
+import multiprocessing.pool
+try:
+    import concurrent.futures
+except ImportError:
+    concurrent = None
+
+import depends_resource_usage
+import depends_output_recipe
+
+
+"""
+An output recipe that runs independent commands at the same time on the local
+machine.  Each task in the execution plan (see depends_execution_plan) starts
+as soon as the tasks it depends on have finished, so nodes that don't depend
+on each other, the frames of embarrassingly parallel nodes, and the frames of
+node groups all run concurrently.  Node groups can also run as pipelines,
+with a few frames at a time carried through the whole group (see
+ReadyTasks and PIPELINE_FRAMES).
+
+Each command runs in its own bash process, so the workers are threads that
+mostly wait; concurrent.futures is used if it is installed, and
+multiprocessing's ThreadPool otherwise.  A bash script doing the same with
+background jobs is written either way, for running somewhere else later.
+"""
+
+
+###############################################################################
+###############################################################################
+# The number of frames of node groups run as pipelines at once (see
+# ReadyTasks), or None to run tasks in the order of the plan.  The
+# DEPENDS_PIPELINE_FRAMES environment variable overrides this.
+PIPELINE_FRAMES = None
+
+
+###############################################################################
+###############################################################################
+class TaskStatus(object):
+    """
+    What became of one task: its state is "waiting", "done", "failed", or
+    "skipped" (when a task it depends on failed), and its output is a
+    CommandOutput (see depends_output_recipe).
+    """
+
+    def __init__(self, task):
+        """
+        """
+        self.task = task
+        self.name = task.name
+        self.commandList = task.commandList
+        self.state = "waiting"
+        self.returnCode = None
+        self.seconds = None
+        self.output = depends_output_recipe.CommandOutput(depends_output_recipe.taskDescription(task))
+
+
+###############################################################################
+###############################################################################
+class ReadyTasks(object):
+    """
+    The tasks whose predecessors are all done, handed out in the order they
+    should start.  Normally that is the order of the plan.  Given a number
+    of pipeline frames, the frames of node groups (see ExecutionTask) run as
+    independent pipelines instead: the tasks of frames already started come
+    first, so frame k of a group's second node starts as soon as frame k of
+    its first node finishes, and a new frame only starts while fewer than the
+    given number are in flight.  This gets finished frames out early and
+    keeps the intermediate files of only a few frames around at once.
+    """
+
+    def __init__(self, executionPlan, pipelineFrames=None):
+        """
+        """
+        self.pipelineFrames = pipelineFrames
+        self.readyHeap = list()
+
+        # Pipelines with tasks ready to start, waiting to be let in, by the id of their first task
+        self.waitingPipelineHeap = list()
+        self.waitingPipelineTaskDict = dict()
+        self.pipelinesInFlight = set()
+
+        # The first task of each pipeline, and how many of its tasks are unfinished
+        self.firstTaskIdDict = dict()
+        self.unfinishedCounts = dict()
+        if pipelineFrames:
+            for task in executionPlan.tasks:
+                if task.pipeline is not None:
+                    self.firstTaskIdDict.setdefault(task.pipeline, task.id)
+                    self.unfinishedCounts[task.pipeline] = self.unfinishedCounts.get(task.pipeline, 0) + 1
+
+
+    def add(self, task):
+        """
+        Add a task whose predecessors are all done.
+        """
+        if task.pipeline not in self.firstTaskIdDict or task.pipeline in self.pipelinesInFlight:
+            heapq.heappush(self.readyHeap, (task.pipeline not in self.pipelinesInFlight, task.id, task))
+            return
+        if task.pipeline not in self.waitingPipelineTaskDict:
+            self.waitingPipelineTaskDict[task.pipeline] = list()
+            heapq.heappush(self.waitingPipelineHeap, (self.firstTaskIdDict[task.pipeline], task.pipeline))
+        self.waitingPipelineTaskDict[task.pipeline].append(task)
+
+
+    def next(self):
+        """
+        Remove and return the task to start next, or None if none can start.
+        """
+        if self.readyHeap and not self.readyHeap[0][0]:
+            return heapq.heappop(self.readyHeap)[2]
+        if self.waitingPipelineHeap and len(self.pipelinesInFlight) < self.pipelineFrames:
+            if not self.readyHeap or self.waitingPipelineHeap[0][0] < self.readyHeap[0][1]:
+                pipeline = heapq.heappop(self.waitingPipelineHeap)[1]
+                self.pipelinesInFlight.add(pipeline)
+                for task in self.waitingPipelineTaskDict.pop(pipeline):
+                    heapq.heappush(self.readyHeap, (False, task.id, task))
+                return heapq.heappop(self.readyHeap)[2]
+        if self.readyHeap:
+            return heapq.heappop(self.readyHeap)[2]
+        return None
+
+
+    def finished(self, task):
+        """
+        Note that a task has finished (or will never run), so its pipeline
+        leaves the flight once all of its tasks have.
+        """
+        if task.pipeline not in self.unfinishedCounts:
+            return
+        self.unfinishedCounts[task.pipeline] -= 1
+        if not self.unfinishedCounts[task.pipeline]:
+            self.pipelinesInFlight.discard(task.pipeline)
+
+
+###############################################################################
+###############################################################################
+class ParallelOutputRecipe(depends_output_recipe.OutputRecipe):
+    """
+    """
+    def __init__(self):
+        depends_output_recipe.OutputRecipe.__init__(self)
+        self.taskStatusList = list()
+
+
+    def name(self):
+        return "Parallel Output Recipe"
+
+
+    def runsConcurrently(self):
+        return True
+
+
+    def generate(self, executionRecipe, destFileOrDir, executeImmediately=False):
+        """
+        A flat execution recipe has nothing that can safely run at the same
+        time, so each entry waits for the one before it.
+        """
+        self.generatePlan(depends_output_recipe.serialPlan(executionRecipe), destFileOrDir, executeImmediately)
+
+
+    def generatePlan(self, executionPlan, destFileOrDir, executeImmediately=False):
+        """
+        Write a bash script running the given plan with background jobs into
+        a temporary file in the given dir or directly to a given path, and
+        optionally run the plan from here, reporting on each task as it
+        finishes.
+        """
+        workerCount = depends_output_recipe.workerCount()
+        pathName = None
+        if os.path.isdir(destFileOrDir):
+            (osJunk, pathName) = tempfile.mkstemp(prefix="parallelExecutionRecipe_", suffix=".sh", dir=destFileOrDir)
+        else:
+            pathName = destFileOrDir
+        print "WRITING SHELL SCRIPT HERE:", pathName
+        writeScript(executionPlan, pathName, workerCount)
+
+        if executeImmediately:
+            print "Executing commands in %d worker threads..." % workerCount
+            self.taskStatusList = runPlan(executionPlan, workerCount, pipelineFramesSetting(), self.journal,
+                                          depends_output_recipe.logDirectory(pathName), statusFunction=self._listTasks)
+            self.executionFailed = any(x.state != "done" for x in self.taskStatusList)
+
+
+    def completedTaskIds(self, executionPlan):
+        """
+        """
+        return set(x.task.id for x in self.taskStatusList if x.state == "done")
+
+
+    def _listTasks(self, taskStatusList):
+        """
+        Keep the TaskStatus objects of the tasks about to run, and their
+        outputs as the recipe's commandOutputs.
+        """
+        self.taskStatusList = taskStatusList
+        self.commandOutputs = [x.output for x in taskStatusList]
+
+
+###############################################################################
+## Utility
+###############################################################################
+def pipelineFramesSetting():
+    """
+    Return the number of frames of node groups to run as pipelines at once,
+    or None to run tasks in the order of the plan.
+    """
+    if os.environ.get('DEPENDS_PIPELINE_FRAMES'):
+        return max(0, int(os.environ.get('DEPENDS_PIPELINE_FRAMES'))) or None
+    return PIPELINE_FRAMES
+
+
+def writeScript(executionPlan, pathName, workerCount):
+    """
+    Write a bash script that runs the tasks of each level of the given plan
+    (see ExecutionPlan.levels) as background jobs, at most the given number
+    at once, waiting for every job in a level before starting the next.  As
+    in runPlan, tasks depending on a failed task are skipped, but the rest
+    of the plan still runs, and the script exits with status 1 if any task
+    failed or was skipped.
+    """
+    fp = open(pathName, 'w')
+    fp.write("#!/bin/bash\n")
+    fp.write("workers=${DEPENDS_PARALLEL_WORKERS:-%d}\n" % workerCount)
+    fp.write("failed=0\n")
+    fp.write("# The process ids of the jobs of the current level, the ids of their tasks, and the failed or skipped tasks\n")
+    fp.write("pids=()\n")
+    fp.write("ids=()\n")
+    fp.write("bad=()\n")
+    fp.write("waitForWorker() { while [ $(jobs -rp | wc -l) -ge $workers ]; do sleep 0.1; done; }\n")
+    fp.write("skipTask() { bad[$1]=1; failed=1; echo \"skipped $2\"; }\n")
+    fp.write("finishLevel() { local i; for i in ${!pids[@]}; do wait ${pids[$i]} || { bad[${ids[$i]}]=1; failed=1; }; done; pids=(); ids=(); }\n\n")
+    for (levelIndex, level) in enumerate(executionPlan.levels()):
+        fp.write("# Level %d\n" % (levelIndex+1))
+        for task in level:
+            if not task.commandList:
+                continue
+            if task.isComment():
+                fp.write(" ".join(task.commandList))
+                fp.write("\n")
+                continue
+            fp.write("# Node '%s' generated the following line...\n" % task.name)
+            if task.predecessorIds:
+                fp.write("if [ -n \"%s\" ]; then skipTask %d %s; else\n" % ("".join("${bad[%d]}" % x for x in task.predecessorIds),
+                                                                             task.id, _shellQuote(depends_output_recipe.taskDescription(task))))
+            fp.write("waitForWorker\n(\n")
+            fp.write(" ".join(task.commandList))
+            fp.write("\n) &\npids+=($!)\nids+=(%d)\n" % task.id)
+            if task.predecessorIds:
+                fp.write("fi\n")
+        fp.write("finishLevel\n\n")
+    fp.write("exit $failed\n")
+    fp.close()
+
+
+def runPlan(executionPlan, workerCount, pipelineFrames=None, journal=None, logDir=None, echo=True, statusFunction=None):
+    """
+    Run the given plan in a pool of worker threads, starting each task once
+    its predecessors are done and printing the status of each as it
+    finishes.  Tasks start in the order of the plan, or with pipelineFrames
+    given, the frames of node groups run as pipelines (see ReadyTasks).
+    Tasks depending on a failed task are skipped, but the rest of the plan
+    still runs.  Each finished task is recorded in the given journal (see
+    depends_journal), if any.  The output of each command is written to a
+    log file in the given dir (if any) and, if echoing, to the console as
+    it arrives, with the task's description before each line, and the time
+    and memory each command used are measured into its output's usage (see
+    depends_resource_usage).  Returns a list of TaskStatus objects, one per
+    command, in the order of the plan, which is also given to the given
+    status function (if any) before the first task starts.
+    """
+    statusDict = dict()
+    for task in executionPlan.tasks:
+        if task.commandList and not task.isComment():
+            statusDict[task.id] = TaskStatus(task)
+            statusDict[task.id].output.logPathName = depends_output_recipe.taskLogPath(logDir, task) if logDir else None
+            statusDict[task.id].output.echo = echo
+            statusDict[task.id].output.prefix = "[%s] " % statusDict[task.id].output.description
+            statusDict[task.id].output.usage = depends_resource_usage.taskUsage(task)
+    successorIdDict = executionPlan.successorIdDict()
+    waitingCounts = dict((x.id, len(x.predecessorIds)) for x in executionPlan.tasks)
+    readyTasks = ReadyTasks(executionPlan, pipelineFrames)
+    for task in executionPlan.tasks:
+        if not task.predecessorIds:
+            readyTasks.add(task)
+    resultQueue = Queue.Queue()
+    if statusFunction:
+        statusFunction([statusDict[x] for x in sorted(statusDict)])
+
+    # Tasks depending on more than one failed task are only skipped once
+    skippedIds = set()
+
+    startTime = time.time()
+    finishedCount = 0
+    runningCount = 0
+    pool = _workerPool(workerCount)
+    try:
+        while True:
+            # Keep every worker busy, finishing comments and empty tasks straight away
+            while runningCount < workerCount:
+                task = readyTasks.next()
+                if task is None:
+                    break
+                if task.id in statusDict:
+                    _submit(pool, _runTask, statusDict[task.id], resultQueue)
+                    runningCount += 1
+                    continue
+                if task.isComment():
+                    print " ".join(task.commandList)
+                readyTasks.finished(task)
+                for successorId in _releaseSuccessors(task.id, successorIdDict, waitingCounts):
+                    readyTasks.add(executionPlan.task(successorId))
+
+            if not runningCount:
+                break
+            taskStatus = resultQueue.get()
+            runningCount -= 1
+            finishedCount += 1
+            readyTasks.finished(taskStatus.task)
+            if journal:
+                journal.record(taskStatus.task, taskStatus.state, taskStatus.returnCode, taskStatus.seconds, taskStatus.output.usage)
+            print "[%d/%d] %s %s (%.2fs)" % (finishedCount, len(statusDict), taskStatus.state, taskStatus.output.description, taskStatus.seconds)
+            if taskStatus.state == "done":
+                for successorId in _releaseSuccessors(taskStatus.task.id, successorIdDict, waitingCounts):
+                    readyTasks.add(executionPlan.task(successorId))
+                continue
+            print "Command exited with status %s:" % taskStatus.returnCode, " ".join(taskStatus.commandList)
+            if not echo:
+                print taskStatus.output.tail(),
+            if taskStatus.output.logPathName and os.path.isfile(taskStatus.output.logPathName):
+                print "Its output is in", taskStatus.output.logPathName
+            for skippedId in _allSuccessors(taskStatus.task.id, successorIdDict) - skippedIds:
+                skippedIds.add(skippedId)
+                readyTasks.finished(executionPlan.task(skippedId))
+                if skippedId in statusDict:
+                    statusDict[skippedId].state = "skipped"
+                    finishedCount += 1
+    finally:
+        _shutdownPool(pool)
+
+    taskStatusList = [statusDict[x] for x in sorted(statusDict)]
+    stateCounts = dict((state, len([x for x in taskStatusList if x.state == state])) for state in ("done", "failed", "skipped"))
+    print "%d commands done, %d failed, %d skipped in %.2f seconds." % (stateCounts["done"], stateCounts["failed"], stateCounts["skipped"], time.time()-startTime)
+    return taskStatusList
+
+
+def _runTask(taskStatus, resultQueue):
+    """
+    Run a task's command and put its status on the given queue.  Called from
+    a worker thread.  The status is always put on the queue, whatever goes
+    wrong, as runPlan waits for it.
+    """
+    startTime = time.time()
+    try:
+        try:
+            taskStatus.returnCode = depends_output_recipe.streamCommand(['bash', '-c', " ".join(taskStatus.commandList)], taskStatus.output.writeLines, taskStatus.output.usage)
+            taskStatus.state = "done" if taskStatus.returnCode == 0 else "failed"
+        except Exception, err:
+            taskStatus.state = "failed"
+            # The output itself may be what failed (a log file that can't be written, say)
+            try:
+                taskStatus.output.writeLines([str(err) + "\n"])
+            except Exception:
+                with depends_output_recipe.consoleLock:
+                    print "%s: %s" % (taskStatus.output.description, err)
+        taskStatus.output.returnCode = taskStatus.returnCode
+        try:
+            taskStatus.output.close()
+        except Exception, err:
+            with depends_output_recipe.consoleLock:
+                print "%s: %s" % (taskStatus.output.description, err)
+    finally:
+        taskStatus.seconds = time.time() - startTime
+        resultQueue.put(taskStatus)
+
+
+def _releaseSuccessors(taskId, successorIdDict, waitingCounts):
+    """
+    Note that the given task is done, returning the ids of the tasks that
+    were only waiting for it.
+    """
+    readyIds = list()
+    for successorId in successorIdDict[taskId]:
+        waitingCounts[successorId] -= 1
+        if not waitingCounts[successorId]:
+            readyIds.append(successorId)
+    return readyIds
+
+
+def _allSuccessors(taskId, successorIdDict):
+    """
+    The ids of every task depending on the given task, directly or not.
+    """
+    successorIds = set()
+    stack = list(successorIdDict[taskId])
+    while stack:
+        successorId = stack.pop()
+        if successorId not in successorIds:
+            successorIds.add(successorId)
+            stack.extend(successorIdDict[successorId])
+    return successorIds
+
+
+def _workerPool(workerCount):
+    """
+    A pool of the given number of worker threads.
+    """
+    if concurrent is not None:
+        return concurrent.futures.ThreadPoolExecutor(workerCount)
+    return multiprocessing.pool.ThreadPool(workerCount)
+
+
+def _submit(pool, function, *args):
+    """
+    Call the given function with the given arguments in the pool.
+    """
+    if concurrent is not None:
+        pool.submit(function, *args)
+    else:
+        pool.apply_async(function, args)
+
+
+def _shutdownPool(pool):
+    """
+    """
+    if concurrent is not None:
+        pool.shutdown()
+    else:
+        pool.close()
+        pool.join()
+
+
+def _shellQuote(string):
+    """
+    The given string quoted for the shell.
+    """
+    return "'" + string.replace("'", "'\\''") + "'"